@@ -13,6 +13,8 @@ import seaborn as sns
 
 import config
 import measurements
+import metricstore
+import results
 import utilities
 
 RESULTS_DIR = joinpath(config.DATA, "Results")
@@ -22,20 +24,22 @@ tcolnames = [f"t{i}" for i in trange]
 
 keep_only = trange>100
 
+# loaders below query the results store (see results.py); each returns one
+# row per simulation with a uname column and one t{time} column per timestep
 def load_gsdata_for(popsize, dval):
-    return pd.read_csv(joinpath(RESULTS_DIR, f"{popsize}-d{dval}.csv"))
+    return results.wide("tgs", popsize, dval)
 
 def load_areadata_for(popsize, dval):
-    return pd.read_csv(joinpath(RESULTS_DIR, f"areas-{popsize}-d{dval}.csv"))
+    return results.wide("area", popsize, dval)
     
 def load_areavardata_for(popsize, dval):
-    return pd.read_csv(joinpath(RESULTS_DIR, f"var-area-{popsize}-d{dval}.csv"))
+    return results.wide("var-area", popsize, dval)
 
 def load_speeddata_for(popsize, dval):
-    return pd.read_csv(joinpath(RESULTS_DIR, f"speed-{popsize}-d{dval}.csv"))
+    return results.wide("speed", popsize, dval)
 
 def load_eedata_for(popsize, dval):
-    return pd.read_csv(joinpath(RESULTS_DIR, f"ee-{popsize}-d{dval}.csv"))
+    return results.wide("ee", popsize, dval)
 
 def get_avg_val(df):
     dfs = df[tcolnames]
@@ -59,22 +63,19 @@ def make_violinplot(fn, ydesc, fig=None, ax=None, palette="pastel"):
         fn: what function to use to compute data for plotting
         ydesc: str description of wth you are measuring
     """
-    records = []
+    values, depths, pop_sizes = [], [], []
 
     for pop_size in config.ANALYSE_POP_SIZES:
         for depth in config.ANALYSE_DEPTHS:
-            files = measurements._files_for(pop_size, depth)
-            for f in files:
-                data = measurements._read_data(f)  # Should be n×2×500 array
-                points = fn(data)
-                for s in points:
-                    records.append({
-                        ydesc: s,
-                        "depth": depth,
-                        "pop_size": pop_size
-                    })
-
-    df = pd.DataFrame.from_records(records)
+            # cached in the metric store, recomputed only if data changed
+            points = metricstore.get(fn, pop_size, depth)
+            values.append(points)
+            depths.append(np.full(len(points), depth))
+            pop_sizes.append(np.full(len(points), pop_size))
+
+    df = pd.DataFrame({ydesc: np.concatenate(values),
+                        "depth": np.concatenate(depths),
+                        "pop_size": np.concatenate(pop_sizes)})
 
     # Plot
 
@@ -2,11 +2,16 @@
 # Dec 16, 2024
 # pminasandra.github.io
 
+import math
+import multiprocessing as mp
 import random
 from os.path import join as joinpath
 import os
+import shutil
+import subprocess
 
 import matplotlib
+matplotlib.use("Agg") # offscreen, so this runs on headless nodes too
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import numpy as np
@@ -15,15 +20,22 @@ import config
 import measurements
 import voronoi
 
-matplotlib.use("TkAgg")
+FRAME_INTERVAL = 50 # ms
+
+def _draw_bounds(ax):
+    ax.set_xlim((-0.1, 1.1))
+    ax.set_ylim((-0.1, 1.1))
+    ax.axvline(0, linestyle="dotted", linewidth=0.3)
+    ax.axvline(1, linestyle="dotted", linewidth=0.3)
+    ax.axhline(0, linestyle="dotted", linewidth=0.3)
+    ax.axhline(1, linestyle="dotted", linewidth=0.3)
 
 def animate_data(datasets, tmin=0, tmax=None, delay=None):
 
     if tmax is None:
         tmax = datasets[0].shape[2]
     fig, ax = plt.subplots(figsize=(4.0, 4.0), dpi=300)
-    ax.set_xlim((-0.1, 1.1))
-    ax.set_ylim((-0.1, 1.1))
+    _draw_bounds(ax)
 
     scs = []
     locs = []
@@ -47,12 +59,6 @@ def animate_data(datasets, tmin=0, tmax=None, delay=None):
 
         for sc, loc in zip(scs, locs):
             sc.set_offsets(loc)
-        ax.set_xlim((-0.1, 1.1))
-        ax.set_ylim((-0.1, 1.1))
-        ax.axvline(0, linestyle="dotted", linewidth=0.3)
-        ax.axvline(1, linestyle="dotted", linewidth=0.3)
-        ax.axhline(0, linestyle="dotted", linewidth=0.3)
-        ax.axhline(1, linestyle="dotted", linewidth=0.3)
 
         return ax,
 
@@ -62,52 +68,188 @@ def animate_data(datasets, tmin=0, tmax=None, delay=None):
                             blit=False)
     return ani
 
-def animate_area_hists(datasets, tmin=0, tmax=None, delay=None):
+AREA_HIST_BINS = np.logspace(np.log10(1e-8), np.log10(1),  50)
+
+def animate_area_hists(hist_counts, bins=AREA_HIST_BINS, tmin=0, tmax=None,
+                        delay=None):
+    """
+    Animates histograms of Voronoi areas over time, one panel per depth.
+    Args:
+        hist_counts (list of np.ndarray, T×(len(bins)-1)): precomputed counts,
+                    e.g., from area_hist_tensor(...), one per depth.
+        bins (np.ndarray): bin edges used for the counts
+    """
 
     if tmax is None:
-        tmax = len(datasets[0])
-    fig, ax = plt.subplots(1, len(datasets), sharey=True, figsize=(4.0, 4.0), dpi=300)
+        tmax = hist_counts[0].shape[0]
+    fig, ax = plt.subplots(1, len(hist_counts), sharey=True, figsize=(4.0, 4.0), dpi=300)
+    ax = np.atleast_1d(ax)
     for i, a in enumerate(ax):
         a.set_xscale('log')
         a.set_xlabel('Area of Voronoi polygons')
         a.set_title(f'$d_{i}$')
 
-    bins = np.logspace(np.log10(1e-8), np.log10(1),  50)
-    hists = []
-    j = 0
-    for data in datasets:
-        hists.append(ax[j].hist(data[0], bins=bins))
-        ax[j].set_xlim((1e-8, 1))
-        ax[j].set_ylim((0, 350))
-        j += 1
+    bars = []
+    for counts, a in zip(hist_counts, ax):
+        bars.append(a.bar(bins[:-1], counts[tmin], width=np.diff(bins),
+                            align="edge"))
+        a.set_xlim((1e-8, 1))
+        a.set_ylim((0, 350))
 
     if delay is None:
         delay = 0
     def update(i):
-        if i <= delay*1000/50:
+        if i <= delay*1000/FRAME_INTERVAL:
             return ax,
         print(i, end="\033[K\r")
-        for j in range(len(datasets)):
-            hists[j] = datasets[j][i - int(delay*1000/50)]
-
-        for hist_dat, a in zip(hists, ax):
-            a.cla()
-            a.hist(hist_dat, bins=bins)
-            a.set_xlim((1e-8, 1))
-            a.set_ylim((0, 350))
-        for i, a in enumerate(ax):
-            a.set_xscale('log')
-            a.set_xlabel('Area of Voronoi polygons')
-            a.set_title(f'$d_{i}$')
+        t = tmin + i - int(delay*1000/FRAME_INTERVAL)
+        # only bar heights change between frames
+        for counts, bar_container in zip(hist_counts, bars):
+            for rect, height in zip(bar_container, counts[t]):
+                rect.set_height(height)
 
         return ax,
 
     ani = FuncAnimation(fig, update,
-                    frames=tmax-tmin+int(delay*1000/50), 
-                    interval=50, 
+                    frames=tmax-tmin+int(delay*1000/FRAME_INTERVAL),
+                    interval=FRAME_INTERVAL,
                     blit=False)
     return ani
 
+class FrameRenderer:
+    """
+    Offscreen renderer for trajectory frames. The figure and all its artists
+    are built once; rendering a frame only moves the points and redraws.
+    Args:
+        num_datasets (int): how many trajectories are drawn together
+        figsize (tuple), dpi (float): as in plt.subplots(...)
+    """
+
+    def __init__(self, num_datasets, figsize=(4.0, 4.0), dpi=300):
+        self.fig, self.ax = plt.subplots(figsize=figsize, dpi=dpi)
+        _draw_bounds(self.ax)
+        self.scs = [self.ax.scatter([], [], s=0.3, alpha=0.6)\
+                        for _ in range(num_datasets)]
+        self.fig.canvas.draw()
+        self.width, self.height = self.fig.canvas.get_width_height()
+
+    def render(self, locs):
+        """
+        Args:
+            locs (list of np.ndarray, n×2): one frame per dataset
+        Returns:
+            np.ndarray (height×width×3, uint8): the rendered frame
+        """
+        for sc, loc in zip(self.scs, locs):
+            sc.set_offsets(loc)
+        self.fig.canvas.draw()
+        return np.asarray(self.fig.canvas.buffer_rgba())[:, :, :3].copy()
+
+    def close(self):
+        plt.close(self.fig)
+
+
+def _render_chunk(frames, figsize, dpi):
+    """
+    Worker: renders a run of frames.
+    Args:
+        frames (list of np.ndarray, n×2×k): the k frames of each dataset
+    """
+    renderer = FrameRenderer(len(frames), figsize=figsize, dpi=dpi)
+    images = [renderer.render([data[:,:,i] for data in frames])\
+                for i in range(frames[0].shape[2])]
+    renderer.close()
+    return images
+
+def _render_chunk_star(args):
+    return _render_chunk(*args)
+
+
+def _gif_writer(filename, fps):
+    # fallback when ffmpeg is missing; Pillow ships with matplotlib
+    from PIL import Image
+    images = []
+
+    def write(image):
+        images.append(Image.fromarray(image).convert("P", palette=Image.ADAPTIVE))
+
+    def close():
+        images[0].save(filename, save_all=True, append_images=images[1:],
+                        duration=int(1000/fps), loop=0)
+    return write, close
+
+def _ffmpeg_writer(filename, width, height, fps):
+    cmd = ["ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}", "-r", str(fps), "-i", "-"]
+    if not filename.endswith(".gif"):
+        cmd.extend(["-pix_fmt", "yuv420p"])
+    cmd.append(filename)
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write(image):
+        proc.stdin.write(image.tobytes())
+
+    def close():
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed writing {filename}")
+    return write, close
+
+
+def render_animation(datasets, name, tmin=0, tmax=None, delay=None,
+                        workers=None, figsize=(4.0, 4.0), dpi=300):
+    """
+    Renders the same movie as animate_data(...) without a display, in
+    parallel. Frames are split into runs, each run is rendered by a worker
+    process, and the frames are piped to ffmpeg in order (or, without ffmpeg,
+    assembled into a GIF with Pillow).
+    Args:
+        datasets (list of array-likes, n×2×T): trajectories to draw together
+        name (str): filename in FIGURES/animations, e.g., "d1.mp4" or "d1.gif"
+        tmin, tmax (int): frames to draw
+        delay (float): seconds to hold the first frame for
+        workers (int): number of rendering processes, default all cores
+    """
+    if tmax is None:
+        tmax = datasets[0].shape[2]
+    if delay is None:
+        delay = 0
+
+    times = [tmin]*int(delay*1000/FRAME_INTERVAL) + list(range(tmin, tmax))
+    if workers is None:
+        workers = os.cpu_count()
+    chunk_len = max(1, math.ceil(len(times)/(4*workers)))
+    chunks = [times[i:i+chunk_len] for i in range(0, len(times), chunk_len)]
+    jobs = [([np.asarray(data[:,:,ts]) for data in datasets], figsize, dpi)\
+                for ts in chunks]
+
+    anim_dir = joinpath(config.FIGURES, "animations")
+    os.makedirs(anim_dir, exist_ok=True)
+    filename = joinpath(anim_dir, name)
+    fps = 1000/FRAME_INTERVAL
+
+    probe = FrameRenderer(len(datasets), figsize=figsize, dpi=dpi)
+    width, height = probe.width, probe.height
+    probe.close()
+    if shutil.which("ffmpeg") is not None:
+        write, close = _ffmpeg_writer(filename, width, height, fps)
+    elif name.endswith(".gif"):
+        write, close = _gif_writer(filename, fps)
+    else:
+        raise RuntimeError(f"ffmpeg is needed to write {name}, or ask for a .gif")
+
+    with mp.Pool(workers) as pool:
+        # imap keeps the order and only holds a few chunks in memory
+        for i, images in enumerate(pool.imap(_render_chunk_star, jobs)):
+            for image in images:
+                write(image)
+            print(f"rendered {min((i+1)*chunk_len, len(times))} of {len(times)} frames",
+                    end="\033[K\r")
+    close()
+    print()
+
+
 def save_animation(anim, name):
     anim_dir = joinpath(config.FIGURES, "animations")
     os.makedirs(anim_dir, exist_ok=True)
@@ -115,49 +257,68 @@ def save_animation(anim, name):
     anim.save(joinpath(anim_dir, name), writer="ffmpeg")
 
 def _extract_areas(dataset):
+    """
+    Voronoi areas of every agent in every frame.
+    Returns:
+        np.ndarray, T×n
+    """
 
-    areas = []
     _, _, k = dataset.shape
+    areas = np.empty((k, dataset.shape[0]))
     for i in range(k):
-        dataslice = dataset[:,:,i]
+        dataslice = np.asarray(dataset[:,:,i])
         vor = voronoi.get_bounded_voronoi(dataslice)
-        areasslice = voronoi.get_areas(dataslice, vor)
-        areas.append(areasslice)
+        areas[i] = voronoi.get_areas(dataslice, vor)
 
     return areas
 
-def _joinlists(lol1, lol2):
-    lol_res = []
-    for x, y in zip(lol1, lol2):
-        lol_res.append(list(x)+list(y))
+def _area_hist_counts(key, bins):
+    """
+    Worker: histogram counts of areas for every frame of one trajectory,
+    binned all at once.
+    Returns:
+        np.ndarray (int), T×(len(bins)-1)
+    """
+    areas = _extract_areas(measurements._read_data(key))
+    num_frames, nbins = areas.shape[0], len(bins) - 1
+
+    # same bin convention as np.histogram: right edge of the last bin included
+    bin_idx = np.searchsorted(bins, areas, side="right") - 1
+    bin_idx[areas == bins[-1]] = nbins - 1
+    valid = (bin_idx >= 0) & (bin_idx < nbins)
+
+    frame_idx = np.broadcast_to(np.arange(num_frames)[:, np.newaxis], areas.shape)
+    flat = frame_idx[valid]*nbins + bin_idx[valid]
+    return np.bincount(flat, minlength=num_frames*nbins).reshape(num_frames, nbins)
 
-    return lol_res
+def area_hist_tensor(keys, bins=AREA_HIST_BINS, workers=None):
+    """
+    Histogram counts of Voronoi areas pooled over many trajectories, for all
+    frames at once. Trajectories are processed in parallel.
+    Args:
+        keys (list): trajectory keys, e.g., from measurements._files_for(...)
+        bins (np.ndarray): bin edges
+        workers (int): number of processes, default all cores
+    Returns:
+        np.ndarray (int), T×(len(bins)-1), T being the shortest run's length
+    """
+    with mp.Pool(workers) as pool:
+        counts = pool.starmap(_area_hist_counts, [(key, bins) for key in keys])
+
+    # runs of different lengths are pooled over the frames they share
+    num_frames = min(c.shape[0] for c in counts)
+    return np.sum([c[:num_frames] for c in counts], axis=0)
 
 if __name__ == "__main__":
-    area_datasets = [[], []]
-    for j in random.sample(range(500), 50):
-        data = []
-        for i in [0, 1]:
-            tgt_file = measurements._files_for(50, i)
-            tgt_file = list(tgt_file)[j]
-            tgt_file = measurements._read_data(tgt_file)
-            data.append(tgt_file)
-
-        areas_data = []
-        for dataset in data:
-            areas_data.append(_extract_areas(dataset))
-
-
-        if len(area_datasets[0]) == 0:
-            area_datasets[0] = areas_data[0]
-            area_datasets[1] = areas_data[1]
-        else:
-#            print(len(area_datasets[0][0]))
-# this joining is fully improper
-# plan this properly
-            area_datasets[0] = _joinlists(area_datasets[0], areas_data[0])
-            area_datasets[1] = _joinlists(area_datasets[1], areas_data[1])
+    depths = [0, 1]
+    files = [measurements._files_for(50, i) for i in depths]
+    # same replicates (i.e., same initial conditions) at both depths
+    chosen = random.sample(range(min(len(f) for f in files)), 50)
+
+    hist_counts = []
+    for files_ in files:
+        hist_counts.append(area_hist_tensor([files_[j] for j in chosen]))
 
     print("Initiating animations")
-    anim = animate_area_hists(area_datasets, delay=0.5)
+    anim = animate_area_hists(hist_counts, delay=0.5)
     save_animation(anim, f"hist_50.gif")
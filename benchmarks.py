@@ -0,0 +1,250 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides a benchmark suite for the simulation hot path, at two levels:
+    micro: voronoi.get_bounded_voronoi, get_areas, polygon_area,
+           movement.gradient_for_id, everyone_do_grad_descent,
+           recursive_reasoning and its linearised approximation
+           (linearised_reasoning), for a range of population sizes and depths;
+    macro: a short SelfishHerd.run.
+All inputs are drawn from fixed seeds, so runs on different commits time the
+same work. Results are written as JSON (along with the commit they were run
+on), and two such files can be compared with a regression threshold:
+
+    python3 benchmarks.py run --suite micro
+    python3 benchmarks.py compare old.json new.json --threshold 0.1
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import os.path
+from os.path import join as joinpath
+import platform
+import random
+import subprocess
+import time
+import timeit
+
+import numpy as np
+import scipy
+
+import config
+import movement
+import selfishherd
+import voronoi
+
+MICRO_POP_SIZES = [10, 25, 50, 87, 100]
+MICRO_DEPTHS = [0, 1, 2, 3]
+MACRO_CASES = [(25, 0), (25, 1), (50, 1)] # (pop size, depth)
+MACRO_STEPS = 10
+SEED = 42
+
+
+def _locations(n, seed=SEED):
+    return np.random.default_rng(seed).uniform(0.01, 0.99, size=(n, 2))
+
+
+def micro_cases(pop_sizes=None, depths=None):
+    """
+    Returns:
+        list of (name, params, fn), fn taking no arguments
+    """
+    if pop_sizes is None:
+        pop_sizes = MICRO_POP_SIZES
+    if depths is None:
+        depths = MICRO_DEPTHS
+
+    cases = []
+    for n in pop_sizes:
+        locs = _locations(n)
+        vor = voronoi.get_bounded_voronoi(locs)
+        areas = voronoi.get_areas(locs, vor)
+        polygon = vor.vertices[vor.regions[vor.point_region[0]]]
+
+        cases.extend([
+            (f"micro/get_bounded_voronoi/n={n}", dict(n=n),
+                lambda locs=locs: voronoi.get_bounded_voronoi(locs)),
+            (f"micro/get_areas/n={n}", dict(n=n),
+                lambda locs=locs, vor=vor: voronoi.get_areas(locs, vor)),
+            (f"micro/polygon_area/n={n}", dict(n=n),
+                lambda polygon=polygon: voronoi.polygon_area(polygon)),
+            (f"micro/gradient_for_id/n={n}", dict(n=n),
+                lambda locs=locs, vor=vor, areas=areas:\
+                        movement.gradient_for_id(0, locs, vor, areas)),
+            (f"micro/everyone_do_grad_descent/n={n}", dict(n=n),
+                lambda locs=locs, vor=vor: movement.everyone_do_grad_descent(locs, vor)),
+        ])
+        for depth in depths:
+            cases.append((f"micro/recursive_reasoning/n={n},d={depth}",
+                            dict(n=n, depth=depth),
+                            lambda locs=locs, vor=vor, depth=depth:\
+                                movement.recursive_reasoning(locs, vor, depth, locs)))
+            cases.append((f"micro/linearised_reasoning/n={n},d={depth}",
+                            dict(n=n, depth=depth),
+                            lambda locs=locs, vor=vor, depth=depth:\
+                                movement.linearised_reasoning(locs, vor, depth)))
+    return cases
+
+
+def macro_cases(cases=None, steps=None):
+    """
+    Returns:
+        list of (name, params, fn), fn taking no arguments
+    """
+    if cases is None:
+        cases = MACRO_CASES
+    if steps is None:
+        steps = MACRO_STEPS
+
+    def _run(n, depth):
+        herd = selfishherd.SelfishHerd(n, depth, _locations(n), seed=SEED,
+                                        record="all")
+        herd.run(steps)
+
+    return [(f"macro/run/n={n},d={depth},steps={steps}",
+                dict(n=n, depth=depth, steps=steps),
+                lambda n=n, depth=depth: _run(n, depth))\
+            for n, depth in cases]
+
+
+def time_case(fn, repeats=5, min_time=0.2):
+    """
+    Times fn, calling it often enough per repeat to last about min_time.
+    Returns:
+        dict with keys best, median (seconds per call), number, repeats
+    """
+    random.seed(SEED)
+    timer = timeit.Timer(fn, timer=time.perf_counter)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time/10 else 2
+
+    times = [elapsed/number] + [timer.timeit(number)/number\
+                                    for _ in range(repeats - 1)]
+    return dict(best=min(times), median=float(np.median(times)),
+                number=number, repeats=repeats)
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), len(status.stdout.strip()) > 0
+
+
+def run(cases, repeats=5, min_time=0.2, name_filter=None, verbose=True):
+    """
+    Times each case.
+    Args:
+        cases (list): from micro_cases(...) and/or macro_cases(...)
+        name_filter (str): only run cases whose names contain this
+    Returns:
+        dict, ready to be dumped as JSON
+    """
+    commit, dirty = _git_commit()
+    results = {}
+    for name, params, fn in cases:
+        if name_filter is not None and name_filter not in name:
+            continue
+        results[name] = dict(time_case(fn, repeats=repeats, min_time=min_time),
+                                params=params)
+        if verbose:
+            print(f"{name:<52}{results[name]['best']*1e3:>12.3f} ms")
+
+    return dict(commit=commit,
+                dirty=dirty,
+                timestamp=dt.datetime.now().isoformat(timespec="seconds"),
+                machine=platform.node(),
+                processor=platform.processor() or platform.machine(),
+                python=platform.python_version(),
+                numpy=np.__version__,
+                scipy=scipy.__version__,
+                results=results)
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Compares two benchmark results on the cases they share.
+    Args:
+        old, new (dict): as returned by run(...) (or loaded from its JSON)
+        threshold (float): slow-downs beyond this fraction are regressions
+    Returns:
+        list of (name, old best, new best, ratio, regressed)
+    """
+    rows = []
+    for name in sorted(set(old["results"]) & set(new["results"])):
+        old_best = old["results"][name]["best"]
+        new_best = new["results"][name]["best"]
+        ratio = new_best/old_best
+        rows.append((name, old_best, new_best, ratio, ratio > 1 + threshold))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot path.")
+    parser.add_argument("action", choices=["run", "compare"])
+    parser.add_argument("files", nargs="*",
+                        help="With compare, the old and new result files")
+    parser.add_argument("--suite", choices=["micro", "macro", "all"], default="all")
+    parser.add_argument("--pop-sizes", type=int, nargs="*", default=MICRO_POP_SIZES)
+    parser.add_argument("--depths", type=int, nargs="*", default=MICRO_DEPTHS)
+    parser.add_argument("--steps", type=int, default=MACRO_STEPS,
+                        help="Steps per macro benchmark run")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--filter", default=None,
+                        help="Only run cases whose names contain this")
+    parser.add_argument("--output", default=None,
+                        help="Where to write results (default: under config.BENCHMARK_DIR)")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="With compare, relative slow-down counted as a regression")
+    args = parser.parse_args()
+
+    if args.action == "run":
+        cases = []
+        if args.suite in ("micro", "all"):
+            cases.extend(micro_cases(args.pop_sizes, args.depths))
+        if args.suite in ("macro", "all"):
+            cases.extend(macro_cases(steps=args.steps))
+        res = run(cases, repeats=args.repeats, name_filter=args.filter)
+
+        output = args.output
+        if output is None:
+            commit = (res["commit"] or "nocommit")[:10] + ("-dirty" if res["dirty"] else "")
+            output = joinpath(config.BENCHMARK_DIR,
+                                f"{commit}-{dt.datetime.now():%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as file_obj:
+            json.dump(res, file_obj, indent=2)
+        print(f"results written to {output}")
+
+    elif args.action == "compare":
+        if len(args.files) != 2:
+            raise SystemExit("compare needs two result files: old and new")
+        with open(args.files[0]) as file_obj:
+            old = json.load(file_obj)
+        with open(args.files[1]) as file_obj:
+            new = json.load(file_obj)
+
+        print(f"old: {old['commit']}, new: {new['commit']}")
+        rows = compare(old, new, threshold=args.threshold)
+        for name, old_best, new_best, ratio, regressed in rows:
+            print(f"{name:<52}{old_best*1e3:>11.3f}{new_best*1e3:>11.3f} ms"
+                    f"{ratio:>8.2f}x{'  REGRESSION' if regressed else ''}")
+        num_regressed = sum(row[4] for row in rows)
+        print(f"{len(rows)} cases compared, {num_regressed} regressions"
+                f" beyond {args.threshold:.0%}")
+        if num_regressed > 0:
+            raise SystemExit(1)
@@ -0,0 +1,145 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides a report on common random numbers for comparisons across depths of
+reasoning.
+
+Ordinarily, every gradient evaluation in movement.gradient_for_id flips its
+own coin (random.random()) for which direction to step in, so two runs from
+the same initial locations at different depths see unrelated coins. With
+common random numbers (movement.AgentStreams), agent i at step t instead
+draws its coins, in order, from a generator seeded by (seed, t, i). Herds that share a seed (replicate r at
+every depth, see config.COMMON_RANDOM_NUMBERS) then share their coins: at
+depth 0 agent i uses the first coin of its stream, and at depth 1 everyone's
+predicted move uses that same first coin. Differences between depths become
+paired differences, with less variance.
+
+Run this file to measure how much variance this takes out of depth
+comparisons of typical group size and Voronoi area:
+    python3 commonrandom.py --pop-size 25 --depths 0 1 --replicates 20 --tmax 100
+"""
+
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+import config
+import observers
+import selfishherd
+import voronoi
+
+
+def _run_replicate(n, depth, init_locs, seed, common_random, tmax, timesteps, eps):
+    herd = selfishherd.SelfishHerd(n, depth, init_locs, seed=seed,
+                                    record=timesteps, common_random=common_random)
+    herd.run(tmax)
+    tgs_fn = observers.METRICS["tgs"][0]
+    area_fn = observers.METRICS["area"][0]
+    records = herd.records
+    tgs, area = [], []
+    for index, t in enumerate(herd.times):
+        if t not in timesteps:
+            continue
+        locs = records[:, :, index]
+        vor = voronoi.get_bounded_voronoi(locs)
+        tgs.append(tgs_fn(locs, vor, None, eps=eps))
+        area.append(area_fn(locs, vor, None))
+    return np.mean(tgs), np.mean(area)
+
+
+def variance_report(n, depths, replicates=20, tmax=100, timesteps=None,
+                        eps=0.02, seed=None, processes=None):
+    """
+    Runs every replicate at every depth twice: with independent coins per run
+    (as main.py does without common random numbers), and with common random
+    numbers. Replicate r starts from the same initial locations in both. For
+    each depth beyond the first, compares the variance of the per-replicate
+    difference from the first depth in typical group size and median area,
+    each averaged over timesteps.
+    Args:
+        n (int): population size
+        depths (list of int): at least two; differences are taken from
+                    depths[0]
+        timesteps (iterable): default the second half of the run, every 5 steps
+        eps (float): DBSCAN threshold for typical group size
+        seed (int): seed for initial locations and coins, fresh if not given
+        processes (int): pool size
+    Returns:
+        list of dicts with keys depth, metric, mean_diff (common random
+        numbers), var_independent, var_common and reduction (the ratio of the
+        two variances: how many times fewer replicates give the same
+        confidence interval)
+    """
+    if len(depths) < 2:
+        raise ValueError("need at least two depths to compare")
+    if timesteps is None:
+        timesteps = range(tmax//2, tmax + 1, 5)
+    timesteps = frozenset(timesteps)
+
+    # row 0: common seeds; row k: independent seeds for depths[k - 1]
+    seeds = np.random.SeedSequence(seed).generate_state(
+                    (len(depths) + 1)*replicates, dtype=np.uint64)\
+                    .reshape(len(depths) + 1, replicates)
+    rng = np.random.default_rng(seed)
+    inits = [rng.uniform(size=(n, 2)) for _ in range(replicates)]
+
+    args = []
+    for depth_index, depth in enumerate(depths):
+        for r in range(replicates):
+            args.append((n, depth, inits[r], int(seeds[depth_index + 1, r]),
+                            False, tmax, timesteps, eps))
+            args.append((n, depth, inits[r], int(seeds[0, r]),
+                            True, tmax, timesteps, eps))
+    with mp.Pool(processes) as pool:
+        outcomes = pool.starmap(_run_replicate, args)
+
+    # depth, replicate, independent/common, tgs/area
+    outcomes = np.array(outcomes).reshape(len(depths), replicates, 2, 2)
+
+    rows = []
+    for depth_index in range(1, len(depths)):
+        for m, metric in enumerate(("tgs", "area")):
+            diffs = outcomes[depth_index, :, :, m] - outcomes[0, :, :, m]
+            var_independent = float(np.var(diffs[:, 0], ddof=1))
+            var_common = float(np.var(diffs[:, 1], ddof=1))
+            if var_common > 0:
+                reduction = var_independent/var_common
+            else:
+                reduction = np.inf if var_independent > 0 else 1.0
+            rows.append(dict(depth=depths[depth_index], metric=metric,
+                                mean_diff=float(diffs[:, 1].mean()),
+                                var_independent=var_independent,
+                                var_common=var_common,
+                                reduction=reduction))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the variance reduction from common random numbers.")
+    parser.add_argument("--pop-size", type=int, default=25)
+    parser.add_argument("--depths", type=int, nargs="*", default=[0, 1])
+    parser.add_argument("--replicates", type=int, default=20)
+    parser.add_argument("--tmax", type=int, default=100)
+    parser.add_argument("--eps", type=float, default=0.02,
+                        help="DBSCAN threshold for typical group size")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    rows = variance_report(args.pop_size, args.depths, replicates=args.replicates,
+                            tmax=args.tmax, eps=args.eps, seed=args.seed,
+                            processes=args.processes)
+    print(f"n={args.pop_size}, {args.replicates} replicates, t={args.tmax//2}-{args.tmax};"
+            f" differences from d{args.depths[0]}")
+    print(f"{'depth':>5}{'metric':>8}{'mean diff':>12}{'var indep':>12}"
+            f"{'var common':>12}{'reduction':>11}{'repeats':>9}")
+    for row in rows:
+        print(f"{row['depth']:>5}{row['metric']:>8}{row['mean_diff']:>12.4f}"
+                f"{row['var_independent']:>12.3e}{row['var_common']:>12.3e}"
+                f"{row['reduction']:>10.2f}x"
+                f"{int(np.ceil(config.NUM_REPEATS/row['reduction'])):>9}")
+    print(f"repeats: replicates with common random numbers that match the precision"
+            f" of config.NUM_REPEATS={config.NUM_REPEATS} independent ones")
@@ -13,6 +13,18 @@ FIGURES = os.path.join(PROJECTROOT, "Figures")
 
 formats=['png', 'pdf', 'svg']
 
+# Trajectory storage (see trajstore.py)
+TRAJ_STORE = "npy" # "npy" (also reads legacy pickles), "pickle" or "hdf5"
+TRAJ_STORAGE_DTYPE = "float64" # dtype trajectories are saved with: "float64",
+                                # "float32" or "float16"; runs are always
+                                # simulated in float64
+TRAJ_ARCHIVE = "sim_results.h5"
+RESULT_PIPELINE = "files" # or "writer": main.py's workers hand trajectories to
+                          # one process that appends them to TRAJ_ARCHIVE, see writer.py
+WRITER_QUEUE_SIZE = 8 # trajectories waiting for the writer, at most
+WRITER_BATCH_SIZE = 4 # trajectories written per batch
+WRITER_MANIFEST = os.path.splitext(TRAJ_ARCHIVE)[0] + "-manifest.jsonl"
+
 # Program flow
 RUN_SIMS = False
 CONDUCT_HUNGERGAMES = False
@@ -26,6 +38,15 @@ GRAD_DESC_DY = 0.005
 GRAD_DESC_MAX_STEP_SIZE = 0.05
 GRAD_DESC_MULTPL_FACTOR = 0.1
 
+REASONING_TOLERANCE = None # e.g. 1e-6 to stop anticipating at fixed points
+REASONING_EXIT = "herd" # or "agent", see movement.recursive_reasoning
+ANTICIPATION_ENGINE = "exact" # or "linear", see movement.linearised_reasoning
+ANTICIPATION_NEIGHBOURHOOD = None # exact; or ("hops", 2) / ("radius", 0.1) to
+                                  # tessellate only neighbours, for large herds
+COMMON_RANDOM_NUMBERS = False # replicate r shares its random gradient directions
+                              # across depths, see commonrandom.py
+TESSELLATION_CACHE_SIZE = 8 # configurations kept by voronoi.TessellationCache
+
 # Strucuring 
 POP_S_DOR = {
 10: [0, 1, 2, 3],
@@ -38,6 +59,29 @@ POP_S_DOR = {
 } 
 NUM_REPEATS = 500
 TMAX = 500
+RECORD_FRAMES = "all" # or a stride (int), a list of frames
+                      # (e.g. selfishherd.frames_for(range(0, 501, 20))), or "final"
+OBSERVE_METRICS = [] # e.g. ["tgs", "area"], computed during runs, see observers.py
+OBSERVE_TIMESTEPS = range(0, 501, 20)
+OBSERVE_EPS = 0.02
+SAVE_TRAJECTORIES = True # set False to keep only the observed metrics
+
+# Parameter sweeps, see sweep.py
+SWEEP_DIR = os.path.join(DATA, "Sweeps")
+SWEEP_GRID = {
+    "multpl_factor": [0.05, 0.1, 0.2],
+} # runparams.RunParams field -> values; every combination is run
+
+# Running on several hosts, see jobqueue.py
+JOB_QUEUE_DIR = os.path.join(DATA, "Queue") # must be on a filesystem all hosts share
+JOB_LEASE_SECONDS = 600 # a job whose worker stops renewing is claimed again after this
+JOB_HEARTBEAT_SECONDS = 60
+JOB_MAX_ATTEMPTS = 3
+
+# Per-job logs of batches of runs, see telemetry.py
+TELEMETRY = True
+TELEMETRY_DIR = os.path.join(DATA, "Telemetry") # one log per host
+TELEMETRY_INTERVAL = 60 # seconds between progress records of a running job
 
 # Program flow for hungergames
 POP_S_SMART_GUYS_HG = {
@@ -50,6 +94,13 @@ HUNGERGAMES_TIME_LIMS = (250, 350)
 # Data analysis
 ANALYSE_POP_SIZES = [10, 25, 35, 50, 75, 87, 100]
 ANALYSE_DEPTHS = [0, 1, 2, 3]
+RESULTS_STORE = os.path.join(DATA, "Results", "results.h5")
+METRIC_STORE = os.path.join(DATA, "Results", "metrics.h5")
+METRIC_CACHE = True # per-trajectory memoisation, see metriccache.py
+METRIC_CACHE_DIR = os.path.join(DATA, "Cache", "metrics")
+METRIC_CACHE_MAX_BYTES = 2*1024**3
+BENCHMARK_DIR = os.path.join(DATA, "Benchmarks") # see benchmarks.py
+COST_MODEL = os.path.join(DATA, "Results", "cost_model.json") # see scaling.py
 
 #Miscellaneous
 SUPPRESS_INFORMATIVE_PRINT = False
@@ -1,50 +1,293 @@
 import argparse
 import h5py
+import json
+import multiprocessing as mp
 import os
 import pickle
 from pathlib import Path
+import zlib
 
 import numpy as np
 
 import config
+import trajcodec
+import trajstore
 
-STORAGE_H5 = "sim_results.h5"
+STORAGE_H5 = config.TRAJ_ARCHIVE
+
+PACK_CHUNK_FRAMES = 32 # frames per HDF5 chunk, keeps single-frame reads cheap
 
-# Output HDF5 file
-def pack_data():
-    output_path = Path(STORAGE_H5)
-    outfile = h5py.File(output_path, "w")
 
+checksum = trajstore.checksum
+
+
+def _sources():
+    """
+    *GENERATOR*
+    Yields (group name, dataset name, source file, expected pop size) for
+    every trajectory file under config.DATA that belongs in the archive.
+    """
+    folders = []
     for n, ds in config.POP_S_DOR.items():
         for d in ds:
-            folder = Path(config.DATA) / str(n) / f"d{d}"
-            if not folder.exists():
-                print(f"Skipping missing folder: {folder}")
-                continue
+            folders.append((Path(config.DATA) / str(n) / f"d{d}", f"n_{n}/d{d}", n))
+    folders.append((Path(config.DATA) / "HungerGames", "HungerGames", None))
+
+    # .npy files, and legacy pickles where there is no .npy of the same name
+    store = trajstore.NpyStore(config.DATA)
+    for folder, group, n in folders:
+        if not folder.exists():
+            print(f"Skipping missing folder: {folder}")
+            continue
+        for src_file in store.list(os.path.relpath(folder, config.DATA), "*"):
+            yield group, trajstore.stem(src_file), src_file, n
+
+
+def _compress_chunks(arr, level):
+    """
+    Splits arr into chunks of PACK_CHUNK_FRAMES frames along time and deflates
+    each one, exactly as HDF5's gzip filter would.
+    Returns:
+        chunk shape, list of (offset, compressed bytes)
+    """
+    chunk_t = min(PACK_CHUNK_FRAMES, arr.shape[2])
+    chunk_shape = (arr.shape[0], arr.shape[1], chunk_t)
+    chunks = []
+    for start in range(0, arr.shape[2], chunk_t):
+        block = arr[:, :, start:start+chunk_t]
+        if block.shape[2] < chunk_t:
+            # HDF5 stores edge chunks at full size
+            padded = np.zeros(chunk_shape, dtype=arr.dtype)
+            padded[:, :, :block.shape[2]] = block
+            block = padded
+        chunks.append(((0, 0, start),
+                        zlib.compress(np.ascontiguousarray(block).data, level)))
+    return chunk_shape, chunks
+
+
+def _pack_worker(group, name, src_file, n, known_checksum, level,
+                    codec="gzip", quantum=None, dtype=None):
+    """
+    Runs in a worker process: loads, validates, checksums and compresses one
+    trajectory.
+    Returns:
+        ("packed", dict of what to write), ("unchanged", None) if the
+        archive already holds these contents, or ("error", dict with the
+        source file and what went wrong)
+    """
+    try:
+        # the frames as stored; decimated runs keep their times in metadata
+        arr = trajstore.store_for(str(src_file)).read(str(src_file))
+        if not isinstance(arr, np.ndarray) or arr.ndim != 3 or\
+                (n is not None and arr.shape[0] != int(n)):
+            return "error", dict(src=str(src_file),
+                                    error=f"invalid shape {getattr(arr, 'shape', None)}")
+        arr = np.ascontiguousarray(arr, dtype=dtype)
 
-            group = outfile.require_group(f"n_{n}/d{d}")
+        digest = checksum(arr)
+        if digest == known_checksum:
+            return "unchanged", None
 
-            for pkl_file in folder.glob("*.pkl"):
-                try:
-                    with open(pkl_file, "rb") as f:
-                        arr = pickle.load(f)
+        metadata = trajstore.read_metadata(str(src_file))
+        if metadata is not None and dtype is not None:
+            metadata = dict(metadata, dtype=arr.dtype.name)
+        packed = dict(group=group, name=name, src=str(src_file),
+                        shape=arr.shape, dtype=arr.dtype.str, sha256=digest,
+                        codec=codec, metadata=metadata)
+        if codec == "traj":
+            packed["payload"], packed["header"] = trajcodec.encode(arr,
+                                                    quantum=quantum,
+                                                    level=level)
+        else:
+            packed["chunk_shape"], packed["chunks"] = _compress_chunks(arr, level)
+        return "packed", packed
+    except Exception as e:
+        return "error", dict(src=str(src_file), error=f"{type(e).__name__}: {e}")
 
-                    # Validate shape (optional, remove if not needed)
-                    if not isinstance(arr, np.ndarray) or arr.shape[0] != int(n):
-                        print(f"Invalid shape in {pkl_file}, skipping.")
-                        continue
+def _pack_worker_star(args):
+    return _pack_worker(*args)
 
-                    group.create_dataset(
-                        pkl_file.stem, data=arr, compression="gzip"
-                    )
-                    print(f"added {pkl_file}")
-                except Exception as e:
-                    print(f"Error processing {pkl_file}: {e}")
+
+def _write_packed(outfile, packed, level):
+    """
+    Writes the output of _pack_worker(...) into the open archive, replacing
+    any older dataset of the same name.
+    """
+    group = outfile.require_group(packed["group"])
+    if packed["name"] in group:
+        del group[packed["name"]]
+
+    if packed["codec"] == "traj":
+        # already compressed by trajcodec; store the payload as is
+        dataset = group.create_dataset(packed["name"],
+                        data=np.frombuffer(packed["payload"], dtype=np.uint8))
+        dataset.attrs.update(packed["header"])
+    else:
+        dataset = group.create_dataset(packed["name"],
+                                        shape=packed["shape"],
+                                        maxshape=tuple(packed["shape"][:2]) + (None,),
+                                        dtype=np.dtype(packed["dtype"]),
+                                        chunks=packed["chunk_shape"],
+                                        compression="gzip",
+                                        compression_opts=level)
+        for offset, payload in packed["chunks"]:
+            dataset.id.write_direct_chunk(offset, payload)
+
+    dataset.attrs["sha256"] = packed["sha256"]
+    dataset.attrs["source"] = os.path.basename(packed["src"])
+    if packed["metadata"] is not None:
+        dataset.attrs["metadata"] = json.dumps(packed["metadata"])
+
+
+def _known_checksums(outfile):
+    """
+    Checksums of everything already in the archive, keyed by dataset path.
+    Datasets packed before checksums existed get one computed (and stored) here.
+    """
+    known = {}
+
+    def _collect(path, obj):
+        if isinstance(obj, h5py.Dataset):
+            if "sha256" not in obj.attrs:
+                obj.attrs["sha256"] = checksum(trajcodec.read_dataset(obj))
+            known[path] = obj.attrs["sha256"]
+
+    outfile.visititems(_collect)
+    return known
+
+
+# Output HDF5 file
+def pack_data(append=False, workers=None, level=4, codec="gzip", quantum=None,
+                dtype=None):
+    """
+    Packs all trajectories under config.DATA into the archive. Compression
+    runs in a pool of worker processes; this process is the only one that
+    writes to the HDF5 file.
+    Args:
+        append (bool): keep the existing archive and pack only files whose
+                    contents are not already in it.
+        workers (int): number of compressing processes, default all cores.
+        level (int): gzip level, 0-9.
+        codec (str): "gzip" for plain HDF5 gzip datasets, which can be read
+                    frame by frame, or "traj" for the much smaller
+                    trajcodec format, which is decoded whole on reading.
+        quantum (float): with codec="traj", fixed-point grid spacing for
+                    lossy storage (max error quantum/2, plus rounding to
+                    dtype); None is lossless.
+        dtype (str): store positions as this dtype (see
+                    trajstore.storage_dtype), default as in the source files.
+    Returns:
+        dict mapping source files that could not be packed to what went
+        wrong, empty if all is well
+    """
+    if dtype is not None:
+        dtype = trajstore.storage_dtype(dtype)
+    output_path = Path(STORAGE_H5)
+    outfile = h5py.File(output_path, "a" if append else "w")
+    known = _known_checksums(outfile) if append else {}
+
+    jobs = [(group, name, src_file, n, known.get(f"{group}/{name}"), level,
+                codec, quantum, dtype)\
+                for group, name, src_file, n in _sources()]
+
+    num_added = 0
+    errors = {}
+    with mp.Pool(workers) as pool:
+        for status, packed in pool.imap_unordered(_pack_worker_star, jobs,
+                                                    chunksize=4):
+            if status == "error":
+                errors[packed["src"]] = packed["error"]
+                print(f"Error processing {packed['src']}: {packed['error']}")
+                continue
+            if status == "unchanged":
+                continue
+            _write_packed(outfile, packed, level)
+            num_added += 1
+            print(f"added {packed['src']}")
 
     outfile.close()
-    print(f"All data written to {output_path}")
+    print(f"{num_added} of {len(jobs)} trajectories written to {output_path},"
+            f" {len(errors)} errors.")
+    return errors
+
+
+_verify_file = None
+
+def _verify_worker(group, name, src_file, h5_path):
+    global _verify_file
+    if _verify_file is None:
+        _verify_file = h5py.File(h5_path, "r")
+
+    key = f"{group}/{name}"
+    if key not in _verify_file:
+        return key, "missing"
+
+    dataset = _verify_file[key]
+    packed = trajcodec.read_dataset(dataset) # the only decompression of this dataset
+    source = np.asarray(trajstore.read(str(src_file)))
+    # packing may have narrowed the dtype (pack --dtype); compare like with like
+    source = np.ascontiguousarray(source, dtype=packed.dtype)
 
-def unpack_data(h5_path=STORAGE_H5, target_dir=config.DATA):
+    tolerance = trajcodec.max_error(dataset.attrs.get("quantum", -1.0),
+                                    dtype=packed.dtype,
+                                    magnitude=np.abs(source).max(initial=0.0))\
+                    if trajcodec.is_encoded(dataset) else 0.0
+    if packed.shape != source.shape or\
+            np.abs(packed - source).max(initial=0.0) > tolerance*(1 + 1e-9):
+        return key, "mismatch"
+    stored = dataset.attrs.get("sha256")
+    if stored is not None and stored != checksum(source):
+        return key, "bad checksum"
+    return key, "ok"
+
+def _verify_worker_star(args):
+    return _verify_worker(*args)
+
+def verify_data(h5_path=STORAGE_H5, workers=None):
+    """
+    Checks every packed array against its source file, in parallel. Each
+    dataset is decompressed once, then compared with the source both
+    element-wise and by checksum.
+    Returns:
+        dict mapping dataset path to problem, empty if all is well
+    """
+    jobs = [(group, name, src_file, h5_path)\
+                for group, name, src_file, _ in _sources()]
+
+    problems = {}
+    with mp.Pool(workers) as pool:
+        for key, status in pool.imap_unordered(_verify_worker_star, jobs,
+                                                chunksize=4):
+            if status != "ok":
+                problems[key] = status
+                print(f"{key}: {status}")
+
+    print(f"Verified {len(jobs)} trajectories, {len(problems)} problems.")
+    return problems
+
+def _unpack_group(group, out_path, fmt):
+    out_path.mkdir(parents=True, exist_ok=True)
+    for uuid in group:
+        arr = trajcodec.read_dataset(group[uuid])
+        out_file = out_path / f"{uuid}.{fmt}"
+
+        if fmt == "npy":
+            trajstore.save_npy(out_file, arr)
+            if "metadata" in group[uuid].attrs:
+                trajstore.save_metadata(out_file,
+                                json.loads(group[uuid].attrs["metadata"]))
+        else:
+            with open(out_file, "wb") as f:
+                pickle.dump(arr, f, protocol=4)
+        print(f"unpacked {out_file}.")
+
+def unpack_data(h5_path=STORAGE_H5, target_dir=config.DATA, fmt="pkl"):
+    """
+    Unpacks the archive into a tree of files. Not needed for analyses any
+    more (set config.TRAJ_STORE = "hdf5" to read straight from the archive).
+    Args:
+        fmt (str): "pkl" for legacy pickles, "npy" for memory-mappable files
+    """
     target_dir = Path(target_dir)
     if not target_dir.exists():
         os.makedirs(target_dir, exist_ok=True)
@@ -52,20 +295,14 @@ def unpack_data(h5_path=STORAGE_H5, target_dir=config.DATA):
         for n_group in h5f:
             if n_group == "metadata":  # skip optional metadata group
                 continue
+            if n_group == "HungerGames":
+                _unpack_group(h5f[n_group], target_dir / n_group, fmt)
+                continue
             n_val = n_group[2:]  # strip 'n_'
             for d_group in h5f[n_group]:
                 d_val = d_group  # e.g. 'd0', 'd1', etc.
-                group = h5f[n_group][d_group]
-                for uuid in group:
-                    arr = group[uuid][()]
-
-                    out_path = target_dir / n_val / d_val
-                    out_path.mkdir(parents=True, exist_ok=True)
-                    out_file = out_path / f"{uuid}.pkl"
-
-                    with open(out_file, "wb") as f:
-                        pickle.dump(arr, f, protocol=4)
-                        print(f"unpacked {out_file}.")
+                _unpack_group(h5f[n_group][d_group], target_dir / n_val / d_val,
+                                fmt)
 
     print(f"Extraction complete to {target_dir}")
 
@@ -74,11 +311,30 @@ def unpack_data(h5_path=STORAGE_H5, target_dir=config.DATA):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Pack or unpack simulation data.")
-    parser.add_argument("action", choices=["pack", "unpack"], help="Action to perform")
+    parser.add_argument("action", choices=["pack", "unpack", "verify"], help="Action to perform")
+    parser.add_argument("--append", action="store_true",
+                        help="Only pack files not already in the archive")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes (default: all cores)")
+    parser.add_argument("--codec", choices=["gzip", "traj"], default="gzip",
+                        help="Compression to pack with (see trajcodec.py)")
+    parser.add_argument("--quantum", type=float, default=None,
+                        help="With --codec traj, store positions on a grid of this spacing")
+    parser.add_argument("--format", choices=["pkl", "npy"], default="pkl",
+                        help="File format to unpack to")
+    parser.add_argument("--dtype", choices=trajstore.STORAGE_DTYPES, default=None,
+                        help="Pack positions as this dtype (default: as stored)")
 
     args = parser.parse_args()
 
     if args.action == "pack":
-        pack_data()
+        errors = pack_data(append=args.append, workers=args.workers,
+                            codec=args.codec, quantum=args.quantum, dtype=args.dtype)
+        if errors:
+            raise SystemExit(1)
     elif args.action == "unpack":
-        unpack_data()
+        unpack_data(fmt=args.format)
+    elif args.action == "verify":
+        problems = verify_data(workers=args.workers)
+        if problems:
+            raise SystemExit(1)
@@ -2,9 +2,7 @@
 # pminasandra.github.io
 # 11 Feb 2025
 
-import glob
 from os.path import join as joinpath
-import pickle
 import uuid
 
 import matplotlib.pyplot as plt
@@ -15,6 +13,7 @@ import seaborn as sns
 import config
 import measurements
 import selfishherd
+import trajstore
 import utilities
 import voronoi
 
@@ -39,7 +38,7 @@ def hungergame(init_locs, num_smart):
     herd = selfishherd.SelfishHerd(num_inds, depths, init_locs)
     uname = str(uuid.uuid4())
     fname = joinpath(config.DATA, "HungerGames",
-                f"{num_inds}-n{num_smart}-{uname}.pkl")
+                f"{num_inds}-n{num_smart}-{uname}.npy")
 
     return herd, fname
 
@@ -62,16 +61,14 @@ def hungergames(popsize, num_smart, num_instances):
 
 
 def _hungergames_files_for(popsize, num_smart):
-    datadir = joinpath(config.DATA, "HungerGames")
-    fformat = f"{popsize}-n{num_smart}-*.pkl"
+    fformat = f"{popsize}-n{num_smart}-*"
 
-    files = glob.glob(joinpath(datadir, fformat))
+    files = trajstore.list_trajectories("HungerGames", fformat)
 
     return list(files)
 
 def _read_hungergames_data(filename):
-    with open(filename, "rb") as f:
-        return pickle.load(f)
+    return trajstore.read(filename)
 
 # following analyses will be done after initial randomness
 # let's say we will look at t=150 to t=250
@@ -88,16 +85,16 @@ def extract_areas(dataset, rel_indices):
     Returns:
         tuple of floats: (area_d_0, area_d_1)
     """
-    dataset = dataset.copy()[:,:,config.HUNGERGAMES_TIME_LIMS[0]:
-                            config.HUNGERGAMES_TIME_LIMS[1]]
+    tstart = config.HUNGERGAMES_TIME_LIMS[0]
+    tstop = min(config.HUNGERGAMES_TIME_LIMS[1], dataset.shape[2])
 
-
-    ttotal = dataset.shape[2]
+    ttotal = tstop - tstart
     values_across_time = []
     non_indices = list(range(dataset.shape[0]))
     non_indices = [j for j in non_indices if j not in rel_indices]
     for t in range(0, ttotal, 20):
-        data_sub = dataset[:,:,t]
+        # only the frames used are read, so this is cheap for lazy datasets
+        data_sub = np.array(dataset[:,:,tstart + t])
         vor = voronoi.get_bounded_voronoi(data_sub)
         areas = voronoi.get_areas(data_sub, vor)
 
@@ -0,0 +1,168 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides counters for the simulation hot path: Voronoi tessellations built
+(qhull calls), area computations (voronoi.get_areas, or voronoi.cell_area
+for a single cell), gradient evaluations, and wall time spent at each level
+of movement.recursive_reasoning.
+
+Instrumentation works by swapping counting wrappers in for those functions,
+so while it is off the original functions run untouched and it costs
+nothing. Turn it on for a block of code with
+
+    with instrument.instrumented() as counts:
+        herd.run(10)
+
+or for a whole process by setting the environment variable
+SELFISH_HERD_INSTRUMENT=1. While it is on, SelfishHerd.run also records the
+counts of every step in SelfishHerd.step_stats.
+"""
+
+from contextlib import contextmanager
+import functools
+import os
+import time
+
+import movement
+import voronoi
+
+ENV_VAR = "SELFISH_HERD_INSTRUMENT"
+
+
+class Counters:
+    """
+    Running totals, kept per process.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.qhull = 0
+        self.get_areas = 0
+        self.gradients = 0
+        self.depth_seconds = {}
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: a copy of the current totals
+        """
+        return dict(qhull=self.qhull,
+                    get_areas=self.get_areas,
+                    gradients=self.gradients,
+                    depth_seconds=dict(self.depth_seconds))
+
+    def since(self, snapshot):
+        """
+        Returns:
+            dict: what has been counted since snapshot(...) was taken
+        """
+        now = self.snapshot()
+        depth_seconds = {depth: secs - snapshot["depth_seconds"].get(depth, 0.0)\
+                            for depth, secs in now["depth_seconds"].items()}
+        return dict(qhull=now["qhull"] - snapshot["qhull"],
+                    get_areas=now["get_areas"] - snapshot["get_areas"],
+                    gradients=now["gradients"] - snapshot["gradients"],
+                    depth_seconds=depth_seconds)
+
+    def __str__(self):
+        return f"Counters({self.snapshot()})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+counters = Counters()
+
+_originals = {}
+_child_seconds = [] # time spent in deeper levels, one entry per open level
+
+
+def _counting(original, field):
+    @functools.wraps(original)
+    def wrapper(*args, **kwargs):
+        setattr(counters, field, getattr(counters, field) + 1)
+        return original(*args, **kwargs)
+    return wrapper
+
+
+def _timing_levels(original):
+    @functools.wraps(original)
+    def wrapper(locations, vor, desired_depth, orig_locations, curr_depth=0, **kwargs):
+        _child_seconds.append(0.0)
+        start = time.perf_counter()
+        try:
+            return original(locations, vor, desired_depth, orig_locations,
+                                curr_depth=curr_depth, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - _child_seconds.pop()
+            counters.depth_seconds[curr_depth] =\
+                        counters.depth_seconds.get(curr_depth, 0.0) + own
+            if len(_child_seconds) > 0:
+                _child_seconds[-1] += elapsed
+    return wrapper
+
+
+def _targets():
+    return [
+        (voronoi, "get_bounded_voronoi", lambda fn: _counting(fn, "qhull")),
+        (voronoi, "get_cell_voronoi", lambda fn: _counting(fn, "qhull")),
+        (voronoi, "get_areas", lambda fn: _counting(fn, "get_areas")),
+        (voronoi, "cell_area", lambda fn: _counting(fn, "get_areas")),
+        (movement, "gradient_for_id", lambda fn: _counting(fn, "gradients")),
+        (movement, "recursive_reasoning", _timing_levels),
+    ]
+
+
+def is_enabled():
+    return len(_originals) > 0
+
+
+def enable():
+    """
+    Turns instrumentation on (for this process and any forked from it).
+    """
+    if is_enabled():
+        return
+    for module, name, wrap in _targets():
+        original = getattr(module, name)
+        _originals[(module, name)] = original
+        setattr(module, name, wrap(original))
+
+
+def disable():
+    """
+    Puts the original, uninstrumented functions back.
+    """
+    for (module, name), original in _originals.items():
+        setattr(module, name, original)
+    _originals.clear()
+
+
+@contextmanager
+def instrumented(reset=True):
+    """
+    *CONTEXT MANAGER*
+    Instruments the enclosed block.
+    Args:
+        reset (bool): start counting from zero
+    Yields:
+        Counters
+    """
+    was_enabled = is_enabled()
+    if reset:
+        counters.reset()
+    enable()
+    try:
+        yield counters
+    finally:
+        if not was_enabled:
+            disable()
+
+
+if os.environ.get(ENV_VAR, "") not in ("", "0"):
+    enable()
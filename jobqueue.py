@@ -0,0 +1,420 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides a job queue on a shared filesystem, so that simulations can be run
+by any number of hosts with no broker: the queue is an SQLite database in a
+shared directory (config.JOB_QUEUE_DIR), and every host runs workers that
+claim one (n, depth, replicate) job at a time from it.
+
+A claimed job is leased to its worker for config.JOB_LEASE_SECONDS, and the
+worker renews the lease every config.JOB_HEARTBEAT_SECONDS while it runs. If
+a worker (or its host) dies, its lease runs out and another worker takes the
+job over. Failed jobs are retried up to config.JOB_MAX_ATTEMPTS times.
+Workers save results exactly as sweep.run_job does (trajectories at their
+usual filenames under config.DATA, observed metrics to the results store),
+and skip jobs whose trajectories are already completely saved. Submitting
+the same runs again adds nothing: their initial locations and unames come
+from a seed kept in the queue (JobQueue.seed).
+
+    python3 jobqueue.py submit                # main.py's runs (config.POP_S_DOR)
+    python3 sweep.py run --name sens --queue  # or a sweep's runs
+    python3 jobqueue.py worker --processes 35 # on every host
+    python3 jobqueue.py status
+
+Several local worker processes stand in for hosts just as well. (SQLite
+needs working file locks on the shared filesystem; NFS with locking enabled
+will do. The queue does not use write-ahead logging, which needs shared
+memory between hosts.)
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import os.path
+from os.path import join as joinpath
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+import numpy as np
+
+import config
+import measurements
+import runparams
+import selfishherd
+import sweep
+import telemetry
+import trajstore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    spec TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started REAL,
+    finished REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, priority);
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+STATES = ("pending", "running", "done", "failed")
+
+
+def worker_name():
+    """
+    Name of this worker: host and process id.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def encode_job(job):
+    """
+    A job dict (as from sweep.make_jobs(...)) as JSON.
+    """
+    job = dict(job)
+    job["init_locs"] = np.asarray(job["init_locs"]).tolist()
+    if job.get("params") is not None:
+        job["params"] = job["params"].as_dict()
+    return json.dumps(job)
+
+
+def decode_job(spec):
+    job = json.loads(spec)
+    job["init_locs"] = np.array(job["init_locs"])
+    if job.get("params") is not None:
+        job["params"] = runparams.RunParams.from_dict(job["params"])
+    return job
+
+
+class JobQueue:
+    """
+    The queue in directory path (created if needed).
+    Args:
+        path (str): shared directory, default config.JOB_QUEUE_DIR
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = config.JOB_QUEUE_DIR
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.db_path = joinpath(path, "queue.sqlite")
+        self.run = f"queue:{os.path.abspath(path)}"
+        with contextlib.closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _transaction(self, fn):
+        """
+        Runs fn(connection) in one write transaction, taken before reading so
+        that two workers never claim the same job.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        finally:
+            conn.close()
+
+    def enqueue(self, jobs):
+        """
+        Adds jobs (dicts as from sweep.make_jobs(...)), keyed by their
+        filenames; jobs already in the queue are left alone. Everything run
+        from one queue is one run in telemetry.py's logs.
+        Returns:
+            int, the number of jobs added
+        """
+        jobs = [dict(job, run=self.run) for job in jobs]
+        def _insert(conn):
+            added = []
+            for job in jobs:
+                cursor = conn.execute("INSERT OR IGNORE INTO jobs (key, spec, priority)"
+                                        " VALUES (?, ?, ?)",
+                                        (job["filename"], encode_job(job),
+                                            float(job.get("cost", 0))))
+                if cursor.rowcount == 1:
+                    added.append(job)
+            return added
+        added = self._transaction(_insert)
+        telemetry.plan(self.run, [(job["n"], job["depth"]) for job in added])
+        return len(added)
+
+    def seed(self):
+        """
+        The queue's own random seed, chosen the first time it is asked for, so
+        that main_jobs(...) makes the same jobs every time they are submitted.
+        Returns:
+            int
+        """
+        def _seed(conn):
+            conn.execute("INSERT OR IGNORE INTO settings (name, value) VALUES ('seed', ?)",
+                            (str(np.random.SeedSequence().entropy),))
+            return int(conn.execute("SELECT value FROM settings"
+                                        " WHERE name = 'seed'").fetchone()["value"])
+        return self._transaction(_seed)
+
+    def claim(self, owner, lease_seconds=None, max_attempts=None):
+        """
+        Leases the most expensive job that is pending, or whose last lease
+        has expired. A job whose lease expired on its last attempt (its
+        worker died, e.g., killed for running out of memory, without calling
+        fail(...)) is marked failed instead.
+        Args:
+            max_attempts (int): default config.JOB_MAX_ATTEMPTS
+        Returns:
+            (job id, job dict), or None if there is nothing to claim
+        """
+        if lease_seconds is None:
+            lease_seconds = config.JOB_LEASE_SECONDS
+        if max_attempts is None:
+            max_attempts = config.JOB_MAX_ATTEMPTS
+        def _claim(conn):
+            now = time.time()
+            conn.execute("UPDATE jobs SET state = 'failed', finished = ?,"
+                            " lease_expires = NULL, error = ? WHERE state = 'running'"
+                            " AND lease_expires < ? AND attempts >= ?",
+                            (now, "lease expired on the last attempt; the worker"
+                                    " running it died or stopped responding",
+                                now, max_attempts))
+            row = conn.execute("SELECT id, spec FROM jobs WHERE state = 'pending'"
+                                " OR (state = 'running' AND lease_expires < ?)"
+                                " ORDER BY priority DESC, id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET state = 'running', owner = ?,"
+                            " lease_expires = ?, attempts = attempts + 1,"
+                            " started = ?, error = NULL WHERE id = ?",
+                            (owner, now + lease_seconds, now, row["id"]))
+            return row["id"], decode_job(row["spec"])
+        return self._transaction(_claim)
+
+    def heartbeat(self, job_id, owner, lease_seconds=None):
+        """
+        Renews the lease on a job.
+        Returns:
+            bool: False if owner no longer holds the job
+        """
+        if lease_seconds is None:
+            lease_seconds = config.JOB_LEASE_SECONDS
+        def _renew(conn):
+            cursor = conn.execute("UPDATE jobs SET lease_expires = ? WHERE id = ?"
+                                    " AND owner = ? AND state = 'running'",
+                                    (time.time() + lease_seconds, job_id, owner))
+            return cursor.rowcount == 1
+        return self._transaction(_renew)
+
+    def complete(self, job_id, owner):
+        def _complete(conn):
+            conn.execute("UPDATE jobs SET state = 'done', finished = ?,"
+                            " lease_expires = NULL WHERE id = ? AND owner = ?",
+                            (time.time(), job_id, owner))
+        self._transaction(_complete)
+
+    def fail(self, job_id, owner, error, max_attempts=None):
+        """
+        Records a failed attempt: the job goes back to pending, or, after
+        max_attempts (default config.JOB_MAX_ATTEMPTS), is marked failed.
+        """
+        if max_attempts is None:
+            max_attempts = config.JOB_MAX_ATTEMPTS
+        def _fail(conn):
+            conn.execute("UPDATE jobs SET state = CASE WHEN attempts >= ?"
+                            " THEN 'failed' ELSE 'pending' END, error = ?,"
+                            " finished = ?, lease_expires = NULL"
+                            " WHERE id = ? AND owner = ?",
+                            (max_attempts, error, time.time(), job_id, owner))
+        self._transaction(_fail)
+
+    def counts(self):
+        """
+        Returns:
+            dict: number of jobs in each state
+        """
+        with contextlib.closing(self._connect()) as conn:
+            rows = conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+            counts = dict(rows.fetchall())
+        return {state: counts.get(state, 0) for state in STATES}
+
+    def jobs(self, state=None):
+        """
+        Returns:
+            list of dicts, one per job (in given state), without their specs
+        """
+        query = "SELECT id, key, priority, state, owner, lease_expires, attempts,"\
+                " started, finished, error FROM jobs"
+        args = ()
+        if state is not None:
+            query += " WHERE state = ?"
+            args = (state,)
+        with contextlib.closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(query + " ORDER BY id", args)]
+
+
+def _keep_leased(queue, job_id, owner, stop, lost, interval):
+    while not stop.wait(interval):
+        if not queue.heartbeat(job_id, owner):
+            lost.set()
+            return
+
+
+def work(path=None, owner=None, poll_seconds=10.0, heartbeat_seconds=None):
+    """
+    Claims and runs jobs until none are left (pending, or running elsewhere
+    and possibly about to expire).
+    Args:
+        path (str): queue directory, default config.JOB_QUEUE_DIR
+        owner (str): default worker_name()
+        poll_seconds (float): wait between claims while others still run
+    Returns:
+        int, the number of jobs this worker finished
+    """
+    queue = JobQueue(path)
+    if owner is None:
+        owner = worker_name()
+    if heartbeat_seconds is None:
+        heartbeat_seconds = config.JOB_HEARTBEAT_SECONDS
+
+    num_done = 0
+    while True:
+        claimed = queue.claim(owner)
+        if claimed is None:
+            if queue.counts()["running"] == 0:
+                return num_done
+            time.sleep(poll_seconds)
+            continue
+
+        job_id, job = claimed
+        stop, lost = threading.Event(), threading.Event()
+        beat = threading.Thread(target=_keep_leased, daemon=True,
+                                args=(queue, job_id, owner, stop, lost,
+                                        heartbeat_seconds))
+        beat.start()
+        try:
+            if len(sweep.pending([job])) > 0:
+                sweep.run_job(job)
+        except Exception:
+            queue.fail(job_id, owner, traceback.format_exc())
+        else:
+            queue.complete(job_id, owner)
+            num_done += 1
+        finally:
+            stop.set()
+            beat.join()
+        if lost.is_set() and not config.SUPPRESS_INFORMATIVE_PRINT:
+            print(f"{owner}: lost the lease on job {job_id} while running it")
+
+
+def main_jobs(pop_s_dor=None, repeats=None, seed=None):
+    """
+    The runs main.py makes (RUN_SIMS), as queue jobs: replicate r has the same
+    initial locations and uname (and with config.COMMON_RANDOM_NUMBERS, the
+    same seed) at every depth. As in main.py, runs already saved at depth 0
+    are carried on at the other depths; replicates are only made up to bring
+    their number to repeats. Given the same seed (see JobQueue.seed(...)),
+    the same jobs are made every time.
+    Returns:
+        list of jobs, see sweep.make_jobs(...)
+    """
+    if pop_s_dor is None:
+        pop_s_dor = config.POP_S_DOR
+    if repeats is None:
+        repeats = config.NUM_REPEATS
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    model = sweep.cost_model()
+    jobs = []
+    for n in sorted(pop_s_dor):
+        made = [sweep.replicate(seed, n, r) for r in range(repeats)]
+        ours = set(uname for _, uname, _ in made)
+        replicates = []
+        for filename in sorted(measurements._files_for(n, 0)):
+            uname = measurements._uname_for(filename)
+            if uname not in ours:
+                seed_ = (trajstore.read_metadata(filename) or {}).get("seed")
+                if seed_ is None: # legacy run, see selfishherd.seed_for
+                    seed_ = selfishherd.seed_for(uname)
+                replicates.append((selfishherd.initial_locations(filename), uname, seed_))
+        replicates.extend(made[:max(repeats - len(replicates), 0)])
+        for depth in pop_s_dor[n]:
+            for init, uname, seed_ in replicates:
+                jobs.append(dict(n=n, depth=depth, init_locs=init, params=None,
+                                    seed=seed_ if config.COMMON_RANDOM_NUMBERS else None,
+                                    cost=sweep.job_cost(n, depth, model), store_path=None,
+                                    filename=joinpath(config.DATA, str(n), f"d{depth}",
+                                                        f"{n}-{depth}-{uname}.npy")))
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run simulations from a queue on a shared filesystem.")
+    parser.add_argument("action", choices=["submit", "worker", "status"])
+    parser.add_argument("--queue", default=None,
+                        help="Queue directory (default: config.JOB_QUEUE_DIR)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="With worker, how many worker processes to run here")
+    parser.add_argument("--pop-sizes", type=int, nargs="*", default=None,
+                        help="With submit, population sizes (default: config.POP_S_DOR)")
+    parser.add_argument("--depths", type=int, nargs="*", default=None,
+                        help="With submit, depths for every population size")
+    parser.add_argument("--repeats", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None,
+                        help="With submit, seed for initial locations"
+                                " (default: the queue's own, see JobQueue.seed)")
+    args = parser.parse_args()
+
+    if args.action == "submit":
+        pop_sizes = args.pop_sizes if args.pop_sizes is not None else list(config.POP_S_DOR)
+        pop_s_dor = {n: (args.depths if args.depths is not None
+                            else config.POP_S_DOR.get(n, [0])) for n in pop_sizes}
+        queue = JobQueue(args.queue)
+        seed = args.seed if args.seed is not None else queue.seed()
+        jobs = main_jobs(pop_s_dor, args.repeats, seed=seed)
+        added = queue.enqueue(jobs)
+        print(f"{added} of {len(jobs)} jobs added")
+
+    elif args.action == "worker":
+        if args.processes == 1:
+            print(f"{worker_name()}: {work(args.queue)} jobs done")
+        else:
+            workers = [mp.Process(target=work, args=(args.queue,))\
+                        for _ in range(args.processes)]
+            [worker.start() for worker in workers]
+            [worker.join() for worker in workers]
+
+    elif args.action == "status":
+        queue = JobQueue(args.queue)
+        print(", ".join(f"{count} {state}" for state, count in queue.counts().items()))
+        now = time.time()
+        for job in queue.jobs("running"):
+            print(f"  {job['owner']:<28} {os.path.basename(job['key'])}"
+                    f"  running {now - job['started']:.0f} s,"
+                    f" lease {job['lease_expires'] - now:+.0f} s")
+        for job in queue.jobs("failed"):
+            print(f"  FAILED {os.path.basename(job['key'])}:"
+                    f" {job['error'].strip().splitlines()[-1]}")
@@ -5,7 +5,6 @@
 import datetime as dt
 import glob
 from os.path import join as joinpath
-from os.path import basename
 import multiprocessing as mp
 import os
 import uuid
@@ -15,19 +14,55 @@ import numpy as np
 import config
 import hungergames
 import measurements
+import observers
+import results
 import selfishherd
+import telemetry
+import trajstore
+import writer
 
 def runmodel(herd, filename):
     """
     parallelization helper function
     """
     np.random.seed()
-    herd.run(config.TMAX)
-    herd.savedata(filename)
+    if len(config.OBSERVE_METRICS) > 0 and isinstance(herd.depth, int):
+        herd.add_observer(observers.MetricObserver(config.OBSERVE_METRICS,
+                                    measurements._uname_for(filename),
+                                    eps=config.OBSERVE_EPS))
+    with telemetry.track(herd, filename, config.TMAX):
+        herd.run(config.TMAX)
+    herd.flush_observers()
+    if not config.SAVE_TRAJECTORIES:
+        return
+    if writer.is_active():
+        writer.submit(filename, herd.records,
+                        dict(herd.metadata(), dtype=trajstore.storage_dtype().name))
+    else:
+        herd.savedata(filename)
+
+def _pool(processes, result_writer=None):
+    """
+    A pool whose workers hand their trajectories to result_writer
+    (writer.ResultWriter), if given, instead of saving them themselves.
+    """
+    if result_writer is None:
+        return mp.Pool(processes)
+    return mp.Pool(processes, initializer=writer.init_worker,
+                    initargs=(result_writer.queue, result_writer.failed))
 
 if __name__ == "__main__":
     POP_SIZES = list(config.POP_S_DOR.keys())
 
+    # with the writer pipeline, one process writes every trajectory
+    if config.RESULT_PIPELINE not in ("files", "writer"):
+        raise ValueError(f"unknown result pipeline: {config.RESULT_PIPELINE}")
+    result_writer = None
+    if config.RESULT_PIPELINE == "writer" and\
+            (config.RUN_SIMS or config.CONDUCT_HUNGERGAMES):
+        result_writer = writer.ResultWriter()
+        result_writer.start()
+
     if config.RUN_SIMS:
         depth_dirs = []
         for pop_size in POP_SIZES:
@@ -35,33 +70,65 @@ if __name__ == "__main__":
                                 f"d{depth}")\
                             for depth in config.POP_S_DOR[pop_size]])
         [os.makedirs(dir_, exist_ok=True) for dir_ in depth_dirs]
+        telemetry.start_run([(pop_size, depth) for pop_size in POP_SIZES\
+                                for depth in config.POP_S_DOR[pop_size]\
+                                for i in range(config.NUM_REPEATS)],
+                            processes=35)
 
         for pop_size in POP_SIZES:
             print("Working on pop_size", pop_size)
             # if some data already exists, account for that
             existing_files = measurements._files_for(pop_size, 0)
-            if len(list(existing_files)) == 0:
+            archived = []
+            if result_writer is not None:
+                # runs the writer has archived, where TRAJ_STORE does not look;
+                # its manifest has what is needed, except for older entries
+                on_disk = set(measurements._uname_for(f) for f in existing_files)
+                archived = [entry for entry in writer.archived(f"n_{pop_size}/d0")\
+                                if measurements._uname_for(entry["key"]) not in on_disk]
+            if len(existing_files) + len(archived) == 0:
                 inits = [np.random.uniform(size=(pop_size, 2))\
                             for i in range(config.NUM_REPEATS)]
                 init_names = [str(uuid.uuid4())\
                                 for i in range(config.NUM_REPEATS)]
+                seeds = [int(np.random.SeedSequence().entropy)\
+                                for i in range(config.NUM_REPEATS)]
             else:
-                print("Already found", len(list(existing_files)), "files.")
-                inits = [measurements._read_data(filename)[:,:,0]\
-                            for filename in existing_files]
-                init_names = ["-".join(basename(f)[:-len(".pkl")].split("-")[2:])\
-                                for f in existing_files]
+                print("Already found", len(existing_files) + len(archived), "runs.")
+                inits = [selfishherd.initial_locations(filename)\
+                            for filename in existing_files] +\
+                        [selfishherd.initial_locations(entry["key"])\
+                            if entry.get("init_locs") is None\
+                            else np.array(entry["init_locs"]) for entry in archived]
+                init_names = [measurements._uname_for(f)\
+                                for f in existing_files] +\
+                             [measurements._uname_for(entry["key"]) for entry in archived]
+                seeds = [(trajstore.read_metadata(f) or {}).get("seed")\
+                                for f in existing_files] +\
+                        [(trajstore.read_metadata(entry["key"]) or {}).get("seed")\
+                            if "seed" not in entry\
+                            else entry["seed"] for entry in archived]
+                # runs saved without a seed: derive one, so that with common
+                # random numbers every depth of a replicate stays paired
+                seeds = [selfishherd.seed_for(uname) if seed is None else seed\
+                            for uname, seed in zip(init_names, seeds)]
+                if result_writer is not None:
+                    # the writer cannot open the archive while this has it open
+                    trajstore.get_store("hdf5").close()
 
             for depth in config.POP_S_DOR[pop_size]:
                 print(dt.datetime.now(), "Depth of reasoning:", depth)
-                herds = [selfishherd.SelfishHerd(pop_size, depth, loc) for loc\
-                            in inits]
+                # with common random numbers, replicates share their seed
+                # (and so their random draws) across depths
+                herds = [selfishherd.SelfishHerd(pop_size, depth, loc,
+                            seed=seed if config.COMMON_RANDOM_NUMBERS else None)\
+                            for loc, seed in zip(inits, seeds)]
                 filenames = [joinpath(config.DATA, str(pop_size), f"d{depth}",
-                                    f"{pop_size}-{depth}-{uname}.pkl")\
+                                    f"{pop_size}-{depth}-{uname}.npy")\
                                     for uname in init_names]
                 args = zip(herds, filenames)
                 
-                pool = mp.Pool(35)
+                pool = _pool(35, result_writer)
                 pool.starmap(runmodel, args)
                 pool.close()
                 pool.join()
@@ -78,11 +145,15 @@ if __name__ == "__main__":
                                                 config.NUM_REPEATS)
                                                 
                 # Now execute all these contests
-                pool = mp.Pool()
+                pool = _pool(None, result_writer)
                 pool.starmap(runmodel, contests)
                 pool.close()
                 pool.join()
 
+    if result_writer is not None:
+        result_writer.close()
+        print("Trajectories written to", result_writer.archive)
+
     if config.ANALYSE_HUNGERGAMES:
         hungergames.run_data_analysis()
 
@@ -90,19 +161,13 @@ if __name__ == "__main__":
     if config.ANALYSE_DATA:
         group_metrics = []
         timerange = range(0, 501, 20)
-        os.makedirs(joinpath(config.DATA, "Results"), exist_ok=True)
         for pop_size in config.ANALYSE_POP_SIZES:
             for depth in config.ANALYSE_DEPTHS:
-                tgs_file = joinpath(config.DATA, "Results",
-                                        f"{pop_size}-d{depth}.csv")
-                area_file = joinpath(config.DATA, "Results",
-                                        f"areas-{pop_size}-d{depth}.csv")
-                
                 tgs_data = measurements.make_tgs_csv_for(pop_size, depth,
                                     timerange, eps=0.02)
-                tgs_data.to_csv(tgs_file, index=False)
+                results.write_wide("tgs", pop_size, depth, tgs_data)
                 
                 area_data = measurements.make_area_csv_for(pop_size,
                                     depth, timerange)
-                area_data.to_csv(area_file, index=False)
+                results.write_wide("area", pop_size, depth, area_data)
 
@@ -7,31 +7,28 @@ Provides methods to detect groups of animals, and to identify key variables
 such as number of groups formed and time to formation of groups.
 """
 
-import glob
 from os.path import join as joinpath
 import os
 import os.path
-import pickle
 
 import numpy as np
 import pandas as pd
 from sklearn.cluster import DBSCAN
 
 import config
+import metriccache
+import trajstore
 import voronoi
 
 def _files_for(pop_size, depth):
-    dir_ = joinpath(config.DATA, str(pop_size), "d"+str(depth))
-    if not os.path.exists(dir_):
-        return []
-    else:
-        files_ = glob.glob(joinpath(dir_, f"{pop_size}-{depth}-*.pkl"))
-        files_.sort()
-        return files_
+    return trajstore.list_trajectories(joinpath(str(pop_size), "d"+str(depth)),
+                                        f"{pop_size}-{depth}-*")
 
 def _read_data(filename):
-    with open(filename, "rb") as file_obj:
-        return pickle.load(file_obj)
+    return trajstore.read(filename)
+
+def _uname_for(filename):
+    return "-".join(trajstore.stem(filename).split("-")[2:])
 
 def dbscan(positions, eps=0.005):
     """
@@ -106,6 +103,7 @@ def typical_group_size(group_sizes):
     return (group_sizes**2).sum()/group_sizes.sum()
 
 
+@metriccache.cached
 def extract_all_group_sizes(data: np.ndarray, T_REL_MIN=40, T_REL_MAX=200, dbscan_fn=dbscan) -> list:
     """
     Collects all group sizes between t=T_REL_MIN and t=T_REL_MAX (inclusive)
@@ -149,6 +147,7 @@ def average_typical_group_size(data, timerange, eps=0.005):
     return np.array(all_tgs).mean()
 
 
+@metriccache.cached
 def gen_row_of_g_sizes(positions, timerange, eps=0.005):
     all_tgs_row = []
     for t in timerange:
@@ -159,6 +158,7 @@ def gen_row_of_g_sizes(positions, timerange, eps=0.005):
         all_tgs_row.append(tgs)
     return all_tgs_row
 
+@metriccache.cached
 def gen_row_of_g_areas(positions, timerange):
     all_areas_row = []
     for t in timerange:
@@ -170,6 +170,7 @@ def gen_row_of_g_areas(positions, timerange):
 
     return all_areas_row
 
+@metriccache.cached
 def extract_log_voronoi_areas(data: np.ndarray, T_REL_MIN=40, T_REL_MAX=200) -> list:
     """
     Extracts log Voronoi cell areas for each individual between
@@ -196,6 +197,7 @@ def extract_log_voronoi_areas(data: np.ndarray, T_REL_MIN=40, T_REL_MAX=200) ->
 
     return log_areas
 
+@metriccache.cached
 def gen_row_of_g_area_vars(positions, timerange):
     all_areas_row = []
     for t in timerange:
@@ -207,43 +209,48 @@ def gen_row_of_g_area_vars(positions, timerange):
 
     return all_areas_row
 
-def gen_row_of_g_speeds(positions, timerange):
-    all_speeds_row = []
-    for t in timerange:
-        data_sub = positions[:,:,t].copy()
-        xs, ys = data_sub[:,0], data_sub[:,1]
-        near_left = xs < 0.01 + 0.005
-        near_right = xs > 0.99 - 0.005
-        near_bottom = ys < 0.01 + 0.005
-        near_top = ys > 0.99 - 0.005
+def near_edge(positions):
+    """
+    Which individuals (positions: n×2) are pressed against the edge.
+    """
+    xs, ys = positions[:,0], positions[:,1]
+    near_left = xs < 0.01 + 0.005
+    near_right = xs > 0.99 - 0.005
+    near_bottom = ys < 0.01 + 0.005
+    near_top = ys > 0.99 - 0.005
 
-        near_edge = near_left | near_right | near_bottom | near_top
+    return near_left | near_right | near_bottom | near_top
 
-        data_sub = data_sub[~near_edge]
-        vels = 0.1*(positions[~near_edge,:,t+10] - positions[~near_edge,:,t])
-        speeds = np.sqrt((vels**2).sum(axis=1))
+def mean_speed(positions_t, positions_t10):
+    """
+    Mean speed over 10 steps of individuals not near the edge at the start.
+    """
+    away = ~near_edge(positions_t)
+    vels = 0.1*(positions_t10[away] - positions_t[away])
+    speeds = np.sqrt((vels**2).sum(axis=1))
+
+    return np.mean(speeds)
 
-        all_speeds_row.append(np.mean(speeds))
+@metriccache.cached
+def gen_row_of_g_speeds(positions, timerange):
+    all_speeds_row = []
+    for t in timerange:
+        all_speeds_row.append(mean_speed(positions[:,:,t], positions[:,:,t+10]))
 
     return all_speeds_row
 
+@metriccache.cached
 def gen_row_of_g_edgeeffects(positions, timerange):
     all_ee_row = []
     pcount = positions.shape[0]
     for t in timerange:
         data_sub = positions[:,:,t].copy()
-        xs, ys = data_sub[:,0], data_sub[:,1]
-        near_left = xs < 0.01 + 0.005
-        near_right = xs > 0.99 - 0.005
-        near_bottom = ys < 0.01 + 0.005
-        near_top = ys > 0.99 - 0.005
 
-        near_edge = near_left | near_right | near_bottom | near_top
-
-        all_ee_row.append(np.sum(near_edge)/pcount)
+        all_ee_row.append(np.sum(near_edge(data_sub))/pcount)
 
     return all_ee_row
 
+@metriccache.cached
 def extract_velocities_exclude_edge(
     data: np.ndarray,
     T_REL_MIN: int = 40,
@@ -286,6 +293,7 @@ def extract_velocities_exclude_edge(
 
     return velocities
 
+@metriccache.cached
 def extract_polarisations_exclude_edge(data: np.ndarray, T_REL_MIN=40, T_REL_MAX=200, dbscan_fn=dbscan) -> list:
     """
     Computes polarisation for each group (excluding edge-touching and singleton groups).
@@ -303,39 +311,50 @@ def extract_polarisations_exclude_edge(data: np.ndarray, T_REL_MIN=40, T_REL_MAX
         if t + 1 >= data.shape[2]:
             break
             
-        positions_ref = data[:, :, t]
-        labels_ref = dbscan_fn(positions_ref)
-        edge_mask = group_touches_edge(positions_ref, labels_ref)
-        keep_mask = ~edge_mask
+        polarisations.extend(frame_polarisations(data[:, :, t], data[:, :, t + 1],
+                                                    dbscan_fn=dbscan_fn))
 
-        positions_t = data[:, :, t]
-        positions_t1 = data[:, :, t + 1]
+    return polarisations
 
-        pos = positions_t[keep_mask]
-        pos1 = positions_t1[keep_mask]
+def frame_polarisations(positions_t, positions_t1, dbscan_fn=dbscan):
+    """
+    Polarisation of each group at one time (see
+    extract_polarisations_exclude_edge), from positions at t and t+1.
 
-        labels = dbscan_fn(pos)
+    Returns:
+    - List[float]: Each group's polarisation repeated k times (group size k, k > 1)
+    """
+    polarisations = []
 
-        for label in np.unique(labels):
-            if label == -1:
-                continue  # skip noise
+    labels_ref = dbscan_fn(positions_t)
+    edge_mask = group_touches_edge(positions_t, labels_ref)
+    keep_mask = ~edge_mask
+
+    pos = positions_t[keep_mask]
+    pos1 = positions_t1[keep_mask]
+
+    labels = dbscan_fn(pos)
+
+    for label in np.unique(labels):
+        if label == -1:
+            continue  # skip noise
 
-            group_idx = np.where(labels == label)[0]
-            if len(group_idx) <= 1:
-                continue  # skip singleton groups
+        group_idx = np.where(labels == label)[0]
+        if len(group_idx) <= 1:
+            continue  # skip singleton groups
 
-            group_vel = pos1[group_idx] - pos[group_idx]
-            norms = np.linalg.norm(group_vel, axis=1, keepdims=True)
+        group_vel = pos1[group_idx] - pos[group_idx]
+        norms = np.linalg.norm(group_vel, axis=1, keepdims=True)
 
-            valid = norms[:, 0] > 1e-8
-            unit_vecs = np.zeros_like(group_vel)
-            unit_vecs[valid] = group_vel[valid] / norms[valid]
+        valid = norms[:, 0] > 1e-8
+        unit_vecs = np.zeros_like(group_vel)
+        unit_vecs[valid] = group_vel[valid] / norms[valid]
 
-            mean_vec = np.mean(unit_vecs[valid], axis=0)
-            polarisation = np.linalg.norm(mean_vec)
+        mean_vec = np.mean(unit_vecs[valid], axis=0)
+        polarisation = np.linalg.norm(mean_vec)
 
-            k = len(group_idx)
-            polarisations.extend([polarisation] * k)
+        k = len(group_idx)
+        polarisations.extend([polarisation] * k)
 
     return polarisations
 
@@ -344,7 +363,7 @@ def make_tgs_csv_for(pop_size, depth, timerange, eps=0.005):
     rows = []
     for file_ in all_files:
         data = _read_data(file_)
-        uname = "-".join(file_[:-len(".pkl")].split("-")[2:])
+        uname = _uname_for(file_)
         rows.append([uname] + gen_row_of_g_sizes(data, timerange, eps=eps))
 
     col_labels =["uname"] + [f"t{time}" for time in timerange]
@@ -357,7 +376,7 @@ def make_area_csv_for(pop_size, depth, timerange, eps=0.005):
     rows = []
     for file_ in all_files:
         data = _read_data(file_)
-        uname = "-".join(file_[:-len(".pkl")].split("-")[2:])
+        uname = _uname_for(file_)
         rows.append([uname] + gen_row_of_g_areas(data, timerange))
 
     col_labels =["uname"] + [f"t{time}" for time in timerange]
@@ -370,7 +389,7 @@ def make_areavar_csv_for(pop_size, depth, timerange, eps=0.005):
     rows = []
     for file_ in all_files:
         data = _read_data(file_)
-        uname = "-".join(file_[:-len(".pkl")].split("-")[2:])
+        uname = _uname_for(file_)
         rows.append([uname] + gen_row_of_g_area_vars(data, timerange))
 
     col_labels =["uname"] + [f"t{time}" for time in timerange]
@@ -383,7 +402,7 @@ def make_speed_csv_for(pop_size, depth, timerange, eps=0.005):
     rows = []
     for file_ in all_files:
         data = _read_data(file_)
-        uname = "-".join(file_[:-len(".pkl")].split("-")[2:])
+        uname = _uname_for(file_)
         rows.append([uname] + gen_row_of_g_speeds(data, timerange))
 
     col_labels =["uname"] + [f"t{time}" for time in timerange]
@@ -396,7 +415,7 @@ def make_edgeeffect_csv_for(pop_size, depth, timerange, eps=0.005):
     rows = []
     for file_ in all_files:
         data = _read_data(file_)
-        uname = "-".join(file_[:-len(".pkl")].split("-")[2:])
+        uname = _uname_for(file_)
         rows.append([uname] + gen_row_of_g_edgeeffects(data, timerange))
 
     col_labels =["uname"] + [f"t{time}" for time in timerange]
@@ -409,11 +428,9 @@ if __name__ == "__main__":
     if not config.ANALYSE_DATA:
         print("config.ANALYSE_DATA was False. Exiting.")
         quit()
+    import results
     timerange = range(0, 481, 20)
-    os.makedirs(joinpath(config.DATA, "Results"), exist_ok=True)
     for pop_size in config.ANALYSE_POP_SIZES:
         for depth in config.ANALYSE_DEPTHS:
-            tgt_file = joinpath(config.DATA, "Results",
-                                    f"speed-{pop_size}-d{depth}.csv")
             data = make_speed_csv_for(pop_size, depth, timerange, eps=0.02)
-            data.to_csv(tgt_file, index=False)
+            results.write_wide("speed", pop_size, depth, data)
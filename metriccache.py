@@ -0,0 +1,348 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides a disk-backed, content-addressed cache for per-trajectory
+measurements. Results are keyed by
+    (1) a checksum of the trajectory's contents (for .npy files, their size
+        and modification time instead, so that only the frames a measurement
+        uses are read),
+    (2) the measurement function and a hash of its code, including the
+        helpers it calls and the config values they read (code_version(...)),
+        and
+    (3) its remaining arguments (eps, timerange, T_REL_MIN, ...; functions
+        passed as arguments by their code, closure values and, for
+        functools.partial, bound arguments),
+so re-running an analysis only computes what is new. Entries live under
+config.METRIC_CACHE_DIR, one folder per function, and the least recently used
+ones are evicted once the cache grows beyond config.METRIC_CACHE_MAX_BYTES.
+
+Run this file with "info", "evict" or "clear" to manage the cache.
+"""
+
+import argparse
+import functools
+import hashlib
+import inspect
+import os
+import os.path
+from os.path import join as joinpath
+import pickle
+import shutil
+import types
+import uuid
+
+import numpy as np
+
+import config
+import trajstore
+
+EVICT_EVERY = 200 # writes between size checks
+_REPO = os.path.dirname(os.path.abspath(__file__))
+
+_writes_since_evict = 0
+
+
+class Uncacheable(Exception):
+    """
+    Raised for arguments with no stable description (e.g., objects whose repr
+    is their memory address); calls with them are not cached.
+    """
+
+
+def _describe(value):
+    """
+    Stable text form of an argument, for use in a cache key.
+    """
+    if isinstance(value, functools.partial):
+        parts = [_describe(value.func)] + [_describe(a) for a in value.args] +\
+                [f"{k}={_describe(v)}" for k, v in sorted(value.keywords.items())]
+        return "partial(" + ",".join(parts) + ")"
+    if callable(value) and hasattr(value, "__qualname__"):
+        name = f"{getattr(value, '__module__', None)}.{value.__qualname__}"
+        fn = inspect.unwrap(value)
+        if not hasattr(fn, "__code__"):
+            return name # builtins, ufuncs
+        # lambdas and closures share names; tell them apart by what they do
+        return f"{name}#{_function_hash(fn)}"
+    if isinstance(value, np.ndarray):
+        return trajstore.checksum(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_describe(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{_describe(k)}:{_describe(v)}"\
+                                for k, v in sorted(value.items(), key=repr)) + "}"
+    text = repr(value)
+    if " at 0x" in text:
+        raise Uncacheable(text)
+    return text
+
+
+def _hash_code_object(hasher, code):
+    hasher.update(code.co_code)
+    hasher.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code_object(hasher, const)
+        else:
+            hasher.update(repr(const).encode())
+
+
+def _function_hash(fn):
+    """
+    Hash of a function's code, defaults and closure values.
+    """
+    hasher = hashlib.sha256()
+    _hash_code_object(hasher, fn.__code__)
+    for value in fn.__defaults__ or ():
+        hasher.update(_describe(value).encode())
+    for name, value in sorted((fn.__kwdefaults__ or {}).items()):
+        hasher.update(f"{name}={_describe(value)}".encode())
+    for cell in fn.__closure__ or ():
+        try:
+            contents = cell.cell_contents
+        except ValueError: # not assigned yet
+            contents = None
+        if contents is not fn: # recursive closures
+            hasher.update(_describe(contents).encode())
+    return hasher.hexdigest()[:16]
+
+
+def _is_ours(obj):
+    """
+    Whether obj is defined in this code base (rather than, e.g., numpy).
+    """
+    path = getattr(inspect.getmodule(obj), "__file__", None)
+    return path is not None and os.path.dirname(os.path.abspath(path)) == _REPO
+
+
+def _names_in(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _names_in(const)
+    return names
+
+
+def code_version(fn):
+    """
+    Hash of fn's source and of the source of every function and class of
+    this code base that it uses, directly or through other such functions
+    (e.g., measurements.group_sizes or voronoi.get_areas), along with the
+    config values they read. Changing any of these changes the hash.
+    Returns:
+        str: hex digest
+    """
+    if isinstance(fn, functools.partial):
+        fn = fn.func
+    hasher = hashlib.sha256()
+    seen = set()
+    todo = [inspect.unwrap(fn)]
+    while len(todo) > 0:
+        obj = todo.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        try:
+            source = inspect.getsource(obj)
+        except (OSError, TypeError):
+            source = getattr(obj, "__qualname__", repr(obj))
+        hasher.update(source.encode())
+
+        code = getattr(obj, "__code__", None)
+        if code is None:
+            continue
+        # e.g., dbscan_fn=dbscan
+        defaults = list(obj.__defaults__ or ()) + list((obj.__kwdefaults__ or {}).values())
+        todo.extend(inspect.unwrap(value) for value in defaults\
+                        if inspect.isfunction(value) and _is_ours(value))
+        names = sorted(_names_in(code))
+        for name in names:
+            value = obj.__globals__.get(name)
+            if value is config:
+                for attr in names:
+                    if hasattr(config, attr):
+                        hasher.update(f"config.{attr}={getattr(config, attr)!r};".encode())
+            elif inspect.ismodule(value) and _is_ours(value):
+                # module.function(...) puts both names in co_names
+                members = [getattr(value, attr, None) for attr in names]
+                todo.extend(inspect.unwrap(member) for member in members\
+                                if (inspect.isfunction(member) or inspect.isclass(member))\
+                                    and _is_ours(member))
+            elif (inspect.isfunction(value) or inspect.isclass(value)) and _is_ours(value):
+                todo.append(inspect.unwrap(value))
+    return hasher.hexdigest()
+
+
+def _data_key(data):
+    """
+    Identifies a trajectory without reading it where possible: memory-mapped
+    .npy files by trajstore.signature(...), archived ones by their stored
+    checksum; only arrays in memory are hashed.
+    """
+    if isinstance(data, trajstore.DecimatedTrajectory):
+        times = ",".join(str(t) for t in data.times)
+        return hashlib.sha256((_data_key(data.data) + times).encode()).hexdigest()
+    filename = trajstore.source_file(data)
+    if filename is not None:
+        return trajstore.signature(filename)
+    return trajstore.content_hash(data)
+
+
+def cache_key(fn, code_hash, data, args, kwargs):
+    """
+    Returns:
+        str: hex digest identifying fn(data, *args, **kwargs)
+    """
+    bound = inspect.signature(fn).bind(data, *args, **kwargs)
+    bound.apply_defaults()
+    params = list(bound.arguments.items())[1:] # everything but the data
+
+    hasher = hashlib.sha256(_data_key(data).encode())
+    hasher.update(code_hash.encode())
+    for name, value in params:
+        hasher.update(f"{name}={_describe(value)};".encode())
+    return hasher.hexdigest()
+
+
+def _entry_path(fn, key):
+    return joinpath(config.METRIC_CACHE_DIR, fn.__qualname__, key[:2], key + ".pkl")
+
+
+def cached(fn):
+    """
+    *DECORATOR*
+    Caches fn(data, ...) on disk, where data is an n×2×T trajectory. Does
+    nothing when config.METRIC_CACHE is False.
+    """
+    code_hash = None # on first use, once every helper fn uses is defined
+
+    @functools.wraps(fn)
+    def wrapper(data, *args, **kwargs):
+        nonlocal code_hash
+        if not config.METRIC_CACHE:
+            return fn(data, *args, **kwargs)
+
+        if code_hash is None:
+            code_hash = code_version(fn)
+        try:
+            key = cache_key(fn, code_hash, data, args, kwargs)
+        except Uncacheable:
+            return fn(data, *args, **kwargs)
+        path = _entry_path(fn, key)
+        try:
+            with open(path, "rb") as file_obj:
+                result = pickle.load(file_obj)
+            os.utime(path) # mark as recently used
+            return result
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+
+        result = fn(data, *args, **kwargs)
+        _store(path, result)
+        return result
+
+    return wrapper
+
+
+def _store(path, result):
+    global _writes_since_evict
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # write-then-rename, so that parallel workers never see half an entry
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as file_obj:
+        pickle.dump(result, file_obj)
+    os.replace(tmp_path, path)
+
+    _writes_since_evict += 1
+    if _writes_since_evict >= EVICT_EVERY:
+        evict()
+
+
+def _entries():
+    if not os.path.exists(config.METRIC_CACHE_DIR):
+        return []
+    entries = []
+    for root, _, files in os.walk(config.METRIC_CACHE_DIR):
+        for name in files:
+            if not name.endswith(".pkl"):
+                continue
+            path = joinpath(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue # evicted by someone else meanwhile
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def evict(max_bytes=None):
+    """
+    Deletes least recently used entries until the cache fits in max_bytes
+    (default config.METRIC_CACHE_MAX_BYTES).
+    Returns:
+        int: number of entries deleted
+    """
+    global _writes_since_evict
+    _writes_since_evict = 0
+    if max_bytes is None:
+        max_bytes = config.METRIC_CACHE_MAX_BYTES
+
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    num_deleted = 0
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+        num_deleted += 1
+    return num_deleted
+
+
+def info():
+    """
+    Returns:
+        dict mapping function name to (number of entries, bytes)
+    """
+    summary = {}
+    for _, size, path in _entries():
+        fn_name = os.path.relpath(path, config.METRIC_CACHE_DIR).split(os.sep)[0]
+        count, nbytes = summary.get(fn_name, (0, 0))
+        summary[fn_name] = (count + 1, nbytes + size)
+    return summary
+
+
+def clear(fn_name=None):
+    """
+    Empties the cache, or only the entries of the function called fn_name.
+    """
+    target = config.METRIC_CACHE_DIR
+    if fn_name is not None:
+        target = joinpath(target, fn_name)
+    if os.path.exists(target):
+        shutil.rmtree(target)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the metric cache.")
+    parser.add_argument("action", choices=["info", "evict", "clear"])
+    parser.add_argument("--function", default=None,
+                        help="With clear, only clear this function's entries")
+    args = parser.parse_args()
+
+    if args.action == "info":
+        summary = info()
+        for fn_name, (count, nbytes) in sorted(summary.items()):
+            print(f"{fn_name}: {count} entries, {nbytes/1e6:.1f} MB")
+        total = sum(nbytes for _, nbytes in summary.values())
+        print(f"total: {total/1e6:.1f} MB of {config.METRIC_CACHE_MAX_BYTES/1e6:.1f} MB")
+    elif args.action == "evict":
+        print(f"evicted {evict()} entries")
+    elif args.action == "clear":
+        clear(args.function)
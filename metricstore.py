@@ -0,0 +1,158 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides a cache of per-(metric, n, depth) measurement values, so that figures
+can be redrawn without re-reading and re-processing every trajectory. Values
+live in one HDF5 file (config.METRIC_STORE), under groups named
+{metric}/n_{pop_size}/d{depth}, as one flat array per group. Each group
+remembers a fingerprint of its source trajectories and of the metric's code
+(and of the code it calls), and is rebuilt automatically whenever either changes.
+
+Run this file with "info" to list what is stored, or "clear" to empty it.
+"""
+
+import argparse
+import functools
+import hashlib
+import multiprocessing as mp
+import os
+import os.path
+import pickle
+
+import h5py
+import numpy as np
+
+import config
+import measurements
+import metriccache
+import trajstore
+
+
+def metric_name(fn):
+    """
+    Name under which fn's values are stored, e.g.,
+    "measurements.extract_polarisations_exclude_edge".
+    """
+    if isinstance(fn, functools.partial):
+        args = ",".join([repr(a) for a in fn.args] +
+                        [f"{k}={v!r}" for k, v in sorted(fn.keywords.items())])
+        return f"{metric_name(fn.func)}({args})"
+    return f"{fn.__module__}.{fn.__qualname__}"
+
+
+def fingerprint(fn, files):
+    """
+    Hash of the metric's code (with the helpers it calls, see
+    metriccache.code_version) and of the signatures of its source
+    trajectories.
+    """
+    hasher = hashlib.sha256(metric_name(fn).encode())
+    hasher.update(metriccache.code_version(fn).encode())
+    for file_ in files:
+        hasher.update(trajstore.signature(file_).encode())
+    return hasher.hexdigest()
+
+
+def _compute(fn, file_):
+    return np.asarray(fn(measurements._read_data(file_)), dtype=float).ravel()
+
+
+def compute(fn, files, workers=None):
+    """
+    Applies fn to every trajectory in files (in parallel where fn can be
+    pickled), and returns all values as one flat array. Errors raised by fn
+    propagate.
+    """
+    try:
+        pickle.dumps(fn)
+        picklable = True
+    except (AttributeError, TypeError, pickle.PicklingError):
+        # e.g., lambdas, which cannot be sent to workers
+        picklable = False
+
+    if picklable:
+        with mp.Pool(workers) as pool:
+            values = pool.starmap(_compute, [(fn, f) for f in files])
+    else:
+        values = [_compute(fn, f) for f in files]
+
+    if len(values) == 0:
+        return np.array([], dtype=float)
+    return np.concatenate(values)
+
+
+def get(fn, pop_size, depth, rebuild=False, store_path=None):
+    """
+    Values of metric fn for all trajectories with given pop_size and depth,
+    from the store if they are there and still fresh, else freshly computed
+    (and stored).
+    Args:
+        fn: function taking an n×2×T trajectory and returning an iterable of
+                floats, e.g., measurements.extract_polarisations_exclude_edge
+        pop_size, depth (int)
+        rebuild (bool): ignore whatever is stored
+    Returns:
+        np.ndarray (1-d, float)
+    """
+    if store_path is None:
+        store_path = config.METRIC_STORE
+    files = measurements._files_for(pop_size, depth)
+    fprint = fingerprint(fn, files)
+    group_name = f"{metric_name(fn)}/n_{pop_size}/d{depth}"
+
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+    with h5py.File(store_path, "a") as store:
+        if not rebuild and group_name in store and\
+                store[group_name].attrs["fingerprint"] == fprint:
+            return store[group_name]["values"][()]
+
+    values = compute(fn, files)
+    with h5py.File(store_path, "a") as store:
+        if group_name in store:
+            del store[group_name]
+        group = store.create_group(group_name)
+        group.create_dataset("values", data=values, compression="gzip")
+        group.attrs["fingerprint"] = fprint
+        group.attrs["num_files"] = len(files)
+
+    return values
+
+
+def info(store_path=None):
+    """
+    Returns:
+        list of (group name, number of values, number of source files)
+    """
+    if store_path is None:
+        store_path = config.METRIC_STORE
+    if not os.path.exists(store_path):
+        return []
+
+    rows = []
+    def _collect(name, obj):
+        if isinstance(obj, h5py.Group) and "fingerprint" in obj.attrs:
+            rows.append((name, obj["values"].shape[0], int(obj.attrs["num_files"])))
+    with h5py.File(store_path, "r") as store:
+        store.visititems(_collect)
+    return rows
+
+
+def clear(store_path=None):
+    if store_path is None:
+        store_path = config.METRIC_STORE
+    if os.path.exists(store_path):
+        os.remove(store_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the metric store.")
+    parser.add_argument("action", choices=["info", "clear"])
+    args = parser.parse_args()
+
+    if args.action == "info":
+        for name, num_values, num_files in info():
+            print(f"{name}: {num_values} values from {num_files} trajectories")
+    elif args.action == "clear":
+        clear()
@@ -4,17 +4,53 @@
 
 """
 Provides functions that determine movement rules for selfish agents. 
-Includes simple gradient descent and recursive reasoning.
+Includes simple gradient descent and recursive reasoning, and a fast,
+linearised approximation of the latter (linearised_reasoning).
 """
 
 import random
 
 import numpy as np
+import scipy.sparse
 
-import config
+import runparams
 import voronoi
 
-def gradient_for_id(id_, locations, vor, areas):
+
+class AgentStreams:
+    """
+    Common random numbers: one stream of uniform draws per agent and step,
+    all derived from seed, for the direction gradient_for_id(...) steps in.
+    Herds with the same seed draw the same coins whatever their depth, see
+    commonrandom.py. SelfishHerd calls start_step(t) before each step, and
+    capped_grad(...) calls uniform(id_) for each coin.
+    Args:
+        seed (int)
+    """
+
+    def __init__(self, seed):
+        self.seed = int(seed)
+        self.t = None
+        self._streams = {}
+
+    def start_step(self, t):
+        self.t = int(t)
+        self._streams = {}
+
+    def uniform(self, id_):
+        """
+        Returns:
+            float in [0, 1): the next draw of agent id_ in the current step
+        """
+        stream = self._streams.get(id_)
+        if stream is None:
+            stream = np.random.default_rng([self.seed, self.t, int(id_)])
+            self._streams[id_] = stream
+        return stream.random()
+
+
+def gradient_for_id(id_, locations, vor, areas, params=None, flip=None,
+                        local=False):
     """
     Computes raw gradient of voronoi area for one individual.
     Args:
@@ -22,14 +58,27 @@ def gradient_for_id(id_, locations, vor, areas):
         locations (np.array, n×2)
         vor (scipy.spatial.Voronoi object)
         areas (np.array): output from voronoi.get_areas(...)
+        params (runparams.RunParams): movement parameters, default config.py's
+        flip (float): uniform draw in [0, 1) choosing the direction to step
+                    in, drawn with random.random() if not given
+        local (bool): tessellate only what id_'s cell needs (see
+                    voronoi.get_cell_voronoi), vor and areas are then not
+                    needed
     Returns:
         np.array (1×2): gradient of area for id_.
     """
-    area_guy = areas[id_]
+    params = runparams.resolve(params)
+    if local:
+        tessellate = lambda locs: voronoi.get_cell_voronoi(locs, id_)
+        area_guy = voronoi.cell_area(tessellate(locations), id_)
+    else:
+        tessellate = voronoi.get_bounded_voronoi
+        area_guy = areas[id_]
 
     # We first choose one direction in which to step, for grad computation.
     # This helps reduce computational load while preserving similar results.
-    flip = random.random()
+    if flip is None:
+        flip = random.random()
     if flip > 0.5:
         sign = -1.0
     else:
@@ -37,24 +86,23 @@ def gradient_for_id(id_, locations, vor, areas):
 
     # find d/dx
     new_locs = locations.copy()
-    new_locs[id_, 0] += sign*config.GRAD_DESC_DX
+    new_locs[id_, 0] += sign*params.dx
 
-    vor_new = voronoi.get_bounded_voronoi(new_locs)
-    areas_new = voronoi.get_areas(new_locs, vor_new)
-    ddx_area = -(area_guy - areas_new[id_])/config.GRAD_DESC_DX*sign
+    area_new = voronoi.cell_area(tessellate(new_locs), id_)
+    ddx_area = -(area_guy - area_new)/params.dx*sign
 
     # find d/dy
     new_locs = locations.copy()
-    new_locs[id_, 1] += sign*config.GRAD_DESC_DY
+    new_locs[id_, 1] += sign*params.dy
 
-    vor_new = voronoi.get_bounded_voronoi(new_locs)
-    areas_new = voronoi.get_areas(new_locs, vor_new)
-    ddy_area = -(area_guy - areas_new[id_])/config.GRAD_DESC_DY*sign
+    area_new = voronoi.cell_area(tessellate(new_locs), id_)
+    ddy_area = -(area_guy - area_new)/params.dy*sign
 
     return np.array([ddx_area, ddy_area])
 
 
-def capped_grad(id_, locations, vor, areas):
+def capped_grad(id_, locations, vor, areas, neighbours=None, params=None,
+                    rng=None, own_loc=None):
     """
     Computes capped gradient of voronoi area for one individual.
     Args:
@@ -62,33 +110,64 @@ def capped_grad(id_, locations, vor, areas):
         locations (np.array, n*2)
         vor (scipy.spatial.Voronoi object)
         areas (np.array): output from voronoi.get_areas(...)
+        neighbours (list): if given, neighbours[id_] lists the individuals
+                    (including id_) to tessellate instead of the whole herd,
+                    see voronoi.neighbourhoods(...). vor and areas are then
+                    not needed, and only id_'s cell is computed. Each
+                    gradient then costs the same whatever the size of the
+                    herd (about 1 ms with 2-hop neighbourhoods), so a
+                    step costs time linear in n: on one core, a depth-1
+                    step takes about 3 s for n=1000 and 25 s for n=10000.
+        params (runparams.RunParams): movement parameters, default config.py's
+        rng (AgentStreams): if given, id_'s direction of step
+                    is drawn from its own stream (common random numbers)
+        own_loc (np.array): with neighbours, id_'s position if it is not
+                    locations[id_], so that callers need not copy the herd
     Returns:
         np.array (1×2): capped gradient of area for id_.
     """
+    params = runparams.resolve(params)
+    flip = None if rng is None else rng.uniform(id_)
 
-    raw_grad = gradient_for_id(id_, locations, vor, areas)
+    if neighbours is None:
+        raw_grad = gradient_for_id(id_, locations, vor, areas, params=params,
+                                    flip=flip)
+    else:
+        # only the neighbourhood is copied and tessellated
+        neighbourhood = neighbours[id_]
+        sub_locs = locations[neighbourhood]
+        me = np.searchsorted(neighbourhood, id_)
+        if own_loc is not None:
+            sub_locs[me] = own_loc
+        raw_grad = gradient_for_id(me, sub_locs, None, None, params=params,
+                                    flip=flip, local=True)
     norm = (raw_grad[0]**2 + raw_grad[1]**2)**0.5
 
-    if norm > config.GRAD_DESC_MAX_STEP_SIZE:
-        raw_grad *= (config.GRAD_DESC_MAX_STEP_SIZE / norm)
+    if norm > params.max_step_size:
+        raw_grad *= (params.max_step_size / norm)
 
     return raw_grad
 
-def everyone_do_grad_descent(locations, vor):
+def everyone_do_grad_descent(locations, vor, neighbours=None, params=None,
+                                rng=None):
     """
     Performs one iteration of gradient descent with all individuals.
     Args:
         locations (np.array, n*2)
         vor (scipy.spatial.Voronoi object)
+        neighbours (list): see capped_grad(...)
+        params (runparams.RunParams): movement parameters, default config.py's
+        rng (AgentStreams): see capped_grad(...)
     Returns:
         np.array, new locations, same shape as locations
     """
 
-    areas = voronoi.get_areas(locations, vor)
+    params = runparams.resolve(params)
+    areas = None if neighbours is not None else voronoi.cached_areas(locations, vor)
     new_locs = []
     for id_ in range(len(locations)):
-        movement = -capped_grad(id_, locations, vor,
-                        areas)*config.GRAD_DESC_MULTPL_FACTOR
+        movement = -capped_grad(id_, locations, vor, areas, neighbours=neighbours,
+                        params=params, rng=rng)*params.multpl_factor
         new_loc = locations[id_, :] + movement
 
         # bound to inside of unit square:
@@ -103,7 +182,9 @@ def everyone_do_grad_descent(locations, vor):
 
 
 def recursive_reasoning(locations, vor, desired_depth,
-                        orig_locations, curr_depth=0):
+                        orig_locations, curr_depth=0,
+                        tolerance=None, exit_mode="herd", stats=None,
+                        frozen=None, neighbours=None, params=None, rng=None):
     """
     Performs movement decisions with theory of mind for a desired depth of
     reasoning.
@@ -113,15 +194,36 @@ def recursive_reasoning(locations, vor, desired_depth,
         desired_depth (int or array-like): how many recursions each animal will do.
         orig_locations (np.array, n*2): original locations without ANY
         modifications.
+        tolerance (float): if given, stop anticipating once a level revises
+                    positions by at most this much (in either coordinate)
+                    compared to the level before: a fixed point.
+        exit_mode (str): with tolerance, "herd" stops all recursion once no
+                    agent moves more than tolerance, "agent" stops each
+                    agent separately, keeping its position from then on.
+        stats (dict): if given, filled with "depth", the number of levels
+                    actually run, and "agent_levels", how many levels each
+                    agent revised its decision in.
+        frozen (np.array of bool): agents that have stopped ("agent" mode),
+                    used within the recursion.
+        neighbours (list): if given, every counterfactual only tessellates
+                    the individual's neighbourhood (see capped_grad(...)),
+                    an approximation that makes large herds affordable.
+        params (runparams.RunParams): movement parameters, default config.py's
+        rng (AgentStreams): common random numbers, see
+                    capped_grad(...)
     Returns:
         np.array, new locations, same shape as locations
     """
     if isinstance(desired_depth, int):
         desired_depth = np.ones(locations.shape[0])*desired_depth
+    if frozen is None:
+        frozen = np.zeros(locations.shape[0], dtype=bool)
+    params = runparams.resolve(params)
 
     # desired_depth == 0 -> normal gradient descent
     if desired_depth.max() == 0:
-        return everyone_do_grad_descent(locations, vor)
+        return everyone_do_grad_descent(locations, vor, neighbours=neighbours,
+                                        params=params, rng=rng)
 
     # if recursion has reached desired_depth:
     if desired_depth.max() == curr_depth:
@@ -129,7 +231,8 @@ def recursive_reasoning(locations, vor, desired_depth,
 
 
     # first do one recursion
-    new_locs = everyone_do_grad_descent(locations, vor)
+    new_locs = everyone_do_grad_descent(locations, vor, neighbours=neighbours,
+                                        params=params, rng=rng)
     new_updated_locs = []
 
     # everyone then asks themselves one question:
@@ -139,18 +242,24 @@ def recursive_reasoning(locations, vor, desired_depth,
 
         # if current individual doesn't operate at or above current depth,
         # she doesn't update anything anymore
-        if desired_depth[id_] < curr_depth:
+        if desired_depth[id_] < curr_depth or frozen[id_]:
             new_updated_locs.append(locations[id_])
         else:
-            new_locs_with_me = new_locs.copy()
-            new_locs_with_me[id_] = orig_locations[id_]#i.e., everyone updated but me.
-
             # then do the whole gradient descent business
-            new_vor = voronoi.get_bounded_voronoi(new_locs_with_me)
-            areas_new = voronoi.get_areas(new_locs_with_me, new_vor)
-            my_movement = -capped_grad(id_, new_locs_with_me, new_vor, areas_new)*\
-                                config.GRAD_DESC_MULTPL_FACTOR
-            my_new_loc = new_locs_with_me[id_] + my_movement
+            if neighbours is None:
+                new_locs_with_me = new_locs.copy()
+                new_locs_with_me[id_] = orig_locations[id_]#i.e., everyone updated but me.
+                new_vor = voronoi.get_bounded_voronoi(new_locs_with_me)
+                areas_new = voronoi.get_areas(new_locs_with_me, new_vor)
+                my_movement = -capped_grad(id_, new_locs_with_me, new_vor, areas_new,
+                                            params=params, rng=rng)
+            else:
+                # the same, but capped_grad copies only my neighbourhood
+                my_movement = -capped_grad(id_, new_locs, None, None,
+                                            neighbours=neighbours, params=params,
+                                            rng=rng, own_loc=orig_locations[id_])
+            my_movement *= params.multpl_factor
+            my_new_loc = orig_locations[id_] + my_movement
             my_new_loc[0] = max(0.01, my_new_loc[0])
             my_new_loc[0] = min(0.99, my_new_loc[0])
             my_new_loc[1] = max(0.01, my_new_loc[1])
@@ -160,9 +269,136 @@ def recursive_reasoning(locations, vor, desired_depth,
     # after everyone has asked this question, store their new
     # movement decisions. Recurse on these new choices.
     new_updated_locs = np.array(new_updated_locs)
-    new_vor = voronoi.get_bounded_voronoi(new_updated_locs)
+
+    updating = (desired_depth >= curr_depth) & ~frozen
+    if stats is not None:
+        stats["depth"] = curr_depth + 1
+        if "agent_levels" not in stats:
+            stats["agent_levels"] = np.zeros(len(orig_locations), dtype=int)
+        stats["agent_levels"][updating] += 1
+
+    if tolerance is not None:
+        # has anticipation reached a fixed point? Compare with the level
+        # before: at the first level, that is plain gradient descent
+        # (new_locs), not where everyone starts (locations)
+        previous = new_locs if curr_depth == 0 else locations
+        settled = np.abs(new_updated_locs - previous).max(axis=1) <= tolerance
+        if exit_mode == "herd":
+            if settled[updating].all():
+                return new_updated_locs
+        else:
+            frozen = frozen | (updating & settled)
+            if frozen[desired_depth > curr_depth].all():
+                return new_updated_locs
+
+    # cached: SelfishHerd.run tessellates the final level's outcome again
+    new_vor = voronoi.cached_voronoi(new_updated_locs)
     return recursive_reasoning(new_updated_locs, new_vor, desired_depth,
-                                orig_locations, curr_depth=curr_depth+1)
+                                orig_locations, curr_depth=curr_depth+1,
+                                tolerance=tolerance, exit_mode=exit_mode,
+                                stats=stats, frozen=frozen,
+                                neighbours=neighbours, params=params, rng=rng)
+
+
+def _descent_step(start, grads, params):
+    """
+    Everyone's capped gradient-descent move from start (n×2), given their
+    gradients (n×2) and params (runparams.RunParams), bounded to the inside of
+    the unit square.
+    """
+    norms = np.linalg.norm(grads, axis=1, keepdims=True)
+    scale = np.minimum(1.0, params.max_step_size/np.maximum(norms, 1e-300))
+    return np.clip(start - grads*scale*params.multpl_factor, 0.01, 0.99)
+
+
+def gradient_jacobian(locations, vor, grads=None, params=None):
+    """
+    Sparse Jacobian of everyone's area gradient (voronoi.area_gradients) with
+    respect to everyone's position, by finite differences over perturbed
+    tessellations. Only Voronoi neighbours couple, so it is sparse.
+    Args:
+        locations (np.array, n*2)
+        vor (scipy.spatial.Voronoi object)
+        grads (np.array, n*2): area gradients at locations, if known
+        params (runparams.RunParams): finite-difference steps dx and dy,
+                    default config.py's
+    Returns:
+        scipy.sparse.csr_matrix, 2n×2n: entry (2i+a, 2j+b) is
+        d grad_i[a]/d location_j[b]
+    """
+    num_loc = locations.shape[0]
+    params = runparams.resolve(params)
+    if grads is None:
+        grads = voronoi.area_gradients(locations, vor)
+
+    rows, cols, vals = [], [], []
+    for j in range(num_loc):
+        for b, step in ((0, params.dx), (1, params.dy)):
+            perturbed = locations.copy()
+            perturbed[j, b] += step
+            new_vor = voronoi.get_bounded_voronoi(perturbed)
+            diff = ((voronoi.area_gradients(perturbed, new_vor) - grads)/step).ravel()
+            coupled = np.flatnonzero(np.abs(diff) > 1e-9)
+            rows.append(coupled)
+            cols.append(np.full(len(coupled), 2*j + b))
+            vals.append(diff[coupled])
+
+    return scipy.sparse.csr_matrix((np.concatenate(vals),
+                                    (np.concatenate(rows), np.concatenate(cols))),
+                                    shape=(2*num_loc, 2*num_loc))
+
+
+def linearised_reasoning(locations, vor, desired_depth, stats=None, params=None):
+    """
+    Fast approximation of recursive_reasoning(...). Gradients are exact
+    (voronoi.area_gradients) at the current locations, and everywhere else
+    extrapolated to first order with gradient_jacobian(...), which is built
+    once and reused at every level of anticipation. A depth-k decision
+    therefore costs about as much as a depth-1 one. Random gradient
+    directions are not used.
+    Args:
+        locations (np.array, n*2)
+        vor (scipy.spatial.Voronoi object)
+        desired_depth (int or array-like): how many recursions each animal will do.
+        stats (dict): if given, "depth" is set to the number of levels run
+        params (runparams.RunParams): movement parameters, default config.py's
+    Returns:
+        np.array, new locations, same shape as locations
+    """
+    num_loc = locations.shape[0]
+    if isinstance(desired_depth, (int, np.integer)):
+        desired_depth = np.ones(num_loc)*desired_depth
+    desired_depth = np.asarray(desired_depth)
+    params = runparams.resolve(params)
+
+    grads = voronoi.area_gradients(locations, vor)
+    if desired_depth.max() == 0:
+        return _descent_step(locations, grads, params)
+
+    jacobian = gradient_jacobian(locations, vor, grads, params=params)
+    own = np.arange(num_loc)
+    own_block = np.zeros((num_loc, 2, 2)) # each agent's dependence on itself
+    for a in range(2):
+        for b in range(2):
+            own_block[:, a, b] = np.asarray(jacobian[2*own + a, 2*own + b]).ravel()
+
+    def _shift(config_):
+        return (jacobian @ (config_ - locations).ravel()).reshape(num_loc, 2)
+
+    level = locations
+    for curr_depth in range(int(desired_depth.max())):
+        # everyone's gradient step from this level's positions...
+        predicted = _descent_step(level, grads + _shift(level), params)
+        # ...then each agent's reply from where it actually is, everyone
+        # else having moved
+        others_moved = grads + _shift(predicted)\
+                        - np.einsum("iab,ib->ia", own_block, predicted - locations)
+        replies = _descent_step(locations, others_moved, params)
+        level = np.where((desired_depth >= curr_depth)[:, np.newaxis], replies, level)
+
+    if stats is not None:
+        stats["depth"] = int(desired_depth.max())
+    return level
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides observers: callbacks that SelfishHerd.run(...) hands the live state
+of a simulation to at every step, along with the Voronoi tessellation it has
+already built for that step. MetricObserver uses this to compute the usual
+group-level metrics while the simulation runs, and streams them to the results
+store (results.py), so that no post-hoc pass over saved trajectories is needed
+(see config.OBSERVE_METRICS and config.SAVE_TRAJECTORIES).
+
+Metrics are registered with register_metric(...). Each is computed from
+    locs: n×2 positions at time t,
+    vor: the tessellation of locs (bounded, as in voronoi.py),
+    later: n×2 positions at time t+lag, for metrics that need them (else None).
+The built-in ones give the same numbers as the gen_row_of_g_* functions in
+measurements.py.
+"""
+
+import functools
+
+import numpy as np
+
+import config
+import measurements
+import results
+import voronoi
+
+METRICS = {}
+
+
+def register_metric(name, lag=0):
+    """
+    *DECORATOR*
+    Registers fn(locs, vor, later, **params) -> float as a metric called name,
+    which needs positions lag steps after the observed one.
+    """
+    def _register(fn):
+        METRICS[name] = (fn, lag)
+        return fn
+    return _register
+
+
+@register_metric("tgs")
+def _tgs(locs, vor, later, eps=0.005, **params):
+    sizes = measurements.group_sizes(measurements.dbscan(locs, eps=eps))
+    return measurements.typical_group_size(sizes)
+
+@register_metric("area")
+def _median_area(locs, vor, later, **params):
+    return np.median(voronoi.get_areas(locs, vor))
+
+@register_metric("var-area")
+def _var_log_area(locs, vor, later, **params):
+    return np.var(np.log(voronoi.get_areas(locs, vor)))
+
+@register_metric("ee")
+def _edge_fraction(locs, vor, later, **params):
+    return np.sum(measurements.near_edge(locs))/locs.shape[0]
+
+@register_metric("speed", lag=10)
+def _speed(locs, vor, later, **params):
+    return measurements.mean_speed(locs, later)
+
+@register_metric("polarisation", lag=1)
+def _polarisation(locs, vor, later, eps=0.005, **params):
+    dbscan_fn = functools.partial(measurements.dbscan, eps=eps)
+    polarisations = measurements.frame_polarisations(locs, later, dbscan_fn=dbscan_fn)
+    if len(polarisations) == 0:
+        return np.nan
+    return np.mean(polarisations)
+
+
+class Observer:
+    """
+    Base class for observers. SelfishHerd calls observe(...) once for every
+    frame it produces (including the initial and final ones), and flush(...)
+    from SelfishHerd.flush_observers().
+    """
+
+    def observe(self, t, locs, vor, herd):
+        """
+        Args:
+            t (int): time of the frame
+            locs (np.ndarray, n×2): positions at time t, not to be modified
+            vor (scipy.spatial.Voronoi or None): tessellation of locs, None if
+                    the simulation did not need one (the final frame)
+            herd (selfishherd.SelfishHerd)
+        """
+        raise NotImplementedError
+
+    def flush(self, herd):
+        pass
+
+
+class MetricObserver(Observer):
+    """
+    Computes registered metrics at chosen timesteps, and writes them to the
+    results store when flushed.
+    Args:
+        metrics (list of str): names of registered metrics, see METRICS
+        uname (str): name of the simulation in the results store
+        timesteps (iterable): when to compute metrics,
+                    default config.OBSERVE_TIMESTEPS
+        depth (int): partition of the results store to write to, by default
+                    the herd's depth (which must then be a single number)
+        store_path (str): default config.RESULTS_STORE
+        **params: passed on to the metrics, e.g., eps for DBSCAN
+    """
+
+    def __init__(self, metrics, uname, timesteps=None, depth=None,
+                    store_path=None, **params):
+        unknown = [m for m in metrics if m not in METRICS]
+        if len(unknown) > 0:
+            raise ValueError(f"unknown metrics: {unknown}")
+        if timesteps is None:
+            timesteps = config.OBSERVE_TIMESTEPS
+
+        self.metrics = list(metrics)
+        self.uname = uname
+        self.timesteps = set(timesteps)
+        self.depth = depth
+        self.store_path = store_path
+        self.params = params
+
+        self.pending = [] # (metric, t, locs, vor) waiting for later frames
+        self.rows = {metric: ([], []) for metric in self.metrics}
+
+    def _record(self, metric, t, value):
+        times, values = self.rows[metric]
+        times.append(t)
+        values.append(float(value))
+
+    def observe(self, t, locs, vor, herd):
+        still_pending = []
+        for metric, t0, locs0, vor0 in self.pending:
+            fn, lag = METRICS[metric]
+            if t == t0 + lag:
+                self._record(metric, t0, fn(locs0, vor0, locs, **self.params))
+            else:
+                still_pending.append((metric, t0, locs0, vor0))
+        self.pending = still_pending
+
+        if t not in self.timesteps:
+            return
+        if vor is None:
+            vor = voronoi.get_bounded_voronoi(locs)
+        for metric in self.metrics:
+            fn, lag = METRICS[metric]
+            if lag == 0:
+                self._record(metric, t, fn(locs, vor, None, **self.params))
+            else:
+                self.pending.append((metric, t, locs.copy(), vor))
+
+    def _depth_of(self, herd):
+        if self.depth is not None:
+            return self.depth
+        if isinstance(herd.depth, (int, np.integer)):
+            return int(herd.depth)
+        raise ValueError("herd has mixed depths, give MetricObserver a depth")
+
+    def flush(self, herd):
+        """
+        Appends everything computed so far to the results store. Metrics that
+        still wait for later frames (e.g., speed near the end of a run) stay
+        pending.
+        """
+        depth = self._depth_of(herd)
+        for metric, (times, values) in self.rows.items():
+            if len(times) == 0:
+                continue
+            results.append(metric, herd.n, depth, [self.uname]*len(times),
+                            times, values, store_path=self.store_path)
+        self.rows = {metric: ([], []) for metric in self.metrics}
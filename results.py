@@ -0,0 +1,316 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides the results store: one typed, columnar HDF5 file (config.RESULTS_STORE)
+holding every per-simulation, per-timestep measurement in long format
+
+    metric, n, depth, uname, t, value
+
+Rows are partitioned into groups {metric}/n_{pop_size}/d{depth}, each holding
+three columns (uname, t, value) sorted by t. Queries only open the partitions
+they ask for, and a range of t is cut out of the sorted column before the
+other columns are read, so pulling one metric for one depth touches nothing
+else.
+
+Metric names used so far: "tgs" (typical group size), "area" (median Voronoi
+area), "var-area" (variance of log areas), "speed" and "ee" (fraction of
+agents at the edge). Run this file with "import-csv" to bring old
+Data/Results/*.csv files into the store, or "info" to list its contents.
+"""
+
+import argparse
+from contextlib import contextmanager
+import fcntl
+import os
+import os.path
+from os.path import join as joinpath
+
+import h5py
+import numpy as np
+import pandas as pd
+
+import config
+
+COLUMNS = ["metric", "n", "depth", "uname", "t", "value"]
+
+# prefixes of the csv files that results used to be written to
+LEGACY_CSV_PREFIXES = {
+    "tgs": "",
+    "area": "areas-",
+    "var-area": "var-area-",
+    "speed": "speed-",
+    "ee": "ee-",
+}
+
+
+@contextmanager
+def _open(mode, store_path=None):
+    """
+    Opens the store, holding an exclusive lock while writing so that several
+    processes can add results safely.
+    """
+    if store_path is None:
+        store_path = config.RESULTS_STORE
+    if mode == "r":
+        with h5py.File(store_path, "r") as store:
+            yield store
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+    with open(store_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with h5py.File(store_path, "a") as store:
+                yield store
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _partition(metric, n, depth):
+    return f"{metric}/n_{n}/d{depth}"
+
+
+def _write_columns(group, unames, times, values):
+    order = np.lexsort((unames, times))
+    for name in ("uname", "t", "value"):
+        if name in group:
+            del group[name]
+    group.create_dataset("uname", data=unames[order].astype(object),
+                            dtype=h5py.string_dtype(), maxshape=(None,),
+                            chunks=True, compression="gzip")
+    group.create_dataset("t", data=times[order].astype(np.int32),
+                            maxshape=(None,), chunks=True, compression="gzip")
+    group.create_dataset("value", data=values[order].astype(np.float64),
+                            maxshape=(None,), chunks=True, compression="gzip")
+    group.attrs["sorted"] = True
+
+
+def write(metric, n, depth, df, store_path=None):
+    """
+    Replaces the partition (metric, n, depth) with the rows in df.
+    Args:
+        df (pd.DataFrame): long format, with columns uname, t and value
+    """
+    unames = np.asarray(df["uname"], dtype=str)
+    times = np.asarray(df["t"], dtype=np.int64)
+    values = np.asarray(df["value"], dtype=np.float64)
+
+    with _open("a", store_path) as store:
+        group = store.require_group(_partition(metric, n, depth))
+        _write_columns(group, unames, times, values)
+
+
+def append(metric, n, depth, unames, times, values, store_path=None):
+    """
+    Adds rows to the partition (metric, n, depth), e.g., as simulations finish.
+    The partition is re-sorted lazily, on the next call to compact(...). Rows
+    already stored for the same uname and t (e.g., from an earlier run of the
+    same simulation) are replaced; other rows of that uname are kept, so a
+    simulation's rows can be appended a few at a time.
+    Args:
+        unames, times, values (array-likes of equal length)
+    """
+    unames = np.asarray(unames, dtype=str)
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+
+    with _open("a", store_path) as store:
+        name = _partition(metric, n, depth)
+        if name not in store:
+            _write_columns(store.create_group(name), unames, times, values)
+            return
+
+        group = store[name]
+        stored_unames = group["uname"].asstr()[()]
+        rerun = np.isin(stored_unames, np.unique(unames))
+        if rerun.any():
+            stored_times = group["t"][()]
+            new_rows = set(zip(unames.tolist(), times.tolist()))
+            rerun[rerun] = [(uname, t) in new_rows for uname, t in\
+                                zip(stored_unames[rerun].tolist(), stored_times[rerun].tolist())]
+        if rerun.any():
+            keep = ~rerun
+            _write_columns(group, np.concatenate([stored_unames[keep], unames]),
+                            np.concatenate([stored_times[keep], times]),
+                            np.concatenate([group["value"][()][keep], values]))
+            return
+
+        start = group["t"].shape[0]
+        for col, data in (("uname", unames.astype(object)), ("t", times),
+                            ("value", values)):
+            group[col].resize((start + len(data),))
+            group[col][start:] = data
+        group.attrs["sorted"] = False
+
+
+def write_wide(metric, n, depth, wide_df, store_path=None):
+    """
+    Like write(...), for a wide frame with a uname column and one column per
+    timestep named t{time} (the layout of the make_*_csv_for functions).
+    """
+    write(metric, n, depth, wide_to_long(wide_df), store_path=store_path)
+
+
+def wide_to_long(wide_df):
+    tcols = [c for c in wide_df.columns if c != "uname"]
+    long_df = wide_df.melt(id_vars="uname", value_vars=tcols,
+                            var_name="t", value_name="value")
+    long_df["t"] = long_df["t"].str[1:].astype(int)
+    return long_df
+
+
+def _as_list(x):
+    if x is None:
+        return None
+    if np.isscalar(x):
+        return [x]
+    return list(x)
+
+
+def _read_partition(group, tmin, tmax):
+    times = group["t"][()]
+    if group.attrs["sorted"]:
+        # t is sorted: read only the matching slice of the other columns
+        lo = 0 if tmin is None else np.searchsorted(times, tmin, side="left")
+        hi = len(times) if tmax is None else np.searchsorted(times, tmax, side="right")
+        sel = slice(lo, hi)
+        return (group["uname"].asstr()[sel], times[sel], group["value"][sel])
+
+    keep = np.ones(len(times), dtype=bool)
+    if tmin is not None:
+        keep &= times >= tmin
+    if tmax is not None:
+        keep &= times <= tmax
+    return (group["uname"].asstr()[()][keep], times[keep], group["value"][()][keep])
+
+
+def query(metric, n=None, depth=None, t=None, unames=None, store_path=None):
+    """
+    Reads rows from the store, opening only the partitions asked for.
+    Args:
+        metric (str or list)
+        n, depth (int or list, optional): None means all
+        t (tuple, optional): (tmin, tmax), inclusive; either may be None
+        unames (iterable, optional): keep only these simulations
+    Returns:
+        pd.DataFrame with columns metric, n, depth, uname, t, value
+    """
+    tmin, tmax = (None, None) if t is None else t
+    metrics, ns, depths = _as_list(metric), _as_list(n), _as_list(depth)
+
+    frames = []
+    if not os.path.exists(store_path or config.RESULTS_STORE):
+        return pd.DataFrame({c: [] for c in COLUMNS})
+    with _open("r", store_path) as store:
+        for metric_ in metrics:
+            if metric_ not in store:
+                continue
+            for n_group in store[metric_]:
+                n_ = int(n_group[2:])
+                if ns is not None and n_ not in ns:
+                    continue
+                for d_group in store[metric_][n_group]:
+                    depth_ = int(d_group[1:])
+                    if depths is not None and depth_ not in depths:
+                        continue
+
+                    uname_col, times, values = _read_partition(
+                                    store[metric_][n_group][d_group], tmin, tmax)
+                    frames.append(pd.DataFrame({"metric": metric_,
+                                                "n": n_,
+                                                "depth": depth_,
+                                                "uname": uname_col,
+                                                "t": times,
+                                                "value": values}))
+
+    if len(frames) == 0:
+        return pd.DataFrame({c: [] for c in COLUMNS})
+    df = pd.concat(frames, ignore_index=True)
+    if unames is not None:
+        df = df[df["uname"].isin(set(unames))].reset_index(drop=True)
+    return df
+
+
+def wide(metric, n, depth, store_path=None):
+    """
+    One partition in the wide layout the analyses use: one row per simulation,
+    a uname column, and one column per timestep named t{time}.
+    """
+    df = query(metric, n=n, depth=depth, store_path=store_path)
+    # stores written before append(...) replaced re-runs may repeat rows
+    df = df.drop_duplicates(["uname", "t"], keep="last")
+    wide_df = df.pivot(index="uname", columns="t", values="value")
+    wide_df.columns = [f"t{time}" for time in wide_df.columns]
+    return wide_df.reset_index()
+
+
+def compact(store_path=None):
+    """
+    Re-sorts partitions that were appended to, so that t-range queries on
+    them are cheap again, keeping only the last row of any repeated
+    (uname, t).
+    """
+    with _open("a", store_path) as store:
+        groups = []
+        store.visititems(lambda name, obj: groups.append(obj)\
+                            if isinstance(obj, h5py.Group) and "sorted" in obj.attrs\
+                            else None)
+        for group in groups:
+            if not group.attrs["sorted"]:
+                unames, times = group["uname"].asstr()[()], group["t"][()]
+                # last occurrence of each (uname, t), in order of writing
+                rows = pd.DataFrame({"uname": unames, "t": times})
+                last = ~rows.duplicated(keep="last").to_numpy()
+                _write_columns(group, unames[last], times[last],
+                                group["value"][()][last])
+
+
+def info(store_path=None):
+    """
+    Returns:
+        list of (partition name, number of rows)
+    """
+    if store_path is None:
+        store_path = config.RESULTS_STORE
+    if not os.path.exists(store_path):
+        return []
+    rows = []
+    with _open("r", store_path) as store:
+        store.visititems(lambda name, obj: rows.append((name, obj["t"].shape[0]))\
+                            if isinstance(obj, h5py.Group) and "sorted" in obj.attrs\
+                            else None)
+    return rows
+
+
+def import_csvs(results_dir=None, store_path=None):
+    """
+    Brings the csv files that results used to be written to
+    ({n}-d{d}.csv, areas-{n}-d{d}.csv, ...) into the store.
+    """
+    if results_dir is None:
+        results_dir = joinpath(config.DATA, "Results")
+    for metric, prefix in LEGACY_CSV_PREFIXES.items():
+        for n in config.ANALYSE_POP_SIZES:
+            for depth in config.ANALYSE_DEPTHS:
+                csv_file = joinpath(results_dir, f"{prefix}{n}-d{depth}.csv")
+                if not os.path.exists(csv_file):
+                    continue
+                write_wide(metric, n, depth, pd.read_csv(csv_file),
+                            store_path=store_path)
+                print(f"imported {csv_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the results store.")
+    parser.add_argument("action", choices=["info", "import-csv", "compact"])
+    args = parser.parse_args()
+
+    if args.action == "info":
+        for name, num_rows in info():
+            print(f"{name}: {num_rows} rows")
+    elif args.action == "import-csv":
+        import_csvs()
+    elif args.action == "compact":
+        compact()
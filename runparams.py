@@ -0,0 +1,91 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides RunParams, the movement parameters of one simulation. SelfishHerd
+carries one and hands it to every function in movement.py, so processes (and
+pools) are no longer tied to a single parameter set in config.py: see
+sweep.py, which runs grids of them side by side.
+"""
+
+import dataclasses
+import itertools
+
+import config
+
+# RunParams field -> name of the config.py constant it defaults to
+CONFIG_NAMES = {
+    "dx": "GRAD_DESC_DX",
+    "dy": "GRAD_DESC_DY",
+    "max_step_size": "GRAD_DESC_MAX_STEP_SIZE",
+    "multpl_factor": "GRAD_DESC_MULTPL_FACTOR",
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class RunParams:
+    """
+    Args:
+        dx, dy (float): displacements used for finite-difference gradients
+        max_step_size (float): gradients are capped at this norm
+        multpl_factor (float): step = -capped gradient * multpl_factor
+    """
+    dx: float
+    dy: float
+    max_step_size: float
+    multpl_factor: float
+
+    @classmethod
+    def from_config(cls, **overrides):
+        """
+        The parameters currently set in config.py, with any overrides (given
+        by field name).
+        """
+        unknown = set(overrides) - set(CONFIG_NAMES)
+        if len(unknown) > 0:
+            raise ValueError(f"unknown movement parameters: {sorted(unknown)}")
+        values = {field: getattr(config, name) for field, name in CONFIG_NAMES.items()}
+        values.update(overrides)
+        return cls(**values)
+
+    @classmethod
+    def from_dict(cls, params):
+        """
+        Inverse of as_dict(...); also accepts metadata["params"] of saved
+        simulations (other keys are ignored).
+        """
+        return cls(**{field: params[name] for field, name in CONFIG_NAMES.items()})
+
+    def as_dict(self):
+        """
+        Returns:
+            dict keyed by config.py names, as saved in simulation metadata
+        """
+        return {name: getattr(self, field) for field, name in CONFIG_NAMES.items()}
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+
+def resolve(params):
+    """
+    params, or the config.py defaults if params is None.
+    """
+    if params is None:
+        return RunParams.from_config()
+    return params
+
+
+def grid(base=None, **values):
+    """
+    Every combination of the given parameter values, e.g.,
+    grid(multpl_factor=[0.05, 0.1], dx=[0.005, 0.001]) gives 4 RunParams.
+    Parameters not varied keep their value in base (default: config.py).
+    Returns:
+        list of RunParams
+    """
+    base = resolve(base)
+    fields = sorted(values)
+    return [base.replace(**dict(zip(fields, combo)))\
+                for combo in itertools.product(*(values[f] for f in fields))]
@@ -0,0 +1,251 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides an empirical cost model for simulations: how long one step of
+SelfishHerd.run takes for a population of n agents with given depths of
+reasoning.
+
+Steps are timed over a grid of n and depth (plus hunger-games style mixed
+depth vectors), and two things are fitted:
+    (1) per depth d, a power law  seconds_per_step = coef * n**exponent;
+    (2) across all runs, the time per tessellation, also as a power law in n.
+Every step builds a known number of tessellations (tessellations_per_step),
+so (2) prices any depth vector, including mixed ones that were never timed.
+
+The fitted model is saved as JSON (config.COST_MODEL) for schedulers and ETA
+displays to read with load_model(...) and predict_step_seconds(...). Run
+this file with "profile" to time and fit, or "report" to print predicted wall
+times for config.POP_S_DOR and config.POP_S_SMART_GUYS_HG.
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import os.path
+import platform
+import time
+
+import numpy as np
+
+import config
+import selfishherd
+
+PROFILE_POP_SIZES = [10, 25, 50, 100]
+PROFILE_DEPTHS = [0, 1, 2, 3]
+PROFILE_STEPS = 3
+MODEL_VERSION = 1
+SEED = 42
+
+
+def depth_vector(n, depth):
+    """
+    Depth of each of n agents, from a single depth or a vector of them.
+    """
+    if isinstance(depth, (int, np.integer)):
+        return np.full(n, int(depth))
+    depth = np.asarray(depth, dtype=int)
+    if depth.shape != (n,):
+        raise ValueError(f"need {n} depths, got {depth.shape}")
+    return depth
+
+
+def hungergames_depths(n, num_smart):
+    """
+    Depth vector of a hunger game (see hungergames.hungergame): num_smart d1
+    agents, the rest d0.
+    """
+    depths = np.zeros(n, dtype=int)
+    depths[:num_smart] = 1
+    return depths
+
+
+def tessellations_per_step(n, depth):
+    """
+    Number of Voronoi tessellations one step of SelfishHerd.run builds: one for
+    the current positions, then, for each level c below the deepest depth D,
+    two per agent for everyone's gradient, three for each of the m_c agents
+    still reasoning at that level, and one for the level's outcome:
+        D = 0:  1 + 2n
+        D > 0:  sum over c < D of (2n + 3*m_c + 1)
+    For D > 0, the tessellation of the current positions is the previous
+    step's last one, which voronoi.TessellationCache hands back. (Also,
+    movement.recursive_reasoning lets every agent with depth >= c update at
+    level c.)
+    """
+    depths = depth_vector(n, depth)
+    max_depth = depths.max()
+    if max_depth == 0:
+        return 1 + 2*n
+    return sum(2*n + 3*int((depths >= c).sum()) + 1 for c in range(max_depth))
+
+
+def time_step(n, depth, steps=PROFILE_STEPS, seed=SEED):
+    """
+    Returns:
+        float: mean wall time in seconds of one SelfishHerd.run step
+    """
+    init_locs = np.random.default_rng(seed).uniform(0.01, 0.99, size=(n, 2))
+    herd = selfishherd.SelfishHerd(n, depth, init_locs, seed=seed, record="final")
+    start = time.perf_counter()
+    herd.run(steps)
+    return (time.perf_counter() - start)/steps
+
+
+def profile(pop_sizes=None, depths=None, steps=PROFILE_STEPS, mixed=True,
+                verbose=True):
+    """
+    Times steps over a grid of population sizes and depths.
+    Args:
+        mixed (bool): also time a hunger game (half d1, half d0) for each n
+    Returns:
+        list of dicts with keys n, depth (int, or list for mixed vectors),
+        tessellations and seconds
+    """
+    if pop_sizes is None:
+        pop_sizes = PROFILE_POP_SIZES
+    if depths is None:
+        depths = PROFILE_DEPTHS
+
+    configs = [(n, int(depth)) for depth in depths for n in pop_sizes]
+    if mixed:
+        configs.extend((n, hungergames_depths(n, n//2)) for n in pop_sizes)
+
+    rows = []
+    for n, depth in configs:
+        seconds = time_step(n, depth, steps=steps)
+        depth = depth if isinstance(depth, int) else [int(d) for d in depth]
+        rows.append(dict(n=n, depth=depth,
+                            tessellations=tessellations_per_step(n, depth),
+                            seconds=seconds))
+        if verbose:
+            label = depth if isinstance(depth, int) else f"mixed({sum(depth)} d1)"
+            print(f"n={n:<5} depth={label!s:<14}{seconds:>10.3f} s/step")
+    return rows
+
+
+def _power_law(ns, ys):
+    exponent, log_coef = np.polyfit(np.log(ns), np.log(ys), 1)
+    return dict(coef=float(np.exp(log_coef)), exponent=float(exponent))
+
+
+def fit(rows):
+    """
+    Fits the cost model to rows from profile(...).
+    Returns:
+        dict, see predict_step_seconds(...)
+    """
+    per_depth = {}
+    for depth in sorted(set(r["depth"] for r in rows if isinstance(r["depth"], int))):
+        sub = [r for r in rows if r["depth"] == depth]
+        if len(set(r["n"] for r in sub)) < 2:
+            continue
+        per_depth[str(depth)] = _power_law([r["n"] for r in sub],
+                                            [r["seconds"] for r in sub])
+
+    per_tessellation = _power_law([r["n"] for r in rows],
+                                    [r["seconds"]/r["tessellations"] for r in rows])
+
+    return dict(version=MODEL_VERSION,
+                fitted=dt.datetime.now().isoformat(timespec="seconds"),
+                machine=platform.node(),
+                per_depth=per_depth,
+                per_tessellation=per_tessellation,
+                rows=rows)
+
+
+def predict_step_seconds(model, n, depth):
+    """
+    Predicted wall time of one SelfishHerd.run step.
+    Args:
+        model (dict): from fit(...) or load_model(...)
+        n (int): population size
+        depth (int or array-like): depth(s) of reasoning
+    Returns:
+        float, seconds
+    """
+    if isinstance(depth, (int, np.integer)) and str(int(depth)) in model["per_depth"]:
+        law = model["per_depth"][str(int(depth))]
+        return law["coef"]*n**law["exponent"]
+
+    law = model["per_tessellation"]
+    return tessellations_per_step(n, depth)*law["coef"]*n**law["exponent"]
+
+
+def predict_run_seconds(model, n, depth, tmax=None):
+    """
+    Predicted wall time of a whole simulation of tmax (default config.TMAX)
+    steps.
+    """
+    if tmax is None:
+        tmax = config.TMAX
+    return tmax*predict_step_seconds(model, n, depth)
+
+
+def save_model(model, path=None):
+    if path is None:
+        path = config.COST_MODEL
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as file_obj:
+        json.dump(model, file_obj, indent=2)
+
+def load_model(path=None):
+    if path is None:
+        path = config.COST_MODEL
+    with open(path) as file_obj:
+        return json.load(file_obj)
+
+
+def report(model):
+    """
+    Predicted costs of everything main.py would simulate.
+    Returns:
+        list of (label, n, seconds per step, seconds per run, core-hours for
+        config.NUM_REPEATS runs)
+    """
+    configs = []
+    for n, depths in config.POP_S_DOR.items():
+        for depth in depths:
+            configs.append((f"d{depth}", n, depth))
+    for n, smarts in config.POP_S_SMART_GUYS_HG.items():
+        for num_smart in smarts:
+            configs.append((f"hunger games, {num_smart} d1", n,
+                            hungergames_depths(n, num_smart)))
+
+    rows = []
+    for label, n, depth in configs:
+        step = predict_step_seconds(model, n, depth)
+        run = predict_run_seconds(model, n, depth)
+        rows.append((label, n, step, run, run*config.NUM_REPEATS/3600))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit and report the simulation cost model.")
+    parser.add_argument("action", choices=["profile", "report"])
+    parser.add_argument("--pop-sizes", type=int, nargs="*", default=PROFILE_POP_SIZES)
+    parser.add_argument("--depths", type=int, nargs="*", default=PROFILE_DEPTHS)
+    parser.add_argument("--steps", type=int, default=PROFILE_STEPS,
+                        help="Steps to time per configuration")
+    parser.add_argument("--model", default=None,
+                        help="Cost model file (default: config.COST_MODEL)")
+    args = parser.parse_args()
+
+    if args.action == "profile":
+        model = fit(profile(args.pop_sizes, args.depths, steps=args.steps))
+        save_model(model, args.model)
+        print("\nfitted seconds per step = coef * n**exponent")
+        for depth, law in model["per_depth"].items():
+            print(f"  d{depth}: coef={law['coef']:.3e}, exponent={law['exponent']:.2f}")
+        law = model["per_tessellation"]
+        print(f"  per tessellation: coef={law['coef']:.3e}, exponent={law['exponent']:.2f}")
+        print(f"model written to {args.model or config.COST_MODEL}\n")
+    else:
+        model = load_model(args.model)
+
+    print(f"{'configuration':<24}{'n':>5}{'s/step':>10}{'h/run':>9}"
+            f"{'core-h/' + str(config.NUM_REPEATS) + ' runs':>20}")
+    for label, n, step, run, core_hours in report(model):
+        print(f"{label:<24}{n:>5}{step:>10.3f}{run/3600:>9.2f}{core_hours:>20.1f}")
@@ -7,13 +7,45 @@ Provides class SelfishHerd, a parallelisable way to instantiate and run
 simulations.
 """
 
+import hashlib
 import pickle
+import random
+import time
 
 import numpy as np
 
+import config
+import instrument
 import movement
+import runparams
+import trajstore
 import voronoi
 
+def _record_schedule(record, times):
+    """
+    The recording schedule of a saved simulation: as saved, else inferred from
+    the times it kept (a stride, if they are evenly spaced from 0).
+    """
+    if record is not None:
+        return record if isinstance(record, (str, int)) else frozenset(record)
+    times = list(times)
+    if times == list(range(len(times))):
+        return "all"
+    strides = set(np.diff(times[:-1])) if len(times) > 2 else set()
+    if times[0] == 0 and len(strides) == 1:
+        return int(strides.pop())
+    return "final"
+
+
+def frames_for(timerange, offsets=(0, 1, 5, 10)):
+    """
+    The frames an analysis over timerange reads, e.g., t, t+1, t+5 and t+10
+    for velocities. Useful as a recording schedule for SelfishHerd.
+    Returns:
+        sorted list of int
+    """
+    return sorted(set(t + offset for t in timerange for offset in offsets))
+
 class SelfishHerd:
     """
     Args:
@@ -21,19 +53,161 @@ class SelfishHerd:
         depth_of_reasoning (int or array-like): how deep they should anticipate others'
                     behaviours.
         init_locs (np.array, n*2): initial_locations of agents.
+        seed (int): seed for the random movement decisions, drawn fresh
+                    if not given. Saved with the data.
+        observers (list): observers.Observer objects to show every frame to,
+                    see observers.py.
+        record: which frames to keep, default config.RECORD_FRAMES. One of
+                    "all", an int stride (keep t = 0, stride, 2*stride, ...),
+                    an iterable of frame indices, or "final". The latest
+                    frame is always kept as well. self.times holds the time
+                    of each frame in self.records.
+        tolerance (float): stop anticipating once reasoning reaches a fixed
+                    point to within this tolerance, default
+                    config.REASONING_TOLERANCE (None: always reason to full
+                    depth). See movement.recursive_reasoning.
+        exit_mode (str): "herd" or "agent", default config.REASONING_EXIT
+        neighbourhood (tuple): ("hops", k) or ("radius", r) to anticipate
+                    using only each agent's neighbourhood, an approximation
+                    for large herds; None for exact anticipation. Default
+                    config.ANTICIPATION_NEIGHBOURHOOD.
+        engine (str): "exact" for movement.recursive_reasoning, "linear" for
+                    the faster, approximate movement.linearised_reasoning.
+                    Default config.ANTICIPATION_ENGINE.
+        params (runparams.RunParams): movement parameters, default those in
+                    config.py when the herd is made. Saved with the data.
+        common_random (bool): draw gradient directions from per-agent,
+                    per-step streams derived from seed (movement.AgentStreams),
+                    so that herds with the same seed share them across
+                    depths. Default config.COMMON_RANDOM_NUMBERS.
     """
 
     def __init__(self,
                     n,
                     depth_of_reasoning,
-                    init_locs):
+                    init_locs,
+                    seed=None,
+                    observers=None,
+                    record=None,
+                    tolerance=None,
+                    exit_mode=None,
+                    neighbourhood=None,
+                    engine=None,
+                    params=None,
+                    common_random=None):
 
         self.n = n
         self.depth = depth_of_reasoning
         self.init_locs = init_locs.copy()
-        self.records = init_locs.copy()
-        self.records = self.records[:,:,np.newaxis] #make 3d array
 
+        if record is None:
+            record = config.RECORD_FRAMES
+        if not isinstance(record, (str, int, np.integer)):
+            record = frozenset(int(t) for t in record)
+        elif isinstance(record, str) and record not in ("all", "final"):
+            raise ValueError(f"unknown recording schedule: {record}")
+        elif not isinstance(record, str) and record < 1:
+            raise ValueError(f"recording stride must be positive, got {record}")
+        self.record = record
+
+        self.t = 0
+        self.locs = init_locs.copy()
+        self._frames = []
+        self._times = []
+        self._keep(self.locs)
+
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = int(seed)
+        self._rng_state = None # state of random after the last step run
+
+        self.observers = [] if observers is None else list(observers)
+        self._last_observed = -1
+
+        # per-step counts, filled in while instrument.py is enabled
+        self.step_stats = []
+
+        if tolerance is None:
+            tolerance = config.REASONING_TOLERANCE
+        if exit_mode is None:
+            exit_mode = config.REASONING_EXIT
+        if exit_mode not in ("herd", "agent"):
+            raise ValueError(f"unknown exit mode: {exit_mode}")
+        self.tolerance = tolerance
+        self.exit_mode = exit_mode
+
+        if neighbourhood is None:
+            neighbourhood = config.ANTICIPATION_NEIGHBOURHOOD
+        if neighbourhood is not None:
+            kind, size = neighbourhood
+            if kind not in voronoi.NEIGHBOURHOOD_KINDS:
+                raise ValueError(f"unknown neighbourhood kind: {kind}")
+            neighbourhood = (kind, size)
+        self.neighbourhood = neighbourhood
+
+        if engine is None:
+            engine = config.ANTICIPATION_ENGINE
+        if engine not in ("exact", "linear"):
+            raise ValueError(f"unknown anticipation engine: {engine}")
+        if engine == "linear" and neighbourhood is not None:
+            raise ValueError("the linear engine does not use neighbourhoods")
+        self.engine = engine
+
+        self.params = runparams.resolve(params)
+
+        if common_random is None:
+            common_random = config.COMMON_RANDOM_NUMBERS
+        self.common_random = bool(common_random)
+        self.streams = movement.AgentStreams(self.seed) if self.common_random else None
+
+    def _wants(self, t):
+        if isinstance(self.record, str):
+            return self.record == "all"
+        if isinstance(self.record, frozenset):
+            return t in self.record
+        return t % self.record == 0
+
+    def _keep(self, locs):
+        if self._wants(self.t):
+            self._frames.append(locs)
+            self._times.append(self.t)
+
+    @property
+    def records(self):
+        """
+        np.ndarray, n×2×len(self.times): the recorded frames
+        """
+        frames = self._frames
+        if len(self._times) == 0 or self._times[-1] != self.t:
+            frames = frames + [self.locs]
+        return np.dstack(frames)
+
+    @property
+    def times(self):
+        """
+        list of int: time of each frame in self.records
+        """
+        if len(self._times) == 0 or self._times[-1] != self.t:
+            return self._times + [self.t]
+        return list(self._times)
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def _notify(self, locs, vor):
+        t = self.t
+        if t == self._last_observed:
+            return
+        for observer in self.observers:
+            observer.observe(t, locs, vor, self)
+        self._last_observed = t
+
+    def flush_observers(self):
+        """
+        Lets observers write out what they have computed so far.
+        """
+        for observer in self.observers:
+            observer.flush(self)
 
     def run(self, t):
         """
@@ -42,26 +216,268 @@ class SelfishHerd:
             t (int): how many iterations to update the model.
         """
 
+        if self._rng_state is None:
+            random.seed(self.seed)
+        else:
+            random.setstate(self._rng_state)
+
+        instrumented = instrument.is_enabled()
         for _ in range(t):
-            locs = self.records.copy()[:,:,-1]
-            vor = voronoi.get_bounded_voronoi(locs)
+            if instrumented:
+                before = instrument.counters.snapshot()
+                start = time.perf_counter()
+
+            locs = self.locs.copy()
+            vor = voronoi.cached_voronoi(locs)
+            if self.streams is not None:
+                self.streams.start_step(self.t)
+            self._notify(locs, vor)
+
+            neighbours = None
+            if self.neighbourhood is not None:
+                neighbours = voronoi.neighbourhoods(locs, vor, *self.neighbourhood)
+
+            reasoning = None if self.tolerance is None else {}
+            if self.engine == "linear":
+                next_locs = movement.linearised_reasoning(locs, vor, self.depth,
+                                                            stats=reasoning,
+                                                            params=self.params)
+            else:
+                next_locs = movement.recursive_reasoning(locs, vor, self.depth,
+                                                        locs,
+                                                        tolerance=self.tolerance,
+                                                        exit_mode=self.exit_mode,
+                                                        stats=reasoning,
+                                                        neighbours=neighbours,
+                                                        params=self.params,
+                                                        rng=self.streams)
+            if instrumented or reasoning is not None:
+                step = dict(t=self.t)
+                if instrumented:
+                    step.update(instrument.counters.since(before),
+                                seconds=time.perf_counter() - start)
+                if reasoning is not None:
+                    # effective depth of reasoning used this step
+                    step.update(depth=reasoning.get("depth", 0),
+                                agent_levels=reasoning.get("agent_levels",
+                                                np.zeros(self.n, dtype=int)).tolist())
+                self.step_stats.append(step)
+            self.t += 1
+            self.locs = next_locs
+            self._keep(next_locs)
+
+        self._rng_state = random.getstate()
+        if len(self.observers) > 0:
+            self._notify(self.locs.copy(), None)
 
-            next_locs = movement.recursive_reasoning(locs, vor, self.depth,
-                                                        locs)
-            self.records = np.dstack((self.records, next_locs))
 
+    @classmethod
+    def from_saved(cls, key, depth=None):
+        """
+        Restores a saved simulation so that it can be run further: its last
+        frame (at full precision), depths, seed, movement parameters,
+        recording schedule and the state of its random number generator.
+        Legacy pickles keep none of these but their frames: give depth, and
+        they carry on with config.py's parameters and a fresh seed.
+        Args:
+            key (str): any trajectory key, see trajstore.py
+            depth (int or array-like): needed only for legacy pickles
+        Returns:
+            SelfishHerd, with t the time of the last saved frame
+        """
+        raw = trajstore.store_for(key).read(str(key))
+        metadata = trajstore.read_metadata(key)
+        last = np.asarray(raw[:, :, raw.shape[2] - 1], dtype=np.float64)
+        try:
+            first = initial_locations(key)
+        except ValueError:
+            first = None
+
+        if metadata is None:
+            if depth is None:
+                raise ValueError(f"{key} has no metadata, give its depth")
+            if not config.SUPPRESS_INFORMATIVE_PRINT:
+                print(f"{key}: no metadata, carrying on with a fresh seed")
+            herd = cls(last.shape[0], depth, first, record="all")
+            herd.t = raw.shape[2] - 1
+            herd.locs = last
+            herd._last_observed = herd.t
+            return herd
+
+        depths = np.array(metadata["depth"], dtype=int)
+        if depth is None:
+            depth = int(depths[0]) if (depths == depths[0]).all() else depths
+        params = metadata["params"]
+        state = metadata.get("state", {})
+        times = metadata.get("times", list(range(raw.shape[2])))
+
+        neighbourhood = params.get("ANTICIPATION_NEIGHBOURHOOD")
+        # without initial locations, the last frame stands in for them while
+        # constructing; t and locs are set below either way
+        herd = cls(metadata["n"], depth, last if first is None else first,
+                    seed=metadata["seed"],
+                    record=_record_schedule(state.get("record"), times),
+                    tolerance=params.get("REASONING_TOLERANCE"),
+                    exit_mode=params.get("REASONING_EXIT", "herd"),
+                    neighbourhood=None if neighbourhood is None else tuple(neighbourhood),
+                    engine=params.get("ANTICIPATION_ENGINE", "exact"),
+                    params=runparams.RunParams.from_dict(params),
+                    common_random=params.get("COMMON_RANDOM_NUMBERS", False))
+        # None means "as in config.py" to the constructor, but not here
+        herd.tolerance = params.get("REASONING_TOLERANCE")
+        herd.neighbourhood = None if neighbourhood is None else tuple(neighbourhood)
+
+        if first is None:
+            herd.init_locs = None
+        herd.t = int(state.get("t", times[-1]))
+        herd.locs = np.array(state["final_locs"]) if "final_locs" in state else last
+        herd._last_observed = herd.t
+        if state.get("rng_state") is not None:
+            version, internal, gauss = state["rng_state"]
+            herd._rng_state = (version, tuple(internal), gauss)
+        else:
+            # not saved: carry on with a stream distinct from the one used so far
+            herd._rng_state = random.Random(f"{herd.seed}:{herd.t}").getstate()
+        return herd
+
+    def frames_after(self, t):
+        """
+        Returns:
+            the recorded frames after time t (n×2×k np.ndarray), and their
+            times (list of int)
+        """
+        times = self.times
+        keep = [i for i, t_ in enumerate(times) if t_ > t]
+        return self.records[:, :, keep], [times[i] for i in keep]
+
+    def metadata(self):
+        """
+        Returns:
+            dict: everything needed to interpret (or redo) this simulation
+        """
+        depth = self.depth
+        if isinstance(depth, (int, np.integer)):
+            depth = np.ones(self.n, dtype=int)*depth
+
+        record = self.record
+        if isinstance(record, frozenset):
+            record = sorted(record)
+        rng_state = self._rng_state
+        if rng_state is not None:
+            rng_state = [rng_state[0], list(rng_state[1]), rng_state[2]]
+
+        return dict(n=int(self.n),
+                    depth=[int(d) for d in depth],
+                    seed=self.seed,
+                    # at full precision, and whether or not frame 0 is recorded
+                    init_locs=None if self.init_locs is None else self.init_locs.tolist(),
+                    num_frames=len(self.times),
+                    times=self.times,
+                    # what continue_saved(...) needs to carry on exactly
+                    state=dict(t=int(self.t),
+                                final_locs=self.locs.tolist(),
+                                rng_state=rng_state,
+                                record=record),
+                    params=dict(self.params.as_dict(),
+                                REASONING_TOLERANCE=self.tolerance,
+                                REASONING_EXIT=self.exit_mode,
+                                ANTICIPATION_NEIGHBOURHOOD=self.neighbourhood,
+                                ANTICIPATION_ENGINE=self.engine,
+                                COMMON_RANDOM_NUMBERS=self.common_random))
 
     def savedata(self, filename):
         """
-        Pickle-dumps the records to given filename
+        Saves the records to given filename. A .npy filename (the default
+        everywhere) gives a memory-mappable file plus a .json metadata sidecar,
+        see trajstore.py. A .pkl filename pickle-dumps the records as before,
+        which loses self.times: only pickle runs that record every frame.
+        Either way, positions are stored as config.TRAJ_STORAGE_DTYPE, and
+        each file is moved into place only once it is fully written (the
+        sidecar last, see trajstore.is_saved).
         """
 
-        with open(filename, "wb") as file_obj:
-            pickle.dump(self.records, file_obj)
+        dtype = trajstore.storage_dtype()
+        if str(filename).endswith(".pkl"):
+            with trajstore.atomic_write(filename, "wb") as file_obj:
+                pickle.dump(self.records.astype(dtype), file_obj)
+            return
+
+        trajstore.save_npy(filename, self.records, dtype=dtype)
+        trajstore.save_metadata(filename, dict(self.metadata(), dtype=dtype.name))
 
 
     def __str__(self):
-        return f"SelfishHerd object with {self.n} individuals and {self.records.shape[2]} rows of data."
+        return f"SelfishHerd object with {self.n} individuals and {len(self.times)} rows of data."
 
     def __repr__(self):
         return self.__str__()
+
+
+def seed_for(uname):
+    """
+    A seed derived from a simulation's uname, for replicates saved without
+    one (e.g., legacy pickles): with config.COMMON_RANDOM_NUMBERS, every
+    depth of the replicate then still draws the same coins.
+    Returns:
+        int
+    """
+    return int.from_bytes(hashlib.sha256(str(uname).encode()).digest()[:8], "little")
+
+
+def initial_locations(key):
+    """
+    Initial positions of a saved simulation: from its metadata (at full
+    precision) where they are kept, else its first frame.
+    Args:
+        key (str): any trajectory key, see trajstore.py
+    Returns:
+        np.ndarray, n×2
+    Raises:
+        ValueError if they are unknown: frame 0 was not recorded, and the run
+        was saved before metadata kept initial positions
+    """
+    metadata = trajstore.read_metadata(key)
+    if metadata is not None and metadata.get("init_locs") is not None:
+        return np.array(metadata["init_locs"], dtype=np.float64)
+    times = None if metadata is None else metadata.get("times")
+    if times is not None and (len(times) == 0 or times[0] != 0):
+        raise ValueError(f"{key} did not record its initial positions")
+    raw = trajstore.store_for(key).read(str(key))
+    return np.asarray(raw[:, :, 0], dtype=np.float64)
+
+
+def continue_saved(key, tmax, depth=None):
+    """
+    Runs the saved simulation behind key on to time tmax, see
+    SelfishHerd.from_saved(...).
+    Returns:
+        frames recorded after the saved ones (n×2×k np.ndarray), and
+        metadata for the whole, extended simulation (None for legacy pickles)
+    """
+    herd = SelfishHerd.from_saved(key, depth=depth)
+    t0 = herd.t
+    herd.run(max(0, tmax - t0))
+    frames, times = herd.frames_after(t0)
+
+    old_metadata = trajstore.read_metadata(key)
+    if old_metadata is None:
+        return frames, None
+    old_times = old_metadata.get("times")
+    if old_times is None:
+        old_times = list(range(t0 + 1))
+    metadata = dict(old_metadata, **herd.metadata())
+    metadata.update(times=old_times + times, num_frames=len(old_times) + len(times))
+    return frames, metadata
+
+
+def extend(key, tmax, depth=None):
+    """
+    Continues the saved simulation behind key (pickle, npy or archived) to
+    time tmax, appending the new frames to it in place.
+    Returns:
+        int, the number of frames appended
+    """
+    frames, metadata = continue_saved(key, tmax, depth=depth)
+    if frames.shape[2] > 0:
+        trajstore.append(key, frames, metadata)
+    return frames.shape[2]
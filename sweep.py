@@ -0,0 +1,370 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides parameter sweeps: every combination of movement parameters in a grid
+(config.SWEEP_GRID, see runparams.py), for every population size and depth
+(config.POP_S_DOR) and config.NUM_REPEATS replicates, run by one pool. Since
+each SelfishHerd carries its own parameters, all of these run side by side,
+and the pool stays busy until the very last job.
+
+Replicate r of population size n starts from the same initial locations (and
+has the same uname) for every depth and parameter set, as in main.py; with
+config.COMMON_RANDOM_NUMBERS, it also draws the same random numbers. A sweep
+called name is laid out as
+    config.SWEEP_DIR/name/sweep.json     (the parameter sets, and how they
+                                          were run)
+    config.SWEEP_DIR/name/p000/25/d1/25-1-<uname>.npy
+    config.SWEEP_DIR/name/p000/results.h5  (metrics observed during runs, if
+                                            config.OBSERVE_METRICS is set)
+Jobs start longest first (using the cost model from scaling.py, if one has
+been fitted). The seed that lays out initial locations is kept in sweep.json,
+and runs already on disk are skipped, so an interrupted sweep can be
+restarted with the same command:
+
+    python3 sweep.py plan --name sens --set multpl_factor=0.05,0.1 dx=0.001,0.005
+    python3 sweep.py run --name sens --set multpl_factor=0.05,0.1 dx=0.001,0.005
+
+With --queue, run puts the jobs in a queue for workers on other hosts instead
+(see jobqueue.py).
+
+"extend" carries finished runs on to a later time, appending to them in place
+(see selfishherd.continue_saved), e.g., every main.py run with n=50, d=1:
+    python3 sweep.py extend --tmax 1000 --pop-sizes 50 --depths 1
+or, with --name, the runs of a sweep.
+"""
+
+import argparse
+import datetime as dt
+import json
+import multiprocessing as mp
+import os
+import os.path
+from os.path import join as joinpath
+import uuid
+
+import numpy as np
+
+import config
+import measurements
+import observers
+import runparams
+import scaling
+import selfishherd
+import telemetry
+import trajstore
+
+
+def sweep_dir(name):
+    return joinpath(config.SWEEP_DIR, name)
+
+
+def label_for(index):
+    return f"p{index:03d}"
+
+
+def cost_model():
+    """
+    The cost model from scaling.py, or None if none has been fitted.
+    """
+    try:
+        return scaling.load_model()
+    except (OSError, ValueError):
+        return None
+
+
+def job_cost(n, depth, model=None):
+    """
+    Relative cost of a run, to order jobs by: predicted seconds given a cost
+    model, else tessellations per step times n.
+    """
+    if model is not None:
+        return scaling.predict_run_seconds(model, n, depth)
+    return scaling.tessellations_per_step(n, depth)*n
+
+
+def replicate(seed, n, index):
+    """
+    Initial locations, uname and seed of replicate index of population size
+    n, the same whenever they are made from the same seed, whichever other
+    population sizes or how many replicates are laid out alongside.
+    Returns:
+        (np.ndarray n×2, str, int)
+    """
+    rng = np.random.default_rng([seed, n, index])
+    init = rng.uniform(size=(n, 2))
+    uname = str(uuid.UUID(bytes=rng.bytes(16), version=4))
+    return init, uname, int(rng.integers(2**63))
+
+
+def make_jobs(name, param_sets, seed, pop_s_dor=None, repeats=None):
+    """
+    Lays out a sweep, see the module docstring.
+    Args:
+        name (str): name of the sweep
+        param_sets (list of runparams.RunParams)
+        seed (int): seed for initial locations and unames. Laying out the
+                    sweep again with the same seed gives the same jobs, and
+                    each replicate the same run (see replicate(...)) even
+                    with other population sizes or repeats.
+        pop_s_dor (dict): population size -> depths, default config.POP_S_DOR
+        repeats (int): replicates per (parameter set, n, depth),
+                    default config.NUM_REPEATS
+    Returns:
+        list of jobs (dicts), longest first
+    """
+    if pop_s_dor is None:
+        pop_s_dor = config.POP_S_DOR
+    if repeats is None:
+        repeats = config.NUM_REPEATS
+
+    model = cost_model()
+
+    jobs = []
+    for n in sorted(pop_s_dor):
+        replicates = [replicate(seed, n, r) for r in range(repeats)]
+        for depth in pop_s_dor[n]:
+            cost = job_cost(n, depth, model)
+            for index, params in enumerate(param_sets):
+                label = label_for(index)
+                for init, uname, seed_ in replicates:
+                    jobs.append(dict(label=label, params=params, n=n, depth=depth,
+                                    init_locs=init, cost=cost,
+                                    seed=seed_ if config.COMMON_RANDOM_NUMBERS else None,
+                                    filename=joinpath(sweep_dir(name), label, str(n),
+                                                        f"d{depth}",
+                                                        f"{n}-{depth}-{uname}.npy"),
+                                    store_path=joinpath(sweep_dir(name), label,
+                                                        "results.h5")))
+
+    jobs.sort(key=lambda job: -job["cost"])
+    return jobs
+
+
+def write_manifest(name, param_sets, seed, pop_s_dor, repeats):
+    """
+    Records what a sweep runs, in config.SWEEP_DIR/name/sweep.json.
+    """
+    manifest = dict(name=name,
+                    created=dt.datetime.now().isoformat(timespec="seconds"),
+                    param_sets={label_for(i): p.as_dict() for i, p in enumerate(param_sets)},
+                    pop_s_dor={str(n): list(depths) for n, depths in pop_s_dor.items()},
+                    repeats=repeats,
+                    seed=seed,
+                    tmax=config.TMAX)
+    os.makedirs(sweep_dir(name), exist_ok=True)
+    with open(joinpath(sweep_dir(name), "sweep.json"), "w") as file_obj:
+        json.dump(manifest, file_obj, indent=2)
+
+
+def load_manifest(name):
+    with open(joinpath(sweep_dir(name), "sweep.json")) as file_obj:
+        manifest = json.load(file_obj)
+    manifest["param_sets"] = {label: runparams.RunParams.from_dict(p)\
+                                for label, p in manifest["param_sets"].items()}
+    return manifest
+
+
+def run_job(job):
+    """
+    Runs one simulation of a sweep (parallelization helper function).
+    Returns:
+        str, the filename of the job
+    """
+    np.random.seed()
+    herd = selfishherd.SelfishHerd(job["n"], job["depth"], job["init_locs"],
+                                    seed=job["seed"], params=job["params"])
+    if len(config.OBSERVE_METRICS) > 0:
+        herd.add_observer(observers.MetricObserver(config.OBSERVE_METRICS,
+                                    measurements._uname_for(job["filename"]),
+                                    store_path=job["store_path"],
+                                    eps=config.OBSERVE_EPS))
+    with telemetry.track(herd, job["filename"], config.TMAX, run=job.get("run")):
+        herd.run(config.TMAX)
+    herd.flush_observers()
+    if config.SAVE_TRAJECTORIES:
+        os.makedirs(os.path.dirname(job["filename"]), exist_ok=True)
+        herd.savedata(job["filename"])
+    return job["filename"]
+
+
+def pending(jobs):
+    """
+    Jobs whose trajectories are not completely saved yet (see
+    trajstore.is_saved). (Without config.SAVE_TRAJECTORIES nothing is saved,
+    so every job is pending.)
+    """
+    if not config.SAVE_TRAJECTORIES:
+        return list(jobs)
+    return [job for job in jobs\
+                if not trajstore.is_saved(job["filename"], n=job["n"], tmax=config.TMAX)]
+
+
+def run(jobs, processes=None):
+    """
+    Runs jobs in one pool, as they finish.
+    Args:
+        processes (int): pool size, default one per CPU
+    """
+    telemetry.start_run([(job["n"], job["depth"]) for job in jobs],
+                        processes=processes or os.cpu_count())
+    with mp.Pool(processes) as pool:
+        for done, filename in enumerate(pool.imap_unordered(run_job, jobs,
+                                                                chunksize=1)):
+            if not config.SUPPRESS_INFORMATIVE_PRINT:
+                print(f"{dt.datetime.now()} [{done + 1}/{len(jobs)}] {filename}")
+
+
+def saved_runs(pop_s_dor, name=None):
+    """
+    Keys of the saved runs of each (n, depth): those of main.py in the
+    configured store (config.TRAJ_STORE), or those of sweep name.
+    Returns:
+        list of (key, depth)
+    """
+    runs = []
+    for n, depths in pop_s_dor.items():
+        for depth in depths:
+            if name is None:
+                keys = measurements._files_for(n, depth)
+            else:
+                keys = []
+                for label in sorted(os.listdir(sweep_dir(name))):
+                    store = trajstore.NpyStore(joinpath(sweep_dir(name), label))
+                    keys.extend(store.list(f"{n}/d{depth}", f"{n}-{depth}-*"))
+            runs.extend((key, depth) for key in keys)
+    return runs
+
+
+def _continue_job(args):
+    key, depth, tmax = args
+    frames, metadata = selfishherd.continue_saved(key, tmax, depth=depth)
+    return key, frames, metadata
+
+
+def extend(runs, tmax, processes=None):
+    """
+    Carries saved runs on to time tmax. Workers simulate; this process does
+    all the appending. Files are appended to as their runs finish. Workers
+    keep the HDF5 archive open for reading (and HDF5 locks it while they do),
+    so runs in the archive are appended to once the pool has exited, and
+    their new frames are held in memory until then.
+    (Observers are not attached: compute metrics of the new frames post hoc.)
+    Args:
+        runs (list): (key, depth) pairs, see saved_runs(...)
+        processes (int): pool size, default one per CPU
+    """
+    jobs = [(key, depth, tmax) for key, depth in runs]
+    archived = []
+    with mp.Pool(processes) as pool:
+        for done, (key, frames, metadata) in enumerate(
+                            pool.imap_unordered(_continue_job, jobs, chunksize=1)):
+            if frames.shape[2] > 0:
+                if isinstance(trajstore.store_for(key), trajstore.HDF5Store):
+                    archived.append((key, frames, metadata))
+                else:
+                    trajstore.append(key, frames, metadata)
+            if not config.SUPPRESS_INFORMATIVE_PRINT:
+                print(f"{dt.datetime.now()} [{done + 1}/{len(jobs)}] {key}:"
+                        f" {frames.shape[2]} new frames")
+
+    for key, frames, metadata in archived:
+        trajstore.append(key, frames, metadata)
+    if len(archived) > 0 and not config.SUPPRESS_INFORMATIVE_PRINT:
+        print(f"{len(archived)} runs appended to the archive")
+
+
+def parse_grid(settings):
+    """
+    Parses ["field=v1,v2", ...] from the command line into a grid for
+    runparams.grid(...).
+    """
+    grid = {}
+    for setting in settings:
+        field, _, values = setting.partition("=")
+        if field not in runparams.CONFIG_NAMES or values == "":
+            raise ValueError(f"cannot parse {setting!r}, expected e.g."
+                                f" multpl_factor=0.05,0.1 (fields:"
+                                f" {', '.join(runparams.CONFIG_NAMES)})")
+        grid[field] = [float(v) for v in values.split(",")]
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run grids of movement parameters in one pool.")
+    parser.add_argument("action", choices=["plan", "run", "extend"])
+    parser.add_argument("--name", default=None,
+                        help="Name of the sweep (with extend: default main.py's runs)")
+    parser.add_argument("--set", nargs="*", default=None, dest="settings",
+                        help="Parameter values to sweep, e.g., multpl_factor=0.05,0.1"
+                                " (default: config.SWEEP_GRID)")
+    parser.add_argument("--pop-sizes", type=int, nargs="*", default=None,
+                        help="Population sizes (default: those in config.POP_S_DOR)")
+    parser.add_argument("--depths", type=int, nargs="*", default=None,
+                        help="Depths for every population size (default: config.POP_S_DOR)")
+    parser.add_argument("--repeats", type=int, default=config.NUM_REPEATS)
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for initial locations (default: that of an"
+                                " existing sweep of this name, else fresh)")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--tmax", type=int, default=None,
+                        help="With extend, the time to carry runs on to")
+    parser.add_argument("--queue", nargs="?", const="", default=None,
+                        help="With run, add the runs to a job queue (default:"
+                                " config.JOB_QUEUE_DIR) for jobqueue.py workers"
+                                " instead of running them here")
+    args = parser.parse_args()
+
+    grid = config.SWEEP_GRID if args.settings is None else parse_grid(args.settings)
+    param_sets = runparams.grid(**grid)
+    pop_sizes = args.pop_sizes if args.pop_sizes is not None else list(config.POP_S_DOR)
+    pop_s_dor = {n: (args.depths if args.depths is not None
+                        else config.POP_S_DOR.get(n, [0])) for n in pop_sizes}
+
+    if args.action == "extend":
+        if args.tmax is None:
+            raise SystemExit("extend needs --tmax")
+        runs = saved_runs(pop_s_dor, args.name)
+        print(f"extending {len(runs)} runs to t={args.tmax}")
+        extend(runs, args.tmax, processes=args.processes)
+
+    else:
+        if args.name is None:
+            raise SystemExit(f"{args.action} needs --name")
+        seed = args.seed
+        if os.path.exists(joinpath(sweep_dir(args.name), "sweep.json")):
+            manifest = load_manifest(args.name)
+            if list(manifest["param_sets"].values()) != param_sets:
+                raise SystemExit(f"sweep {args.name} exists with other parameter sets,"
+                                    " choose another name")
+            if seed is None:
+                seed = manifest["seed"]
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+
+        jobs = make_jobs(args.name, param_sets, seed, pop_s_dor, args.repeats)
+        todo = pending(jobs)
+        print(f"{len(param_sets)} parameter sets x {sum(map(len, pop_s_dor.values()))}"
+                f" (n, depth) x {args.repeats} replicates = {len(jobs)} runs,"
+                f" {len(todo)} still to do")
+
+        if args.action == "plan":
+            for index, params in enumerate(param_sets):
+                print(f"  {label_for(index)}: {params.as_dict()}")
+            try:
+                model = scaling.load_model()
+                seconds = sum(scaling.predict_run_seconds(model, job["n"], job["depth"])\
+                                for job in todo)
+                print(f"predicted: {seconds/3600:.1f} core-hours")
+            except (OSError, ValueError):
+                print("no cost model found, run python3 scaling.py profile for estimates")
+
+        elif args.action == "run":
+            write_manifest(args.name, param_sets, seed, pop_s_dor, args.repeats)
+            if args.queue is None:
+                run(todo, processes=args.processes)
+            else:
+                import jobqueue
+                queue = jobqueue.JobQueue(args.queue or None)
+                print(f"{queue.enqueue(todo)} runs added to {queue.path}")
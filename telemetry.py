@@ -0,0 +1,452 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides live telemetry for long batches of simulations (main.py's RUN_SIMS,
+sweep.py and jobqueue.py workers). Every run is logged as JSON lines in
+config.TELEMETRY_DIR, one file per host (appends from several processes on a
+host stay whole lines; hosts never share a file):
+
+    plan      what a batch will run: counts per (n, depth), and TMAX
+    start     a job started: run, job, host, pid, n, depth, cores of the host
+    progress  every config.TELEMETRY_INTERVAL seconds while a job runs: its
+              time step and current steps/s
+    end       a job finished: start, end, steps, steps/s, peak RSS (MB) of
+              the job, and whether it succeeded
+
+Records of one batch share its run id (see start_run(...); a job queue is
+one run). Jobs log themselves with
+
+    with telemetry.track(herd, filename, tmax):
+        herd.run(tmax)
+
+and "python3 telemetry.py status" summarises the latest run: throughput, how
+busy each host's cores are, the slowest jobs still running, and when the run
+should finish at the step rates observed so far.
+"""
+
+import argparse
+from contextlib import contextmanager
+import datetime as dt
+import glob
+import json
+import os
+import os.path
+from os.path import join as joinpath
+import resource
+import socket
+import time
+
+import numpy as np
+
+import config
+import observers
+import scaling
+
+ENV_VAR = "SELFISH_HERD_RUN"
+
+
+def current_run():
+    """
+    The run id this process logs jobs under: set by start_run(...) in this
+    process or its parent, else None.
+    """
+    return os.environ.get(ENV_VAR)
+
+
+def _host():
+    return socket.gethostname()
+
+
+def emit(record, directory=None):
+    """
+    Appends record, with its time, to this host's log.
+    """
+    if directory is None:
+        directory = config.TELEMETRY_DIR
+    os.makedirs(directory, exist_ok=True)
+    record = dict(record, time=time.time())
+    line = (json.dumps(record) + "\n").encode()
+    fd = os.open(joinpath(directory, f"{_host()}.jsonl"),
+                    os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def _depth_label(depth):
+    """
+    Depths as logged: an int, or "mixed" for herds with a depth per agent.
+    """
+    if isinstance(depth, (int, np.integer)):
+        return int(depth)
+    return "mixed"
+
+
+def plan(run, jobs, tmax=None, processes=None):
+    """
+    Logs what run will do.
+    Args:
+        run (str): run id
+        jobs (iterable): (n, depth) of every job
+        processes (int): workers the run uses on this host, if known
+    """
+    if not config.TELEMETRY:
+        return
+    if tmax is None:
+        tmax = config.TMAX
+    counts = {}
+    for n, depth in jobs:
+        key = (int(n), _depth_label(depth))
+        counts[key] = counts.get(key, 0) + 1
+    if len(counts) == 0:
+        return
+    emit(dict(event="plan", run=run, host=_host(), pid=os.getpid(),
+                tmax=tmax, processes=processes,
+                jobs=[[n, depth, count] for (n, depth), count in counts.items()]))
+
+
+def start_run(jobs, tmax=None, processes=None):
+    """
+    Starts a new run in this process (and the worker processes it starts
+    afterwards), and logs its plan.
+    Returns:
+        str, the run id
+    """
+    run = f"{dt.datetime.now():%Y%m%d-%H%M%S}-{_host()}-{os.getpid()}"
+    os.environ[ENV_VAR] = run
+    plan(run, jobs, tmax=tmax, processes=processes)
+    return run
+
+
+def _reset_peak_rss():
+    """
+    Resets this process's peak RSS, where Linux allows it, so that it can be
+    read per job.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file_obj:
+            file_obj.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as file_obj:
+            for line in file_obj:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    # peak over the life of the process (kB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024**2 if peak > 1024**3 else peak/1024
+
+
+class ProgressObserver(observers.Observer):
+    """
+    Logs a job's progress at most every interval seconds.
+    """
+
+    def __init__(self, record, interval=None):
+        if interval is None:
+            interval = config.TELEMETRY_INTERVAL
+        self.record = record
+        self.interval = interval
+        self.last_time = time.time()
+        self.last_t = None
+
+    def observe(self, t, locs, vor, herd):
+        if self.last_t is None:
+            self.last_t = t
+        now = time.time()
+        if now - self.last_time >= self.interval:
+            emit(dict(self.record, event="progress", t=t,
+                        steps_per_s=(t - self.last_t)/(now - self.last_time)))
+            self.last_time, self.last_t = now, t
+
+
+@contextmanager
+def track(herd, job, tmax, run=None):
+    """
+    *CONTEXT MANAGER*
+    Logs the start and end of a job that runs herd for tmax steps (and its
+    progress in between), if config.TELEMETRY is set.
+    Args:
+        herd (selfishherd.SelfishHerd)
+        job (str): name of the job, e.g., the filename of its trajectory
+        run (str): run id, default current_run()
+    """
+    if not config.TELEMETRY:
+        yield
+        return
+    if run is None:
+        run = current_run()
+
+    record = dict(run=run, job=str(job), host=_host(), pid=os.getpid(),
+                    n=herd.n, depth=_depth_label(herd.depth))
+    _reset_peak_rss()
+    start, t0 = time.time(), herd.t
+    emit(dict(record, event="start", t0=t0, tmax=tmax, cores=os.cpu_count()))
+    progress = ProgressObserver(record)
+    herd.add_observer(progress)
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        herd.observers.remove(progress)
+        end = time.time()
+        steps = herd.t - t0
+        emit(dict(record, event="end", start=start, end=end, steps=steps,
+                    steps_per_s=steps/max(end - start, 1e-9),
+                    peak_rss_mb=round(_peak_rss_mb(), 1), ok=ok))
+
+
+def read_log(directory=None):
+    """
+    Returns:
+        list of dicts: every record from every host, in order of time
+    """
+    if directory is None:
+        directory = config.TELEMETRY_DIR
+    records = []
+    for filename in glob.glob(joinpath(directory, "*.jsonl")):
+        with open(filename) as file_obj:
+            for line in file_obj:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError: # a host died mid-line
+                    continue
+    records.sort(key=lambda record: record["time"])
+    return records
+
+
+def runs(records):
+    """
+    Returns:
+        list of run ids, in order of their first record
+    """
+    seen = {}
+    for record in records:
+        if record.get("run") is not None:
+            seen.setdefault(record["run"], record["time"])
+    return sorted(seen, key=seen.get)
+
+
+def _seconds_per_step(observed, n, depth):
+    """
+    Median seconds per step observed (in end or progress records) for
+    (n, depth); if there are none, scaled from other configurations by their
+    relative cost (see scaling.tessellations_per_step(...)).
+    """
+    rates = [r["steps_per_s"] for r in observed if (r["n"], r["depth"]) == (n, depth)\
+                and r["steps_per_s"] > 0]
+    if len(rates) > 0:
+        return 1/np.median(rates)
+    relative = [1/(r["steps_per_s"]*_cost(r["n"], r["depth"]))\
+                    for r in observed if r["steps_per_s"] > 0]
+    if len(relative) == 0:
+        return None
+    return np.median(relative)*_cost(n, depth)
+
+
+def _cost(n, depth):
+    return scaling.tessellations_per_step(n, 1 if depth == "mixed" else depth)*n
+
+
+def summarise(records, run=None, now=None, window=3600.0, top=10):
+    """
+    Summarises a run from its telemetry.
+    Args:
+        records (list): from read_log(...)
+        run (str): default the run planned (or started) last
+        window (float): seconds of recent history to measure rates over
+        top (int): how many straggling jobs to list
+    Returns:
+        dict with keys run, started, planned, done, failed, running, to_start,
+        jobs_per_hour and steps_per_s (over the window), hosts (host ->
+        cores, busy worker-seconds and utilisation over the window),
+        stragglers (the top running jobs with the longest projected
+        remaining time), remaining_core_seconds, workers (average busy
+        workers over the window), and eta (time of projected completion, or
+        None if no step rates have been observed yet)
+    """
+    if now is None:
+        now = time.time()
+    if run is None:
+        planned_runs = [r["run"] for r in records if r["event"] == "plan"]
+        all_runs = runs(records)
+        run = planned_runs[-1] if len(planned_runs) > 0 else\
+                (all_runs[-1] if len(all_runs) > 0 else None)
+    records = [r for r in records if r.get("run") == run]
+    since = now - window
+
+    planned, tmax = {}, config.TMAX
+    starts, ends, progress = {}, {}, {}
+    for r in records:
+        if r["event"] == "plan":
+            tmax = r["tmax"]
+            for n, depth, count in r["jobs"]:
+                planned[(n, depth)] = planned.get((n, depth), 0) + count
+        elif r["event"] == "start":
+            starts[r["job"]] = r
+            ends.pop(r["job"], None)
+            progress.pop(r["job"], None)
+        elif r["event"] == "progress":
+            progress[r["job"]] = r
+        elif r["event"] == "end":
+            ends[r["job"]] = r
+
+    finished = [r for r in ends.values() if r["ok"]]
+    failed = [r for r in ends.values() if not r["ok"]]
+    running = [r for job, r in starts.items() if job not in ends]
+    # step rates: of finished jobs, and so far of those still running
+    observed = finished + [progress[r["job"]] for r in running if r["job"] in progress]
+
+    # busy worker-seconds in the window, per host
+    hosts = {}
+    for r in list(starts.values()):
+        host = hosts.setdefault(r["host"], dict(cores=r.get("cores") or 1, busy=0.0))
+        end = ends[r["job"]]["end"] if r["job"] in ends else now
+        host["busy"] += max(0.0, min(end, now) - max(r["time"], since))
+    started = min((r["time"] for r in records), default=now)
+    span = max(1e-9, now - max(since, started))
+    for host in hosts.values():
+        host["utilisation"] = host["busy"]/(host["cores"]*span)
+    workers = sum(host["busy"] for host in hosts.values())/span
+
+    recent = [r for r in finished if r["end"] >= since]
+    steps_per_s = sum(r["steps"]*max(0.0, r["end"] - max(r["start"], since))\
+                        /max(r["end"] - r["start"], 1e-9) for r in recent)/span
+
+    # remaining work, in core-seconds
+    stragglers = []
+    remaining = 0.0
+    for r in running:
+        latest = progress.get(r["job"])
+        t_now = latest["t"] if latest is not None else r["t0"]
+        to_do = max(0, r["tmax"] - (t_now - r["t0"]))
+        per_step = _seconds_per_step(observed, r["n"], r["depth"])
+        if latest is not None and latest["steps_per_s"] > 0:
+            own = 1/latest["steps_per_s"]
+        else:
+            own = per_step
+        left = None if own is None else to_do*own
+        if left is not None:
+            remaining += left
+        stragglers.append(dict(job=r["job"], host=r["host"], pid=r["pid"],
+                                n=r["n"], depth=r["depth"],
+                                elapsed=now - r["time"], t=t_now - r["t0"],
+                                tmax=r["tmax"],
+                                steps_per_s=None if own is None else 1/own,
+                                vs_typical=None if (own is None or per_step is None)\
+                                            else per_step/own,
+                                silent=now - (latest or r)["time"]\
+                                        > 3*config.TELEMETRY_INTERVAL,
+                                remaining=left))
+    stragglers.sort(key=lambda s: -(s["remaining"] if s["remaining"] is not None
+                                        else np.inf))
+
+    counted = {}
+    for r in list(starts.values()):
+        key = (r["n"], r["depth"])
+        counted[key] = counted.get(key, 0) + 1
+    to_start = {key: max(0, count - counted.get(key, 0))\
+                    for key, count in planned.items()}
+    estimable = True
+    for (n, depth), count in to_start.items():
+        if count == 0:
+            continue
+        per_step = _seconds_per_step(observed, n, depth)
+        if per_step is None:
+            estimable = False
+            continue
+        remaining += count*tmax*per_step
+
+    eta = None
+    if estimable and (remaining == 0 or workers > 0):
+        longest = max((s["remaining"] or 0 for s in stragglers), default=0)
+        eta = now + max(remaining/max(workers, 1e-9) if remaining > 0 else 0,
+                        longest)
+
+    return dict(run=run, started=started, planned=sum(planned.values()),
+                done=len(finished), failed=len(failed), running=len(running),
+                to_start=sum(to_start.values()),
+                jobs_per_hour=len(recent)*3600/span, steps_per_s=steps_per_s,
+                hosts=hosts, workers=workers, stragglers=stragglers[:top],
+                remaining_core_seconds=remaining, eta=eta)
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days > 0:
+        return f"{days}d {hours}h"
+    if hours > 0:
+        return f"{hours}h {minutes:02d}m"
+    return f"{minutes}m {seconds:02d}s"
+
+
+def print_status(summary, window):
+    now = time.time()
+    print(f"run {summary['run']}, started {_duration(now - summary['started'])} ago")
+    print(f"jobs: {summary['planned']} planned, {summary['done']} done,"
+            f" {summary['running']} running, {summary['to_start']} to start,"
+            f" {summary['failed']} failed")
+    print(f"last {_duration(window)}: {summary['jobs_per_hour']:.1f} jobs/h,"
+            f" {summary['steps_per_s']:.1f} steps/s,"
+            f" {summary['workers']:.1f} workers busy on average")
+    for host, stats in sorted(summary["hosts"].items()):
+        print(f"  {host:<24} {stats['cores']:>4} cores {100*stats['utilisation']:>6.1f}% busy")
+
+    if len(summary["stragglers"]) > 0:
+        print("slowest running jobs:")
+        print(f"  {'job':<40}{'host':>14}{'n':>5}{'d':>6}{'elapsed':>10}"
+                f"{'t':>11}{'steps/s':>9}{'vs typ':>8}{'left':>10}")
+    for s in summary["stragglers"]:
+        rate = "" if s["steps_per_s"] is None else f"{s['steps_per_s']:.2f}"
+        ratio = "" if s["vs_typical"] is None else f"{s['vs_typical']:.2f}x"
+        left = "?" if s["remaining"] is None else _duration(s["remaining"])
+        if s["silent"]:
+            left += " (silent)"
+        print(f"  {os.path.basename(s['job'])[-40:]:<40}{s['host'][-14:]:>14}"
+                f"{s['n']:>5}{str(s['depth']):>6}{_duration(s['elapsed']):>10}"
+                f"{s['t']:>5}/{s['tmax']:<5}{rate:>9}{ratio:>8}{left:>10}")
+
+    if summary["eta"] is None:
+        print("projected completion: unknown until some step rates have been observed")
+    elif summary["to_start"] + summary["running"] == 0:
+        print("complete")
+    else:
+        print(f"projected completion: {dt.datetime.fromtimestamp(summary['eta']):%Y-%m-%d %H:%M}"
+                f" (in {_duration(summary['eta'] - now)}),"
+                f" {summary['remaining_core_seconds']/3600:.1f} core-hours left")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise telemetry of running simulations.")
+    parser.add_argument("action", choices=["status", "runs"])
+    parser.add_argument("--run", default=None, help="Run id (default: the latest)")
+    parser.add_argument("--window", type=float, default=60,
+                        help="Minutes of recent history to measure rates over")
+    parser.add_argument("--top", type=int, default=10,
+                        help="How many of the slowest running jobs to list")
+    parser.add_argument("--dir", default=None,
+                        help="Telemetry directory (default: config.TELEMETRY_DIR)")
+    args = parser.parse_args()
+
+    records = read_log(args.dir)
+    if args.action == "runs":
+        for run in runs(records):
+            print(run)
+    elif args.action == "status":
+        if len(records) == 0:
+            raise SystemExit("no telemetry found")
+        summary = summarise(records, run=args.run, window=60*args.window, top=args.top)
+        print_status(summary, 60*args.window)
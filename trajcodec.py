@@ -0,0 +1,252 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides a compression codec made for trajectories. Agents move by at most
+GRAD_DESC_MAX_STEP_SIZE*GRAD_DESC_MULTPL_FACTOR per step, so consecutive frames
+differ very little. The codec stores
+    (1) the first frame, then time-deltas between consecutive frames,
+    (2) optionally quantised to a fixed-point grid of spacing `quantum`
+        (bounded error: at most quantum/2 per coordinate, no drift, plus the
+        rounding of the stored dtype, see max_error(...)), and
+    (3) byte-shuffled, so that the mostly-zero high bytes of the deltas sit
+        together before zlib sees them.
+Without a quantum, deltas are taken between the raw bit patterns of the floats,
+so the round trip is exact.
+
+Run this file to benchmark the codec against the plain gzip path used by
+datapacking.py.
+"""
+
+import argparse
+import time
+import zlib
+
+import numpy as np
+
+CODEC_NAME = "traj-delta"
+CODEC_VERSION = 1
+
+
+def _shuffle(arr):
+    raw = np.ascontiguousarray(arr).view(np.uint8)
+    return raw.reshape(-1, arr.dtype.itemsize).T.copy()
+
+def _unshuffle(raw, dtype):
+    dtype = np.dtype(dtype)
+    return raw.reshape(dtype.itemsize, -1).T.copy().view(dtype).ravel()
+
+def _narrowest_int(values):
+    lo, hi = (values.min(), values.max()) if values.size else (0, 0)
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def encode(data, quantum=None, shuffle=True, level=6):
+    """
+    Compresses a trajectory.
+    Args:
+        data (np.ndarray, n×2×T): float trajectory
+        quantum (float or None): fixed-point grid spacing; None for lossless.
+                    Must not be finer than the resolution of data's dtype.
+        shuffle (bool): whether to byte-shuffle before deflating
+        level (int): zlib level, 0-9
+    Returns:
+        payload (bytes), header (dict, needed by decode(...))
+    """
+    data = np.asarray(data)
+    frames = np.ascontiguousarray(np.transpose(data, (2, 0, 1))) # T×n×2
+
+    if quantum is None:
+        if frames.dtype.itemsize == 8:
+            ints = frames.view(np.int64)
+        elif frames.dtype.itemsize == 4:
+            ints = frames.view(np.int32)
+        else:
+            ints = frames.view(np.int16)
+    else:
+        resolution = _resolution(frames.dtype, np.abs(frames).max(initial=0.0))
+        if quantum < resolution:
+            raise ValueError(f"quantum {quantum} is finer than the resolution of"
+                                f" {frames.dtype.name} here ({resolution:.3g})")
+        # in float64: narrower dtypes overflow or lose precision dividing
+        ints = np.rint(frames.astype(np.float64)/quantum).astype(np.int64)
+
+    first = ints[0].ravel()
+    # integer subtraction wraps around, which decode's cumsum undoes exactly
+    deltas = np.diff(ints, axis=0).ravel()
+    if quantum is not None:
+        deltas = deltas.astype(_narrowest_int(deltas))
+
+    if shuffle:
+        parts = [_shuffle(first).tobytes(), _shuffle(deltas).tobytes()]
+    else:
+        parts = [first.tobytes(), deltas.tobytes()]
+
+    header = dict(codec=CODEC_NAME,
+                    version=CODEC_VERSION,
+                    shape=list(data.shape),
+                    dtype=data.dtype.str,
+                    int_dtype=first.dtype.str,
+                    delta_dtype=deltas.dtype.str,
+                    quantum=-1.0 if quantum is None else float(quantum),
+                    shuffle=bool(shuffle),
+                    first_nbytes=len(parts[0]))
+
+    return zlib.compress(parts[0] + parts[1], level), header
+
+
+def decode(payload, header):
+    """
+    Inverse of encode(...).
+    Args:
+        payload (bytes-like)
+        header (dict-like): as returned by encode(...)
+    Returns:
+        np.ndarray, n×2×T
+    """
+    if header["codec"] != CODEC_NAME:
+        raise ValueError(f"not a {CODEC_NAME} payload: {header['codec']}")
+
+    n, ncoords, num_frames = [int(x) for x in header["shape"]]
+    raw = np.frombuffer(zlib.decompress(bytes(payload)), dtype=np.uint8)
+    first_raw = raw[:int(header["first_nbytes"])]
+    delta_raw = raw[int(header["first_nbytes"]):]
+
+    int_dtype = np.dtype(header["int_dtype"])
+    delta_dtype = np.dtype(header["delta_dtype"])
+    if header["shuffle"]:
+        first = _unshuffle(first_raw, int_dtype)
+        deltas = _unshuffle(delta_raw, delta_dtype)
+    else:
+        first = first_raw.view(int_dtype)
+        deltas = delta_raw.view(delta_dtype)
+
+    ints = np.empty((num_frames, n*ncoords), dtype=int_dtype)
+    ints[0] = first
+    if num_frames > 1:
+        ints[1:] = deltas.reshape(num_frames - 1, n*ncoords)
+    ints = np.cumsum(ints, axis=0, dtype=int_dtype)
+
+    if header["quantum"] < 0:
+        frames = ints.view(np.dtype(header["dtype"]))
+    else:
+        frames = (ints*header["quantum"]).astype(np.dtype(header["dtype"]))
+
+    return np.ascontiguousarray(frames.reshape(num_frames, n, ncoords)
+                                .transpose(1, 2, 0))
+
+
+def _resolution(dtype, magnitude):
+    """
+    Spacing between values of dtype at magnitude.
+    """
+    return float(np.spacing(np.asarray(magnitude, dtype=dtype)))
+
+
+def max_error(quantum, dtype=None, magnitude=1.0):
+    """
+    Largest reconstruction error per coordinate for a given quantum (None or
+    a negative value mean lossless): half the quantum, plus rounding to dtype
+    (if given) for values of up to magnitude.
+    """
+    if quantum is None or quantum < 0:
+        return 0.0
+    if dtype is None:
+        return quantum/2
+    return quantum/2 + _resolution(dtype, magnitude)/2
+
+
+def is_encoded(dataset):
+    """
+    Whether an h5py dataset holds a payload from this codec.
+    """
+    return dataset.attrs.get("codec") == CODEC_NAME
+
+def read_dataset(dataset):
+    """
+    Reads a whole trajectory from an h5py dataset, decoding it if needed.
+    """
+    if is_encoded(dataset):
+        return decode(dataset[()].tobytes(), dataset.attrs)
+    return dataset[()]
+
+
+def _gzip_roundtrip(data, level):
+    # import here to avoid a circular import: datapacking uses this module
+    import datapacking
+    _, chunks = datapacking._compress_chunks(data, level)
+    nbytes = sum(len(payload) for _, payload in chunks)
+    return chunks, nbytes
+
+def benchmark(datasets, quanta=(None, 1e-6, 1e-5), level=6, repeats=3):
+    """
+    Compares this codec with the gzip path used by datapacking.
+    Args:
+        datasets (list of n×2×T arrays)
+        quanta (iterable): quanta to try, None meaning lossless
+    Returns:
+        list of dicts with keys method, ratio, encode_MBps, decode_MBps,
+        max_error
+    """
+    raw_bytes = sum(d.nbytes for d in datasets)
+    results = []
+
+    def _timed(fn):
+        best = float("inf")
+        out = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            out = fn()
+            best = min(best, time.perf_counter() - start)
+        return out, best
+
+    chunks, enc_time = _timed(lambda: [_gzip_roundtrip(d, level) for d in datasets])
+    _, dec_time = _timed(lambda: [[zlib.decompress(p) for _, p in c] for c, _ in chunks])
+    results.append(dict(method=f"gzip-{level}",
+                        ratio=raw_bytes/sum(nb for _, nb in chunks),
+                        encode_MBps=raw_bytes/enc_time/1e6,
+                        decode_MBps=raw_bytes/dec_time/1e6,
+                        max_error=0.0))
+
+    for quantum in quanta:
+        encoded, enc_time = _timed(lambda: [encode(d, quantum=quantum, level=level)\
+                                        for d in datasets])
+        decoded, dec_time = _timed(lambda: [decode(p, h) for p, h in encoded])
+        err = max(np.abs(np.asarray(d) - dd).max() for d, dd in zip(datasets, decoded))
+        results.append(dict(method=f"{CODEC_NAME} q={quantum}",
+                            ratio=raw_bytes/sum(len(p) for p, _ in encoded),
+                            encode_MBps=raw_bytes/enc_time/1e6,
+                            decode_MBps=raw_bytes/dec_time/1e6,
+                            max_error=float(err)))
+
+    return results
+
+
+if __name__ == "__main__":
+    import measurements
+
+    parser = argparse.ArgumentParser(description="Benchmark the trajectory codec against gzip.")
+    parser.add_argument("--pop-size", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--count", type=int, default=20,
+                        help="How many trajectories to benchmark on")
+    parser.add_argument("--level", type=int, default=6, help="zlib level")
+    parser.add_argument("--quanta", type=float, nargs="*", default=[1e-6, 1e-5],
+                        help="Quanta to try in addition to lossless")
+    args = parser.parse_args()
+
+    files = measurements._files_for(args.pop_size, args.depth)[:args.count]
+    if len(files) == 0:
+        raise SystemExit(f"No trajectories found for n={args.pop_size}, d={args.depth}.")
+    datasets = [np.array(measurements._read_data(f)) for f in files]
+
+    print(f"{len(datasets)} trajectories, {sum(d.nbytes for d in datasets)/1e6:.1f} MB raw")
+    print(f"{'method':<24}{'ratio':>8}{'enc MB/s':>11}{'dec MB/s':>11}{'max err':>11}")
+    for res in benchmark(datasets, quanta=[None] + args.quanta, level=args.level):
+        print(f"{res['method']:<24}{res['ratio']:>8.2f}{res['encode_MBps']:>11.1f}"
+                f"{res['decode_MBps']:>11.1f}{res['max_error']:>11.2e}")
@@ -0,0 +1,681 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides trajectory stores: a uniform way to list and read simulated
+trajectories no matter how they are kept on disk. Three stores are available,
+chosen with config.TRAJ_STORE:
+
+    "pickle": the legacy tree of pickled n×2×T arrays under config.DATA
+    "npy":    the same tree, with memory-mappable .npy files (as written by
+              SelfishHerd.savedata) and their .json metadata sidecars; legacy
+              pickles in the tree are still picked up where no .npy exists
+    "hdf5":   the packed archive produced by datapacking.py (config.TRAJ_ARCHIVE)
+
+Keys returned by a store can always be handed back to read(...), which works out
+from the key itself which store it belongs to. Everything read from the npy
+tree or from the archive is lazy: only the frames that are actually indexed are
+brought into memory. (The exception is archives packed with trajcodec, which
+are decoded whole.)
+
+Simulations that recorded only some frames (see SelfishHerd's record argument)
+list the times they kept in their metadata; read(...) then returns a
+DecimatedTrajectory, which is indexed by simulation time as usual.
+"""
+
+import contextlib
+import fnmatch
+import glob
+import hashlib
+import io
+import json
+import os
+import os.path
+from os.path import join as joinpath
+import pickle
+
+import numpy as np
+
+import config
+import trajcodec
+
+EXTENSIONS = (".pkl", ".npy")
+FORMAT_VERSION = 1
+STORAGE_DTYPES = ("float64", "float32", "float16")
+
+
+def checksum(arr):
+    """
+    Content checksum of an array (shape, dtype and values), the same whichever
+    store the array came from.
+    Returns:
+        str: hex sha256 digest
+    """
+    arr = np.ascontiguousarray(arr)
+    hasher = hashlib.sha256(f"{arr.dtype.str}{arr.shape}".encode())
+    hasher.update(arr.data)
+    return hasher.hexdigest()
+
+
+def content_hash(data):
+    """
+    checksum(...) of a trajectory, using the one stored in the archive when
+    there is one, so that the trajectory need not be read.
+    """
+    if isinstance(data, DecimatedTrajectory):
+        times = ",".join(str(t) for t in data.times)
+        return hashlib.sha256((content_hash(data.data) + times).encode()).hexdigest()
+    if isinstance(data, LazyTrajectory) and "sha256" in data.dataset.attrs:
+        return data.dataset.attrs["sha256"]
+    return checksum(data)
+
+
+def storage_dtype(dtype=None):
+    """
+    Checks a dtype to store trajectories with, by default
+    config.TRAJ_STORAGE_DTYPE.
+    Returns:
+        np.dtype
+    """
+    if dtype is None:
+        dtype = config.TRAJ_STORAGE_DTYPE
+    dtype = np.dtype(dtype)
+    if dtype.name not in STORAGE_DTYPES:
+        raise ValueError(f"cannot store trajectories as {dtype}, use one of {STORAGE_DTYPES}")
+    return dtype
+
+
+@contextlib.contextmanager
+def atomic_write(filename, mode="w"):
+    """
+    *CONTEXT MANAGER*
+    Opens a temporary file next to filename to write to, and moves it into
+    place only once it is closed, so that filename is never left half
+    written (e.g., by a worker killed mid-save).
+    """
+    filename = str(filename)
+    tmp = joinpath(os.path.dirname(os.path.abspath(filename)),
+                    f".{os.path.basename(filename)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, mode) as file_obj:
+            yield file_obj
+        os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def save_npy(filename, data, dtype=None):
+    """
+    Saves an n×2×T trajectory as a .npy file. The array is stored time-major
+    (T×n×2) on disk, so that each frame is one contiguous block.
+    Args:
+        filename (str): where to save, should end with .npy
+        data (np.ndarray, n×2×T)
+        dtype: to store data as (see storage_dtype(...)), default data.dtype
+    """
+    frames = np.transpose(data, (2, 0, 1))
+    if dtype is not None:
+        frames = frames.astype(storage_dtype(dtype))
+    with atomic_write(filename, "wb") as file_obj:
+        np.save(file_obj, np.ascontiguousarray(frames))
+
+
+def append_npy(filename, data):
+    """
+    Appends frames to a trajectory saved with save_npy(...), in place: the
+    new frames are written at the end of the file, then the header is updated
+    (in numpy's spare header space, else the file is rewritten, see
+    atomic_write(...)). Either way, a crash part way leaves the old trajectory
+    readable.
+    Args:
+        filename (str)
+        data (np.ndarray, n×2×T'): frames to append, cast to the file's dtype
+    """
+    with open(filename, "r+b") as file_obj:
+        version = np.lib.format.read_magic(file_obj)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file_obj)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file_obj)
+        header_len = file_obj.tell()
+        frames = np.ascontiguousarray(np.transpose(data, (2, 0, 1)), dtype=dtype)
+        if fortran_order or frames.shape[1:] != shape[1:]:
+            raise ValueError(f"cannot append frames of shape {frames.shape[1:]}"
+                                f" to {filename} with frames of shape {shape[1:]}")
+
+        header = io.BytesIO()
+        header_data = dict(descr=np.lib.format.dtype_to_descr(dtype),
+                            fortran_order=False,
+                            shape=(shape[0] + frames.shape[0],) + shape[1:])
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_data)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_data)
+
+        if len(header.getvalue()) == header_len:
+            # data first: until the header changes, the file reads as before
+            file_obj.seek(header_len + int(np.prod(shape))*dtype.itemsize)
+            file_obj.write(frames.data)
+            file_obj.truncate()
+            file_obj.flush()
+            file_obj.seek(0)
+            file_obj.write(header.getvalue())
+            return
+
+    old = np.load(filename)
+    with atomic_write(filename, "wb") as file_obj:
+        np.save(file_obj, np.concatenate([old, frames]))
+
+
+def load_npy(filename):
+    """
+    Memory-maps a trajectory saved with save_npy(...). Nothing is read until
+    frames are indexed, and each frame is a handful of pages.
+    Args:
+        filename (str)
+    Returns:
+        np.memmap view with shape n×2×T
+    """
+    data = np.load(filename, mmap_mode="r")
+    return data.transpose(1, 2, 0)
+
+
+def source_file(data):
+    """
+    The .npy file that data is the whole of, as returned by load_npy(...), or
+    None for anything else (including slices of such an array, and arrays
+    in memory).
+    """
+    if not isinstance(data, np.memmap) or data.filename is None:
+        return None
+    root = data
+    while isinstance(root.base, np.memmap):
+        root = root.base
+    if root.ndim != 3 or data.ndim != 3:
+        return None
+    whole = root.transpose(1, 2, 0)
+    if data.shape != whole.shape or data.strides != whole.strides or\
+            data.__array_interface__["data"][0] != whole.__array_interface__["data"][0]:
+        return None
+    return data.filename
+
+
+def metadata_path(filename):
+    """
+    Path of the .json sidecar that goes with a .npy trajectory.
+    """
+    return os.path.splitext(str(filename))[0] + ".json"
+
+def save_metadata(filename, metadata):
+    """
+    Writes the metadata sidecar for the .npy trajectory at filename.
+    Args:
+        filename (str): path of the .npy file
+        metadata (dict): JSON-serialisable
+    """
+    metadata = dict(metadata, format_version=FORMAT_VERSION, layout="time-major")
+    with atomic_write(metadata_path(filename)) as file_obj:
+        json.dump(metadata, file_obj)
+
+def read_metadata(key):
+    """
+    Metadata (n, depth vector, seed, params, ...) of the trajectory behind key.
+    Returns:
+        dict, or None if the trajectory has none (e.g., legacy pickles)
+    """
+    key = str(key)
+    if key.endswith(PickleStore.extension):
+        return None
+    if key.endswith(NpyStore.extension):
+        if not os.path.exists(metadata_path(key)):
+            return None
+        with open(metadata_path(key)) as file_obj:
+            return json.load(file_obj)
+    return store_for(key).read_metadata(key)
+
+
+def is_saved(filename, n=None, tmax=None):
+    """
+    Whether a complete simulation is saved at filename: for a .npy file, that
+    its sidecar is readable and agrees with the file's shape (and with n, and
+    with having been run to at least tmax, if given). Pickles only need to
+    load.
+    """
+    filename = str(filename)
+    if not os.path.exists(filename):
+        return False
+    try:
+        if filename.endswith(PickleStore.extension):
+            with open(filename, "rb") as file_obj:
+                data = pickle.load(file_obj)
+            return n is None or data.shape[0] == n
+        metadata = read_metadata(filename)
+        shape = np.load(filename, mmap_mode="r").shape
+    except Exception:
+        return False
+    if metadata is None or shape != (metadata["num_frames"], metadata["n"], 2):
+        return False
+    if n is not None and metadata["n"] != n:
+        return False
+    t = metadata.get("state", {}).get("t")
+    if tmax is not None and t is not None and t < tmax:
+        return False
+    return True
+
+
+class LazyTrajectory:
+    """
+    Read-only, n×2×T array-like over an h5py dataset. Indexing reads only the
+    requested frames from the archive; indices along the first two axes are
+    then applied in memory, so things like data[mask, :, t] work as they would
+    on a numpy array.
+    Args:
+        dataset (h5py.Dataset): n×2×T dataset
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.ndim = len(dataset.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _read_frames(self, times):
+        num_frames = self.shape[2]
+        if isinstance(times, (int, np.integer)):
+            if not -num_frames <= times < num_frames:
+                raise IndexError(f"frame {times} out of range for {num_frames} frames")
+            return self.dataset[:, :, int(times) % num_frames]
+
+        if isinstance(times, slice):
+            start, stop, step = times.indices(num_frames)
+            if step > 0:
+                return self.dataset[:, :, start:stop:step]
+            times = np.arange(start, stop, step)
+
+        times = np.asarray(times)
+        if times.dtype == bool:
+            times = np.flatnonzero(times)
+        times = times % num_frames
+        # h5py wants increasing, unique indices
+        uniq, inverse = np.unique(times, return_inverse=True)
+        return self.dataset[:, :, uniq][:, :, inverse]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 3:
+            raise IndexError("too many indices for a trajectory")
+        key = key + (slice(None),)*(3 - len(key))
+
+        inds, coords, times = key
+        frames = self._read_frames(times)
+        if frames.ndim == 2:
+            return frames[inds, coords]
+        return frames[inds, coords, :]
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.dataset[()]
+        if dtype is not None:
+            arr = arr.astype(dtype)
+        return arr
+
+    def copy(self):
+        return np.array(self)
+
+    def __str__(self):
+        return f"LazyTrajectory over {self.dataset.name} with shape {self.shape}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class DecimatedTrajectory:
+    """
+    Read-only, n×2×T array-like over the frames a decimated simulation kept,
+    indexed by simulation time: data[:, :, t] is the frame at time t, and
+    asking for a frame that was not recorded raises an IndexError. T is one
+    more than the last recorded time.
+    Args:
+        data (n×2×k array-like): the recorded frames
+        times (list of int, length k): time of each frame, increasing
+    """
+
+    def __init__(self, data, times):
+        self.data = data
+        self.times = np.asarray(times, dtype=int)
+        self.shape = (data.shape[0], data.shape[1], int(self.times[-1]) + 1)
+        self.dtype = data.dtype
+        self.ndim = 3
+        self._columns = {int(t): col for col, t in enumerate(self.times)}
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _column(self, t):
+        num_frames = self.shape[2]
+        if not -num_frames <= t < num_frames:
+            raise IndexError(f"frame {t} out of range for {num_frames} frames")
+        t = int(t) % num_frames
+        if t not in self._columns:
+            raise IndexError(f"frame {t} was not recorded")
+        return self._columns[t]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 3:
+            raise IndexError("too many indices for a trajectory")
+        key = key + (slice(None),)*(3 - len(key))
+
+        inds, coords, times = key
+        if isinstance(times, (int, np.integer)):
+            return np.asarray(self.data[:, :, self._column(times)])[inds, coords]
+
+        if isinstance(times, slice):
+            times = np.arange(*times.indices(self.shape[2]))
+        times = np.asarray(times)
+        if times.dtype == bool:
+            times = np.flatnonzero(times)
+        cols = [self._column(t) for t in times]
+        return np.asarray(self.data[:, :, cols])[inds, coords, :]
+
+    def __array__(self, dtype=None, copy=None):
+        """
+        The recorded frames only, n×2×k.
+        """
+        arr = np.array(self.data)
+        if dtype is not None:
+            arr = arr.astype(dtype)
+        return arr
+
+    def copy(self):
+        return np.array(self)
+
+    def __str__(self):
+        return f"DecimatedTrajectory with {len(self.times)} of {self.shape[2]} frames"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class PickleStore:
+    """
+    Legacy store: one pickled n×2×T array per simulation, in
+    {root}/{pop_size}/d{depth}/ and {root}/HungerGames/.
+    """
+
+    extension = ".pkl"
+
+    def __init__(self, root=None):
+        if root is None:
+            root = config.DATA
+        self.root = root
+
+    def list(self, subdir, pattern):
+        """
+        Lists keys in subdir (relative to root) whose names match pattern.
+        Args:
+            subdir (str): e.g., "50/d1" or "HungerGames"
+            pattern (str): glob-style pattern without extension,
+                    e.g., "50-1-*"
+        Returns:
+            sorted list of keys
+        """
+        dir_ = joinpath(self.root, subdir)
+        if not os.path.exists(dir_):
+            return []
+        files_ = glob.glob(joinpath(dir_, pattern + self.extension))
+        files_.sort()
+        return files_
+
+    def read(self, key):
+        with open(key, "rb") as file_obj:
+            return pickle.load(file_obj)
+
+    def append(self, key, data, metadata=None):
+        """
+        Appends frames (n×2×T') to the trajectory behind key. Pickles have to
+        be rewritten whole (see atomic_write(...)), and keep no metadata.
+        """
+        old = self.read(key)
+        with atomic_write(key, "wb") as file_obj:
+            pickle.dump(np.concatenate([old, np.asarray(data, dtype=old.dtype)],
+                                        axis=2), file_obj)
+
+
+class NpyStore(PickleStore):
+    """
+    Same layout as PickleStore, but with .npy files written by save_npy(...),
+    which are memory-mapped on reading. Legacy pickles in the same folders are
+    listed too, unless a .npy of the same name exists.
+    """
+
+    extension = ".npy"
+
+    def list(self, subdir, pattern):
+        npys = super().list(subdir, pattern)
+        have = set(stem(key) for key in npys)
+        pkls = PickleStore(self.root).list(subdir, pattern)
+
+        files_ = npys + [key for key in pkls if stem(key) not in have]
+        files_.sort()
+        return files_
+
+    def read(self, key):
+        if str(key).endswith(PickleStore.extension):
+            return super().read(key)
+        return load_npy(key)
+
+    def append(self, key, data, metadata=None):
+        """
+        Appends frames (n×2×T') to the trajectory behind key, in place (see
+        append_npy(...)), and replaces its metadata if given.
+        """
+        if str(key).endswith(PickleStore.extension):
+            return super().append(key, data)
+        append_npy(key, data)
+        if metadata is not None:
+            save_metadata(key, metadata)
+
+
+class HDF5Store:
+    """
+    The packed HDF5 archive written by datapacking.pack_data(...). Population
+    folders live in groups called n_{pop_size}/d{depth}, hunger games in the
+    group HungerGames.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = config.TRAJ_ARCHIVE
+        self.path = path
+        self._file = None
+        self._pid = None
+
+    @property
+    def file(self):
+        # h5py handles do not survive a fork, so open one per process
+        if self._file is None or self._pid != os.getpid():
+            import h5py
+            self._file = h5py.File(self.path, "r")
+            self._pid = os.getpid()
+        return self._file
+
+    @staticmethod
+    def group_for(subdir):
+        parts = subdir.strip("/").split("/")
+        if parts[0].isdigit():
+            parts[0] = "n_" + parts[0]
+        return "/".join(parts)
+
+    def list(self, subdir, pattern):
+        if not os.path.exists(self.path):
+            return []
+        group = self.group_for(subdir)
+        if group not in self.file:
+            return []
+        names = fnmatch.filter(self.file[group].keys(), pattern)
+        names.sort()
+        return [group + "/" + name for name in names]
+
+    def read(self, key):
+        dataset = self.file[key]
+        if trajcodec.is_encoded(dataset):
+            # delta-coded trajectories can only be decoded whole
+            return trajcodec.decode(dataset[()].tobytes(), dataset.attrs)
+        return LazyTrajectory(dataset)
+
+    def read_metadata(self, key):
+        metadata = self.file[key].attrs.get("metadata")
+        if metadata is None:
+            return None
+        return json.loads(metadata)
+
+    def append(self, key, data, metadata=None):
+        """
+        Appends frames (n×2×T') to an archived trajectory, and replaces its
+        metadata if given. Datasets packed with an unlimited time axis grow in
+        place; others (and trajcodec-encoded ones) are rewritten with one.
+        Only one process may append to an archive at a time.
+        """
+        import h5py
+        self.close()
+        with h5py.File(self.path, "a") as file_:
+            dataset = file_[key]
+            attrs = dict(dataset.attrs)
+            if trajcodec.is_encoded(dataset):
+                old = trajcodec.read_dataset(dataset)
+                full = np.concatenate([old, np.asarray(data, dtype=old.dtype)], axis=2)
+                quantum = attrs["quantum"] if attrs["quantum"] >= 0 else None
+                payload, header = trajcodec.encode(full, quantum=quantum,
+                                                    shuffle=attrs["shuffle"])
+                del file_[key]
+                dataset = file_.create_dataset(key,
+                                    data=np.frombuffer(payload, dtype=np.uint8))
+                attrs.update(header)
+            elif dataset.maxshape[2] is None:
+                start = dataset.shape[2]
+                dataset.resize(start + data.shape[2], axis=2)
+                dataset[:, :, start:] = np.asarray(data, dtype=dataset.dtype)
+                full = dataset[()]
+            else:
+                old = dataset[()]
+                full = np.concatenate([old, np.asarray(data, dtype=old.dtype)], axis=2)
+                chunks = dataset.chunks
+                compression, opts = dataset.compression, dataset.compression_opts
+                del file_[key]
+                dataset = file_.create_dataset(key, data=full,
+                                                maxshape=full.shape[:2] + (None,),
+                                                chunks=chunks or True,
+                                                compression=compression,
+                                                compression_opts=opts)
+
+            attrs["sha256"] = checksum(full)
+            if metadata is not None:
+                attrs["metadata"] = json.dumps(metadata)
+            dataset.attrs.update(attrs)
+
+    def close(self):
+        if self._file is not None and self._pid == os.getpid():
+            self._file.close()
+        self._file = None
+
+
+STORES = {
+    "pickle": PickleStore,
+    "npy": NpyStore,
+    "hdf5": HDF5Store,
+}
+
+_open_stores = {}
+
+def get_store(kind=None):
+    """
+    Returns the (shared) store of given kind, by default config.TRAJ_STORE.
+    """
+    if kind is None:
+        kind = config.TRAJ_STORE
+    if kind not in STORES:
+        raise ValueError(f"unknown trajectory store: {kind}")
+    if kind not in _open_stores:
+        _open_stores[kind] = STORES[kind]()
+    return _open_stores[kind]
+
+
+def store_for(key):
+    """
+    Works out from a key which store it came from.
+    """
+    key = str(key)
+    if key.endswith(NpyStore.extension):
+        return get_store("npy")
+    if key.endswith(PickleStore.extension):
+        return get_store("pickle")
+    return get_store("hdf5")
+
+
+def list_trajectories(subdir, pattern):
+    """
+    Lists trajectory keys in the configured store. See PickleStore.list(...).
+    """
+    return get_store().list(subdir, pattern)
+
+
+def read(key):
+    """
+    Reads the trajectory with given key, from whichever store it belongs to.
+    Returns:
+        n×2×T np.ndarray or array-like
+    """
+    data = store_for(key).read(key)
+    metadata = read_metadata(key)
+    if metadata is None or "times" not in metadata:
+        return data
+
+    times = metadata["times"]
+    if len(times) == data.shape[2] and times[-1] == len(times) - 1:
+        return data # every frame was recorded
+    return DecimatedTrajectory(data, times)
+
+
+def append(key, data, metadata=None):
+    """
+    Appends frames (n×2×T') to the trajectory with given key, in whichever
+    store it belongs to, and replaces its metadata if given.
+    """
+    store_for(key).append(str(key), data, metadata=metadata)
+
+
+def signature(key):
+    """
+    A cheap string that changes whenever the trajectory behind key changes:
+    size and modification time for files, the content checksum (or the
+    archive's modification time) for archived trajectories.
+    """
+    key = str(key)
+    if key.endswith(EXTENSIONS):
+        stat = os.stat(key)
+        return f"{key}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    store = store_for(key)
+    checksum = store.file[key].attrs.get("sha256")
+    if checksum is None:
+        checksum = os.stat(store.path).st_mtime_ns
+    return f"{key}:{checksum}"
+
+
+def stem(key):
+    """
+    Name of the simulation behind key, without directories or extension,
+    e.g., "50-1-<uuid>".
+    """
+    name = os.path.basename(str(key))
+    for ext in EXTENSIONS:
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
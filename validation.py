@@ -0,0 +1,269 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides checks that shortcuts in how trajectories are produced or stored do
+not change what the analyses find.
+
+"precision": re-computes the metrics the paper relies on (typical group size
+at eps=0.02, log Voronoi areas, polarisation) from trajectories stored at a
+reduced precision (see config.TRAJ_STORAGE_DTYPE), and compares them with the
+float64 originals.
+
+"neighbourhood": steps herds of up to 100 agents with exact anticipation and
+with anticipation truncated to each agent's neighbourhood
+(config.ANTICIPATION_NEIGHBOURHOOD), from the same configurations and random
+draws, and reports how far their decisions diverge and how much faster the
+truncated version is.
+
+"linear": the same comparison for movement.linearised_reasoning, over the
+standard grid of population sizes and depths.
+
+Run this file with an action and options, e.g.,
+    python3 validation.py precision --dtype float32 --pop-size 50 --depth 1
+It exits with a non-zero status if a check fails.
+"""
+
+import argparse
+import functools
+import random
+import time
+
+import numpy as np
+
+import measurements
+import movement
+import trajstore
+import voronoi
+
+# largest acceptable change in each metric
+PRECISION_TOLERANCES = {
+    "tgs": 0.01,           # mean absolute change in typical group size
+    "log-area": 1e-3,      # largest absolute change in any log area
+    "polarisation": 0.01,  # mean absolute change in mean polarisation
+}
+
+NEIGHBOURHOOD_POP_SIZES = [25, 50, 100]
+NEIGHBOURHOOD_DEPTHS = [0, 1, 2]
+NEIGHBOURHOOD_TOLERANCE = 1e-3 # largest acceptable difference in a decision
+LINEAR_POP_SIZES = [10, 25, 50, 100]
+LINEAR_DEPTHS = [0, 1, 2, 3]
+LINEAR_TOLERANCE = 1e-3 # acceptable difference in a decision, on average
+SEED = 42
+
+
+def _precision_metrics(data, eps):
+    timerange = range(0, data.shape[2], 20)
+    dbscan_fn = functools.partial(measurements.dbscan, eps=eps)
+    polarisations = measurements.extract_polarisations_exclude_edge(data,
+                        T_REL_MIN=0, T_REL_MAX=data.shape[2] - 1,
+                        dbscan_fn=dbscan_fn)
+
+    return dict(tgs=np.array(measurements.gen_row_of_g_sizes(data, timerange, eps=eps)),
+                log_area=np.array(measurements.extract_log_voronoi_areas(data,
+                                    T_REL_MIN=0, T_REL_MAX=data.shape[2] - 1)),
+                polarisation=np.mean(polarisations) if len(polarisations) > 0 else np.nan)
+
+
+def precision_report(files, dtype, eps=0.02, tolerances=None):
+    """
+    Compares metrics computed from trajectories as stored with metrics
+    computed from the same trajectories cast to dtype.
+    Args:
+        files (list): trajectory keys, see trajstore.py
+        dtype (str): reduced storage dtype, e.g., "float32"
+        eps (float): DBSCAN threshold for group sizes and polarisation
+        tolerances (dict): default PRECISION_TOLERANCES
+    Returns:
+        dict mapping metric to dict with keys mean_abs_diff, max_abs_diff,
+        tolerance and ok
+    """
+    dtype = trajstore.storage_dtype(dtype)
+    if tolerances is None:
+        tolerances = PRECISION_TOLERANCES
+
+    diffs = {"tgs": [], "log-area": [], "polarisation": []}
+    for file_ in files:
+        data = trajstore.read(file_)
+        if isinstance(data, trajstore.DecimatedTrajectory):
+            print(f"skipping {file_}: not every frame was recorded")
+            continue
+        data = np.asarray(data, dtype=np.float64)
+        reference = _precision_metrics(data, eps)
+        reduced = _precision_metrics(data.astype(dtype), eps)
+
+        diffs["tgs"].extend(np.abs(reference["tgs"] - reduced["tgs"]))
+        diffs["log-area"].extend(np.abs(reference["log_area"] - reduced["log_area"]))
+        if not np.isnan(reference["polarisation"]):
+            diffs["polarisation"].append(abs(reference["polarisation"]
+                                                - reduced["polarisation"]))
+
+    report = {}
+    for metric, values in diffs.items():
+        values = np.array(values, dtype=float)
+        mean_diff = values.mean() if values.size else 0.0
+        max_diff = values.max() if values.size else 0.0
+        checked = max_diff if metric == "log-area" else mean_diff
+        report[metric] = dict(mean_abs_diff=float(mean_diff),
+                                max_abs_diff=float(max_diff),
+                                tolerance=tolerances[metric],
+                                ok=bool(checked <= tolerances[metric]))
+    return report
+
+
+def compare_decisions(approx, pop_sizes, depths, steps=10, seed=SEED):
+    """
+    Compares an approximate way of deciding moves with exact anticipation
+    (movement.recursive_reasoning), one step at a time along the exact
+    trajectory, with the same random draws for both.
+    Args:
+        approx (callable): approx(locations, vor, depth) -> new locations
+        steps (int): steps per (n, depth)
+    Returns:
+        list of dicts with keys n, depth, max_error, mean_error (largest
+        coordinate difference between the two decisions, over all agents
+        and on average per agent), mean_step (the same for the exact move
+        itself) and speedup
+    """
+    rows = []
+    for n in pop_sizes:
+        for depth in depths:
+            locs = np.random.default_rng(seed).uniform(0.01, 0.99, size=(n, 2))
+            random.seed(seed)
+            errors, moves = [], []
+            exact_time, approx_time = 0.0, 0.0
+            for _ in range(steps):
+                vor = voronoi.get_bounded_voronoi(locs)
+                state = random.getstate()
+
+                start = time.perf_counter()
+                exact = movement.recursive_reasoning(locs, vor, depth, locs)
+                exact_time += time.perf_counter() - start
+
+                random.setstate(state)
+                start = time.perf_counter()
+                approximate = approx(locs, vor, depth)
+                approx_time += time.perf_counter() - start
+
+                errors.append(np.abs(exact - approximate).max(axis=1))
+                moves.append(np.abs(exact - locs).max(axis=1))
+                locs = exact
+
+            rows.append(dict(n=n, depth=depth,
+                                max_error=float(np.max(errors)),
+                                mean_error=float(np.mean(errors)),
+                                mean_step=float(np.mean(moves)),
+                                speedup=exact_time/approx_time))
+    return rows
+
+
+def neighbourhood_report(neighbourhood, pop_sizes=None, depths=None, steps=10,
+                            seed=SEED, tolerance=NEIGHBOURHOOD_TOLERANCE):
+    """
+    Compares exact and neighbourhood-truncated anticipation, see
+    compare_decisions(...).
+    Args:
+        neighbourhood (tuple): ("hops", k) or ("radius", r)
+    Returns:
+        rows as from compare_decisions(...), with ok: whether the largest
+        error is within tolerance
+    """
+    if pop_sizes is None:
+        pop_sizes = NEIGHBOURHOOD_POP_SIZES
+    if depths is None:
+        depths = NEIGHBOURHOOD_DEPTHS
+
+    def _truncated(locs, vor, depth):
+        neighbours = voronoi.neighbourhoods(locs, vor, *neighbourhood)
+        return movement.recursive_reasoning(locs, vor, depth, locs,
+                                            neighbours=neighbours)
+
+    rows = compare_decisions(_truncated, pop_sizes, depths, steps=steps, seed=seed)
+    for row in rows:
+        row["ok"] = row["max_error"] <= tolerance
+    return rows
+
+
+def linear_report(pop_sizes=None, depths=None, steps=10, seed=SEED,
+                    tolerance=LINEAR_TOLERANCE):
+    """
+    Compares exact anticipation with movement.linearised_reasoning, see
+    compare_decisions(...).
+    Returns:
+        rows as from compare_decisions(...), with ok: whether the mean error
+        is within tolerance
+    """
+    if pop_sizes is None:
+        pop_sizes = LINEAR_POP_SIZES
+    if depths is None:
+        depths = LINEAR_DEPTHS
+
+    rows = compare_decisions(movement.linearised_reasoning, pop_sizes, depths,
+                                steps=steps, seed=seed)
+    for row in rows:
+        row["ok"] = row["mean_error"] <= tolerance
+    return rows
+
+
+def _print_decision_rows(rows):
+    print(f"{'n':>5}{'depth':>7}{'max err':>11}{'mean err':>11}{'mean step':>11}"
+            f"{'speedup':>9}  ok")
+    for row in rows:
+        print(f"{row['n']:>5}{row['depth']:>7}{row['max_error']:>11.2e}"
+                f"{row['mean_error']:>11.2e}{row['mean_step']:>11.2e}"
+                f"{row['speedup']:>8.1f}x  {'yes' if row['ok'] else 'NO'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that storage and simulation shortcuts keep results intact.")
+    parser.add_argument("action", choices=["precision", "neighbourhood", "linear"])
+    parser.add_argument("--dtype", choices=trajstore.STORAGE_DTYPES[1:], default="float32",
+                        help="With precision, the reduced dtype to check")
+    parser.add_argument("--pop-size", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--count", type=int, default=20,
+                        help="How many trajectories to check")
+    parser.add_argument("--eps", type=float, default=0.02,
+                        help="DBSCAN threshold for group metrics")
+    parser.add_argument("--kind", choices=voronoi.NEIGHBOURHOOD_KINDS, default="hops",
+                        help="With neighbourhood, how neighbourhoods are drawn")
+    parser.add_argument("--size", type=float, default=2,
+                        help="With neighbourhood, number of hops or radius")
+    parser.add_argument("--pop-sizes", type=int, nargs="*", default=None,
+                        help="With neighbourhood or linear, population sizes to check")
+    parser.add_argument("--depths", type=int, nargs="*", default=None,
+                        help="With neighbourhood or linear, depths to check")
+    parser.add_argument("--steps", type=int, default=10,
+                        help="With neighbourhood or linear, steps per configuration")
+    args = parser.parse_args()
+
+    if args.action == "precision":
+        files = measurements._files_for(args.pop_size, args.depth)[:args.count]
+        if len(files) == 0:
+            raise SystemExit(f"No trajectories found for n={args.pop_size}, d={args.depth}.")
+
+        report = precision_report(files, args.dtype, eps=args.eps)
+        print(f"{len(files)} trajectories, float64 vs {args.dtype}")
+        print(f"{'metric':<14}{'mean diff':>12}{'max diff':>12}{'tolerance':>12}  ok")
+        for metric, res in report.items():
+            print(f"{metric:<14}{res['mean_abs_diff']:>12.2e}{res['max_abs_diff']:>12.2e}"
+                    f"{res['tolerance']:>12.2e}  {'yes' if res['ok'] else 'NO'}")
+        if not all(res["ok"] for res in report.values()):
+            raise SystemExit(1)
+
+    elif args.action == "neighbourhood":
+        size = int(args.size) if args.kind == "hops" else args.size
+        rows = neighbourhood_report((args.kind, size), args.pop_sizes,
+                                    args.depths, steps=args.steps)
+        print(f"exact vs {args.kind}={size}, {args.steps} steps each")
+        _print_decision_rows(rows)
+        if not all(row["ok"] for row in rows):
+            raise SystemExit(1)
+
+    elif args.action == "linear":
+        rows = linear_report(args.pop_sizes, args.depths, steps=args.steps)
+        print(f"exact vs linearised anticipation, {args.steps} steps each")
+        _print_decision_rows(rows)
+        if not all(row["ok"] for row in rows):
+            raise SystemExit(1)
@@ -4,12 +4,18 @@
 
 """
 Provides methods to construct Voronoi polygons for groups of simulated animals
-and compute their areas.
+and compute their areas. Tessellations that the simulation would otherwise
+build twice are kept in a small cache, see TessellationCache.
 """
 
+from collections import OrderedDict
+
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.spatial import Voronoi, voronoi_plot_2d
+import scipy.sparse
+from scipy.spatial import cKDTree, Voronoi, voronoi_plot_2d
+
+import config
 
 
 def polygon_area(vertices):
@@ -98,6 +104,228 @@ def get_areas(locations, voronoi):
         poly_areas.append(polygon_area(polygon))
         curr_loc += 1
 
+
+def get_cell_voronoi(locations, index):
+    """
+    Like get_bounded_voronoi(...), but only bounds the cell of one point: the
+    real points are tessellated with just that point's four mirror images.
+    That is all its cell needs, since anywhere in the unit square is nearer
+    to a point than to the point's mirror image. Other cells may come out
+    unbounded.
+    Args:
+        locations (np.ndarray, n×2)
+        index (int): the point whose cell is wanted
+    Returns:
+        scipy.spatial._qhull.Voronoi
+    """
+    return Voronoi(np.vstack((locations, _mirror_unit_sq(locations[index:index+1]))))
+
+def cell_area(voronoi, index):
+    """
+    Area of one REAL point's polygon, as in get_areas(...), without computing
+    the others.
+    Args:
+        voronoi: output from get_bounded_voronoi(...) or get_cell_voronoi(...)
+        index (int)
+    Returns:
+        float
+    Raises:
+        ValueError (if the polygon is infinite)
+    """
+    region = voronoi.regions[voronoi.point_region[index]]
+    if -1 in region:
+        raise ValueError("somehow encountered an infinite Voronoi polygon!")
+    return polygon_area(voronoi.vertices[region])
+
+
+def area_gradients(locations, voronoi):
+    """
+    Exact gradient of each REAL point's cell area with respect to its own
+    position: the sum over its Voronoi edges of L*(m - x)/d, where L is the
+    edge length, m the edge midpoint, x the point and d its distance to the
+    neighbour across the edge. Edges with the point's own mirror image sit on
+    the square's boundary, which does not move, so they are left out.
+    Args:
+        locations (np.ndarray, n×2)
+        voronoi: output from get_bounded_voronoi(locations)
+    Returns:
+        np.ndarray, n×2
+    """
+    num_loc = locations.shape[0]
+    points = voronoi.points
+    ridge_points = voronoi.ridge_points
+    ridge_vertices = np.array(voronoi.ridge_vertices)
+    finite = (ridge_vertices >= 0).all(axis=1)
+    ridge_points, ridge_vertices = ridge_points[finite], ridge_vertices[finite]
+
+    v0 = voronoi.vertices[ridge_vertices[:, 0]]
+    v1 = voronoi.vertices[ridge_vertices[:, 1]]
+    lengths = np.linalg.norm(v1 - v0, axis=1)
+    midpoints = (v0 + v1)/2
+
+    grads = np.zeros((num_loc, 2))
+    for me, other in ((ridge_points[:, 0], ridge_points[:, 1]),
+                        (ridge_points[:, 1], ridge_points[:, 0])):
+        keep = (me < num_loc) & (other % num_loc != me)
+        me, other = me[keep], other[keep]
+        dists = np.linalg.norm(points[other] - points[me], axis=1)
+        contrib = (lengths[keep]/dists)[:, np.newaxis]*(midpoints[keep] - points[me])
+        np.add.at(grads, me, contrib)
+    return grads
+
+
+# Neighbourhoods, for anticipating with only nearby agents (see
+# movement.capped_grad)
+
+NEIGHBOURHOOD_KINDS = ("hops", "radius")
+
+def delaunay_graph(voronoi, num_loc):
+    """
+    Delaunay adjacency among the real points of a bounded tessellation, where
+    a mirrored point counts as its original.
+    Args:
+        voronoi: output from get_bounded_voronoi(...)
+        num_loc (int): number of real points
+    Returns:
+        scipy.sparse.csr_matrix (num_loc×num_loc), 1 where points are adjacent
+    """
+    pairs = voronoi.ridge_points % num_loc
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    ones = np.ones(len(pairs), dtype=np.int32)
+    adjacency = scipy.sparse.csr_matrix((ones, (pairs[:, 0], pairs[:, 1])),
+                                        shape=(num_loc, num_loc))
+    adjacency = ((adjacency + adjacency.T) > 0).astype(np.int32)
+    return adjacency
+
+def neighbourhoods(locations, voronoi, kind, size):
+    """
+    For each point, the points near enough to matter for its cell.
+    Args:
+        locations (np.ndarray, n×2)
+        voronoi: output from get_bounded_voronoi(locations), used for "hops"
+        kind (str): "hops" for the size-hop Delaunay neighbourhood, "radius"
+                    for every point within distance size
+        size (int or float): number of hops, or radius
+    Returns:
+        list of n sorted index arrays, each including the point itself
+    """
+    num_loc = locations.shape[0]
+    if kind == "radius":
+        tree = cKDTree(locations)
+        return [np.array(sorted(nbrs)) for nbrs in\
+                    tree.query_ball_point(locations, size)]
+    if kind != "hops":
+        raise ValueError(f"unknown neighbourhood kind: {kind}")
+
+    adjacency = delaunay_graph(voronoi, num_loc)
+    reach = scipy.sparse.identity(num_loc, dtype=np.int32, format="csr")
+    for _ in range(int(size)):
+        reach = ((reach + reach @ adjacency) > 0).astype(np.int32)
+    reach.sort_indices()
+    return [reach.indices[reach.indptr[i]:reach.indptr[i+1]].copy()\
+                for i in range(num_loc)]
+
+
+class TessellationCache:
+    """
+    Least-recently-used cache of bounded tessellations, and their areas, keyed
+    by the contents of the locations array. Cached areas are read-only.
+    Args:
+        maxsize (int): number of configurations to keep; 0 disables caching
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(locations):
+        locations = np.ascontiguousarray(locations)
+        return (locations.shape, locations.dtype.str, locations.tobytes())
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def _insert(self, key, entry):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = entry
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def voronoi(self, locations):
+        """
+        Same as get_bounded_voronoi(locations).
+        """
+        key = self.key(locations)
+        entry = self._lookup(key)
+        if entry is None:
+            entry = [get_bounded_voronoi(locations), None]
+            self._insert(key, entry)
+        return entry[0]
+
+    def areas(self, locations, vor):
+        """
+        Same as get_areas(locations, vor), where vor is the tessellation of
+        locations.
+        """
+        key = self.key(locations)
+        entry = self._lookup(key)
+        if entry is not None and entry[1] is not None:
+            return entry[1]
+
+        areas = get_areas(locations, vor)
+        areas.flags.writeable = False
+        if entry is None:
+            self._insert(key, [vor, areas])
+        else:
+            entry[1] = areas
+        return areas
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    size=len(self.entries), maxsize=self.maxsize)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+_cache = TessellationCache(config.TESSELLATION_CACHE_SIZE)
+
+def cached_voronoi(locations):
+    """
+    get_bounded_voronoi(...), reusing the tessellation of an identical
+    configuration if one was built recently.
+    """
+    return _cache.voronoi(locations)
+
+def cached_areas(locations, vor):
+    """
+    get_areas(...), reusing areas already computed for an identical
+    configuration. The array returned is read-only.
+    """
+    return _cache.areas(locations, vor)
+
+def cache_info():
+    """
+    Returns:
+        dict with keys hits, misses, size and maxsize
+    """
+    return _cache.info()
+
+def clear_cache():
+    _cache.clear()
+
 if __name__ == "__main__":
     locs = np.random.uniform(size=(10, 2))
 
@@ -0,0 +1,355 @@
+# Pranav Minasandra
+# pminasandra.github.io
+# Oct 19, 2026
+
+"""
+Provides a single-writer result pipeline (config.RESULT_PIPELINE = "writer").
+Instead of every worker saving its own file onto the shared filesystem,
+workers copy finished trajectories into shared-memory blocks and hand a small
+descriptor (block name, shape, dtype, metadata) to one writer process; the
+arrays themselves are never pickled. The writer appends trajectories in
+batches to the packed archive (config.TRAJ_ARCHIVE, in the same layout and
+format as datapacking.py's), then records each one in a manifest
+(config.WRITER_MANIFEST, one JSON line per trajectory), and only then frees
+its block.
+
+The queue of descriptors is bounded (config.WRITER_QUEUE_SIZE): when the disk
+falls behind, workers wait in submit(...) instead of piling up trajectories in
+memory. At most WRITER_QUEUE_SIZE + WRITER_BATCH_SIZE + (one per worker)
+trajectories are held in shared memory at any time.
+
+    with writer.ResultWriter() as result_writer:
+        with mp.Pool(initializer=writer.init_worker,
+                        initargs=(result_writer.queue, result_writer.failed)) as pool:
+            ...  # workers call writer.submit(filename, records, metadata)
+
+A trajectory that cannot be written to the archive is saved as a .npy file
+at its usual filename instead, and marked so in the manifest. The archive is
+not safe to read (e.g., by analyses with TRAJ_STORE = "hdf5") while the
+writer runs.
+"""
+
+import datetime as dt
+import json
+import multiprocessing as mp
+from multiprocessing import connection as mp_connection
+from multiprocessing import resource_tracker, shared_memory
+import os
+import os.path
+import queue as queue_module
+import threading
+
+import h5py
+import numpy as np
+
+import config
+import datapacking
+import trajstore
+
+PUT_TIMEOUT = 5.0 # seconds between checks that the writer is still alive
+
+_queue = None # set in pool workers by init_worker(...)
+_failed = None
+
+
+def key_for(filename):
+    """
+    The archive group and dataset name a trajectory saved at filename (under
+    config.DATA) gets, as datapacking.py would pack it.
+    """
+    subdir = os.path.relpath(os.path.dirname(os.path.abspath(filename)), config.DATA)
+    return trajstore.HDF5Store.group_for(subdir), trajstore.stem(filename)
+
+
+def init_worker(queue, failed=None):
+    """
+    Pool initializer: lets submit(...) in this worker reach the writer.
+    Args:
+        queue, failed: ResultWriter.queue and ResultWriter.failed
+    """
+    global _queue, _failed
+    _queue = queue
+    _failed = failed
+
+
+def _put(queue, item, writer_died):
+    """
+    queue.put(item), waiting while the queue is full, but raising
+    RuntimeError instead of waiting forever once writer_died() is true.
+    """
+    while True:
+        if writer_died():
+            raise RuntimeError("the result writer has stopped")
+        try:
+            queue.put(item, timeout=PUT_TIMEOUT)
+            return
+        except queue_module.Full:
+            continue
+
+
+def is_active():
+    """
+    Whether this process can hand trajectories to a writer.
+    """
+    return _queue is not None
+
+
+def submit(filename, records, metadata=None, dtype=None, queue=None, failed=None):
+    """
+    Copies records into a shared-memory block and queues it for the writer,
+    waiting while the queue is full. Raises RuntimeError if the writer has
+    stopped.
+    Args:
+        filename (str): where the trajectory would have been saved, which
+                    decides where it goes in the archive (see key_for(...))
+        records (np.ndarray, n×2×T)
+        metadata (dict): saved with the trajectory
+        dtype: to store records as, default config.TRAJ_STORAGE_DTYPE
+        queue: the writer's queue, default the one given to init_worker(...)
+        failed: the writer's ResultWriter.failed, default the one given to
+                    init_worker(...)
+    """
+    if queue is None:
+        queue = _queue
+    if failed is None:
+        failed = _failed
+    if queue is None:
+        raise RuntimeError("no writer to submit to, see writer.init_worker")
+
+    records = np.asarray(records, dtype=trajstore.storage_dtype(dtype))
+    block = _untracked_block(max(1, records.nbytes))
+    np.ndarray(records.shape, dtype=records.dtype, buffer=block.buf)[...] = records
+    group, name = key_for(filename)
+    descriptor = dict(block=block.name, shape=records.shape, dtype=records.dtype.str,
+                        group=group, name=name, filename=str(filename),
+                        metadata=metadata)
+    block.close() # the writer unlinks it
+    try:
+        _put(queue, descriptor, lambda: failed is not None and failed.is_set())
+    except RuntimeError:
+        _unlink(descriptor["block"])
+        raise
+
+
+def _unlink(name):
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def _untracked_block(size):
+    """
+    A new shared-memory block owned by the writer, which unlinks it. It must
+    not be tracked in this process: a worker's resource tracker unlinks the
+    blocks it tracks once the worker exits, possibly before they are written.
+    """
+    try:
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+    except TypeError: # Python < 3.13 always tracks
+        block = shared_memory.SharedMemory(create=True, size=size)
+        resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+
+def _write_batch(batch, archive, manifest, level):
+    """
+    Writes a batch of descriptors to the archive, then the manifest, then
+    frees their shared memory.
+    """
+    blocks, entries = [], []
+    outfile = None
+    try:
+        outfile = h5py.File(archive, "a")
+    except OSError as e:
+        print(f"writer: cannot open {archive}: {e}")
+
+    for descriptor in batch:
+        block = shared_memory.SharedMemory(name=descriptor["block"])
+        blocks.append(block)
+        arr = np.ndarray(descriptor["shape"], dtype=np.dtype(descriptor["dtype"]),
+                            buffer=block.buf)
+        digest = trajstore.checksum(arr)
+        metadata = descriptor["metadata"] or {}
+        entry = dict(key=f"{descriptor['group']}/{descriptor['name']}",
+                        source=os.path.basename(descriptor["filename"]),
+                        shape=list(arr.shape), dtype=arr.dtype.name, sha256=digest,
+                        # what main.py needs to resume a batch of runs
+                        seed=metadata.get("seed"),
+                        init_locs=metadata.get("init_locs"),
+                        written=dt.datetime.now().isoformat(timespec="seconds"))
+        try:
+            if outfile is None:
+                raise OSError("archive not open")
+            chunk_shape, chunks = datapacking._compress_chunks(arr, level)
+            datapacking._write_packed(outfile,
+                        dict(group=descriptor["group"], name=descriptor["name"],
+                                src=descriptor["filename"], shape=arr.shape,
+                                dtype=arr.dtype.str, sha256=digest, codec="gzip",
+                                chunk_shape=chunk_shape, chunks=chunks,
+                                metadata=descriptor["metadata"]),
+                        level)
+        except Exception as e:
+            # keep the data: save it the way the worker would have
+            print(f"writer: could not archive {entry['key']} ({e}),"
+                    f" saving {descriptor['filename']}")
+            os.makedirs(os.path.dirname(os.path.abspath(descriptor["filename"])),
+                        exist_ok=True)
+            trajstore.save_npy(descriptor["filename"], arr)
+            if descriptor["metadata"] is not None:
+                trajstore.save_metadata(descriptor["filename"],
+                                        dict(descriptor["metadata"], dtype=arr.dtype.name))
+            entry.update(key=None, file=descriptor["filename"], error=str(e))
+        del arr
+        entries.append(entry)
+
+    if outfile is not None:
+        outfile.flush()
+        outfile.close()
+
+    with open(manifest, "a") as file_obj:
+        for entry in entries:
+            file_obj.write(json.dumps(entry) + "\n")
+        file_obj.flush()
+        os.fsync(file_obj.fileno())
+
+    for block in blocks:
+        block.close()
+        block.unlink()
+    return entries
+
+
+def _writer_loop(queue, archive, manifest, batch_size, level):
+    """
+    Runs in the writer process until it gets None.
+    """
+    finished = False
+    while not finished:
+        batch = [queue.get()]
+        while len(batch) < batch_size and batch[-1] is not None:
+            try:
+                batch.append(queue.get(timeout=0.1))
+            except queue_module.Empty:
+                break
+        if batch[-1] is None:
+            finished = True
+            batch = batch[:-1]
+        if len(batch) > 0:
+            _write_batch(batch, archive, manifest, level)
+
+
+class ResultWriter:
+    """
+    *CONTEXT MANAGER*
+    Starts the writer process on entering (or start()), and on leaving (or
+    close()) waits for it to write everything submitted. If the writer
+    process dies early, self.failed is set, and workers waiting to submit (or
+    close()) raise RuntimeError instead of waiting forever.
+    Args:
+        archive (str): default config.TRAJ_ARCHIVE
+        manifest (str): default config.WRITER_MANIFEST
+        queue_size (int): trajectories that may wait to be written,
+                    default config.WRITER_QUEUE_SIZE
+        batch_size (int): trajectories written per opening of the archive,
+                    default config.WRITER_BATCH_SIZE
+        level (int): gzip level, as in datapacking.py
+    """
+
+    def __init__(self, archive=None, manifest=None, queue_size=None,
+                    batch_size=None, level=4):
+        self.archive = config.TRAJ_ARCHIVE if archive is None else archive
+        self.manifest = config.WRITER_MANIFEST if manifest is None else manifest
+        self.queue_size = config.WRITER_QUEUE_SIZE if queue_size is None else queue_size
+        self.batch_size = config.WRITER_BATCH_SIZE if batch_size is None else batch_size
+        self.level = level
+        self.queue = None
+        self.failed = None
+        self.process = None
+        self._closing = False
+
+    def start(self):
+        """
+        Starts the writer process, and a thread that sets self.failed if it
+        stops before close().
+        """
+        self.queue = mp.Queue(maxsize=self.queue_size)
+        self.failed = mp.Event()
+        self.process = mp.Process(target=_writer_loop,
+                                    args=(self.queue, self.archive, self.manifest,
+                                            self.batch_size, self.level),
+                                    name="result-writer")
+        self.process.start()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def _watch(self):
+        mp_connection.wait([self.process.sentinel])
+        if not self._closing:
+            self.failed.set()
+
+    def _stop(self):
+        """
+        Asks the writer to finish, and waits for it. If it has died, frees
+        the shared memory of whatever it left in the queue.
+        """
+        self._closing = True
+        try:
+            _put(self.queue, None, lambda: not self.process.is_alive())
+        except RuntimeError:
+            pass
+        self.process.join()
+        if self.process.exitcode != 0:
+            self.failed.set()
+            while True:
+                try:
+                    descriptor = self.queue.get(timeout=0.1)
+                except queue_module.Empty:
+                    break
+                if descriptor is not None:
+                    _unlink(descriptor["block"])
+
+    def close(self):
+        """
+        Waits for everything submitted to be written, and stops the writer.
+        """
+        self._stop()
+        if self.process.exitcode != 0:
+            raise RuntimeError(f"result writer exited with code {self.process.exitcode}")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._stop()
+
+
+def archived(group, manifest=None):
+    """
+    Trajectories the writer has put in one group of the archive, e.g.,
+    "n_25/d0", by the manifest (the latest entry for each).
+    Returns:
+        list of dicts, see _write_batch(...)
+    """
+    entries = {}
+    for entry in read_manifest(manifest):
+        if entry.get("key") is not None and entry["key"].startswith(group + "/"):
+            entries[entry["key"]] = entry
+    return list(entries.values())
+
+
+def read_manifest(manifest=None):
+    """
+    Returns:
+        list of dicts, one per trajectory written (see _write_batch(...))
+    """
+    if manifest is None:
+        manifest = config.WRITER_MANIFEST
+    if not os.path.exists(manifest):
+        return []
+    with open(manifest) as file_obj:
+        return [json.loads(line) for line in file_obj if line.strip()]